@@ -0,0 +1,85 @@
+#!../env.py
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+#
+
+
+import testframework as t
+from testframework import granularity as g
+
+
+# it doesn't make sense to run in local directory, the tests run on
+# both pmem and non-pmem filesystems
+@t.require_build('debug')
+@g.require_granularity(g.PAGE, g.CACHELINE, g.BYTE)
+class PMREORDER_SIMPLE(t.Test):
+    test_type = t.Medium
+    expect_failure = False
+
+    def run(self, ctx):
+        testfile = ctx.create_holey_file(4 * t.MiB, 'testfile')
+
+        # all tests running the same workload share its store log
+        ctx.pmreorder.create_store_log(ctx, testfile, 'pmreorder_simple',
+                                       self.workload, testfile)
+        if self.expect_failure:
+            ctx.pmreorder.expect_failure(ctx, 'pmreorder_simple', 'c')
+        else:
+            ctx.pmreorder.expect_success(ctx, 'pmreorder_simple', 'c')
+
+
+@t.require_pmreorder(('NoReorderNoCheck', 'pmreorder0.conf'))
+class TEST0(PMREORDER_SIMPLE):
+    workload = 'b'
+    expect_failure = True
+
+
+@t.require_pmreorder(('NoReorderDoCheck',
+                      'PMREORDER_MARKER_CHANGE=ReorderFull'))
+class TEST1(PMREORDER_SIMPLE):
+    workload = 'g'
+
+
+@t.require_pmreorder(('NoReorderNoCheck', 'pmreorder2.conf'))
+class TEST2(PMREORDER_SIMPLE):
+    workload = 'b'
+
+
+@t.require_pmreorder(('ReorderFull', 'pmreorder3.conf'))
+class TEST3(PMREORDER_SIMPLE):
+    workload = 'b'
+    expect_failure = True
+
+
+@t.require_pmreorder(('ReorderFull', 'pmreorder4.conf'))
+class TEST4(PMREORDER_SIMPLE):
+    workload = 'g'
+
+
+@t.require_pmreorder(('ReorderFull', 'pmreorder5.conf'))
+class TEST5(PMREORDER_SIMPLE):
+    workload = 'm'
+
+    def run(self, ctx):
+        ctx.env['PMREORDER_EMIT_LOG'] = '1'
+        super().run(ctx)
+
+
+@t.require_pmreorder(('NoReorderNoCheck', 'pmreorder6.conf'))
+class TEST6(PMREORDER_SIMPLE):
+    workload = 'b'
+    expect_failure = True
+
+
+@t.require_pmreorder(('NoReorderNoCheck', 'pmreorder7.conf'))
+class TEST7(PMREORDER_SIMPLE):
+    workload = 'b'
+    expect_failure = True
+
+
+@t.require_pmreorder('NoReorderDoCheck', 'ReorderAccumulative',
+                     'ReorderReverseAccumulative', 'ReorderMissing(k=1)')
+class TEST8(PMREORDER_SIMPLE):
+    """consistent workload checked with the engines applied to all stores"""
+    workload = 'g'
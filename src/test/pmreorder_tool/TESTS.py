@@ -0,0 +1,139 @@
+#!../env.py
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+#
+
+
+import importlib.util
+import subprocess as sp
+import sys
+from os import path
+
+import testframework as t
+from testframework import futils
+from testframework import granularity as g
+
+
+@t.require_build('debug')
+@g.require_granularity(g.ANY)
+class PMREORDER_TOOL(t.Test):
+    test_type = t.Medium
+
+    def run(self, ctx):
+        # the pmreorder modules clash with the ones of the framework, they
+        # are checked in a separate interpreter
+        cmd = [sys.executable, path.join(ctx.cwd, 'pmreorder_tool.py'),
+               path.dirname(t.PMREORDER), ctx.testdir]
+        cmd.extend(self.args)
+        proc = sp.run(cmd, cwd=ctx.cwd, timeout=ctx.conf.timeout,
+                      stdout=sp.PIPE, stderr=sp.STDOUT,
+                      universal_newlines=True)
+        if proc.returncode != 0:
+            futils.fail(proc.stdout, exit_code=proc.returncode)
+        ctx.msg.print_verbose(proc.stdout)
+
+
+class TEST0(PMREORDER_TOOL):
+    """resumed coverage-guided run reports the same failures"""
+    args = ['resume', 'ReorderCoverage(candidates=8, max_seq=4)']
+
+
+class TEST1(PMREORDER_TOOL):
+    """resumed randomized run reports the same failures"""
+    args = ['resume', 'ReorderPartial(max_seq=4)']
+
+
+class TEST2(PMREORDER_TOOL):
+    """gzip log read from a pipe written in small chunks"""
+    args = ['pipe', 'gzip']
+
+
+class TEST3(PMREORDER_TOOL):
+    """xz log read from a pipe written in small chunks"""
+    args = ['pipe', 'xz']
+
+
+class TEST4(PMREORDER_TOOL):
+    """zstd log read from a pipe written in small chunks"""
+    args = ['pipe', 'zstd']
+
+    def run(self, ctx):
+        if importlib.util.find_spec('zstandard') is None:
+            raise futils.Skip('SKIP: zstandard module not available')
+        super().run(ctx)
+
+
+class TEST5(PMREORDER_TOOL):
+    """budget and estimate of ReorderSlice on barriers of 80 stores"""
+    args = ['slice']
+
+
+class TEST6(PMREORDER_TOOL):
+    """combinations of ReorderSlice follow chained itertools.combinations"""
+    args = ['combinations']
+
+
+class TEST7(PMREORDER_TOOL):
+    """merged shards of ReorderFull report the unsharded failures"""
+    args = ['shard', 'ReorderFull']
+
+
+class TEST8(PMREORDER_TOOL):
+    """merged shards of ReorderPartial report the unsharded failures"""
+    args = ['shard', 'ReorderPartial(max_seq=4)']
+
+
+class TEST9(PMREORDER_TOOL):
+    """merged shards of ReorderMissing report the unsharded failures"""
+    args = ['shard', 'ReorderMissing(k=2)']
+
+
+class TEST10(PMREORDER_TOOL):
+    """merged shards of ReorderSlice report the unsharded failures"""
+    args = ['shard', 'ReorderSlice(start=1, stop=None, step=3)']
+
+
+class TEST11(PMREORDER_TOOL):
+    """merged shards of ReorderAccumulative report the unsharded failures"""
+    args = ['shard', 'ReorderAccumulative']
+
+
+class TEST12(PMREORDER_TOOL):
+    """missing stores minimized to the subset the checker fails on"""
+    args = ['minimize', 'missing']
+
+
+class TEST13(PMREORDER_TOOL):
+    """persisted stores minimized to the subset the checker fails on"""
+    args = ['minimize', 'applied']
+
+
+class TEST14(PMREORDER_TOOL):
+    """signature limits stop the checks of a barrier or of the run"""
+    args = ['signatures', 'ReorderFull', 'barrier']
+
+
+class TEST15(PMREORDER_TOOL):
+    """signature limits stop the checks of a region or of the run"""
+    args = ['signatures', 'ReorderFull', 'region']
+
+
+class TEST16(PMREORDER_TOOL):
+    """runs from the barrier snapshots report the failures of a full run"""
+    args = ['snapshots', 'ReorderFull']
+
+
+class TEST17(PMREORDER_TOOL):
+    """jobs in processes and threads report the same as a sequential run"""
+    args = ['jobs', 'ReorderPartial(max_seq=4)']
+
+
+class TEST18(PMREORDER_TOOL):
+    """coverage-guided jobs report the same as a sequential run"""
+    args = ['jobs', 'ReorderCoverage(candidates=8, max_seq=4)']
+
+
+class TEST19(PMREORDER_TOOL):
+    """batch of relative paths reports a broken entry as an error"""
+    args = ['batch', 'ReorderPartial(max_seq=4)']
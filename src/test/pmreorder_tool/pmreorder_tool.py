@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+"""
+Checks the pmreorder modules on synthetic store logs, see TESTS.py.
+
+The modules are imported from the pmreorder directory given as the first
+argument, the logs and the registered files are created in the test
+directory given as the second one. Exits with status 1 and prints the
+difference if the check fails.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+
+class Interrupted(Exception):
+    """Stops the run at a given consistency check"""
+
+
+def crc_checker(limit=None):
+    """
+    Returns the checker function reporting a file as inconsistent when the
+    crc of its content is divisible by 5, raising Interrupted at the check
+    after the given number of checks.
+    """
+    calls = [0]
+
+    def check(name):
+        calls[0] += 1
+        if limit is not None and calls[0] > limit:
+            raise Interrupted()
+        with open(name, "rb") as image:
+            return zlib.crc32(image.read()) % 5 != 0
+
+    return check
+
+
+def generate_log(testdir, name, **kwargs):
+    """
+    Generates a store log, by default with nested marker regions, and
+    creates its registered files.
+    """
+    import loggen
+    directory = os.path.join(testdir, name)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    log = os.path.join(directory, "store_log.log")
+    config = dict(epochs=60, stores=(2, 6), file_size=4096, marker_depth=2,
+                  marker_epochs=5, seed=3)
+    config.update(kwargs)
+    loggen.generate(loggen.LogConfig(**config), log)
+    return log
+
+
+def check_resume(args):
+    """
+    Compares the failures of an uninterrupted run with those of a run
+    interrupted halfway and resumed from its checkpoint.
+    """
+    import api
+    log = generate_log(args.testdir, "full")
+    expected = api.run(log, crc_checker(), args.engine, seed=7)
+
+    log = generate_log(args.testdir, "resumed")
+    checkpoint = os.path.join(args.testdir, "checkpoint")
+    shutil.rmtree(checkpoint, ignore_errors=True)
+    try:
+        api.run(log, crc_checker(args.checks), args.engine, seed=7,
+                checkpoint=checkpoint, checkpoint_interval=0)
+        print("the run has not been interrupted")
+        sys.exit(1)
+    except Interrupted:
+        pass
+    resumed = api.run(log, crc_checker(), args.engine, seed=7,
+                      checkpoint=checkpoint, checkpoint_interval=0,
+                      resume=True)
+
+    expected = [str(f) for f in expected.failures]
+    resumed = [str(f) for f in resumed.failures]
+    if not expected:
+        print("no failures found")
+        sys.exit(1)
+    if resumed != expected:
+        print("failures of the uninterrupted run: {}".format(expected))
+        print("failures of the resumed run: {}".format(resumed))
+        sys.exit(1)
+
+
+def _compress(data, compression):
+    if compression == "gzip":
+        import gzip
+        return gzip.compress(data)
+    if compression == "xz":
+        import lzma
+        return lzma.compress(data)
+    import zstandard
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _write_slowly(fifo, data, chunk_size):
+    """
+    Writes the data to the named pipe in small chunks, the leading bytes
+    one by one, so that the reader gets only a part of the magic number of
+    the compressed log at first.
+    """
+    with open(fifo, "wb", buffering=0) as pipe:
+        for byte in range(8):
+            pipe.write(data[byte:byte + 1])
+            time.sleep(0.01)
+        for start in range(8, len(data), chunk_size):
+            pipe.write(data[start:start + chunk_size])
+
+
+def check_pipe(args):
+    """
+    Compares the operations of a compressed log read from a named pipe,
+    written in small chunks, with those of the uncompressed log.
+    """
+    import storelog
+    log = generate_log(args.testdir, "pipe")
+    expected = storelog.open_log(log)
+    with open(log, "rb") as log_file:
+        data = _compress(log_file.read(), args.compression)
+
+    fifo = os.path.join(args.testdir, "pipe", "store_log.fifo")
+    os.mkfifo(fifo)
+    writer = threading.Thread(target=_write_slowly,
+                              args=(fifo, data, args.chunk_size))
+    writer.start()
+    try:
+        operations = list(storelog.open_log(fifo))
+    finally:
+        writer.join()
+    if operations != expected:
+        print("{} operations read from the pipe, {} expected".format(
+            len(operations), len(expected)))
+        sys.exit(1)
+
+
+def check_slice(args):
+    """
+    Checks the budget and the estimate of ReorderSlice on barriers with
+    more combinations of stores than fit in the C integer.
+    """
+    import api
+    stores = 80
+    engine = "ReorderSlice(start=0,stop=None,step=7)"
+    log = generate_log(args.testdir, "slice", epochs=3,
+                       stores=(stores, stores), marker_depth=0)
+
+    report = api.run(log, crc_checker(), engine, budget="10")
+    downgraded = [d["stores"] for d in report.downgrades]
+    if downgraded != [stores] * 3:
+        print("stores of the downgraded barriers: {}".format(downgraded))
+        sys.exit(1)
+
+    estimate = api.estimate(log, crc_checker(), engine)
+    expected = ((1 << stores) + 6) // 7
+    sequences = [b["sequences"] for b in estimate.barriers
+                 if b["stores"] == stores]
+    if sequences != [expected] * 3:
+        print("estimated sequences: {}, {} expected".format(
+            sequences, expected))
+        sys.exit(1)
+
+
+def check_combinations(args):
+    """
+    Compares the combinations unranked by ReorderSlice, one by one and as
+    slices, with those of chained itertools.combinations.
+    """
+    import reorderengines
+    for n in range(args.max_elements + 1):
+        expected = list(itertools.chain.from_iterable(
+            itertools.combinations(range(n), k) for k in range(n + 1)))
+        unranked = [tuple(reorderengines.unrank_combination(n, i))
+                    for i in range(1 << n)]
+        walked = []
+        combination = []
+        while combination is not None:
+            walked.append(tuple(combination))
+            combination = reorderengines.next_combination(n, combination)
+        if unranked != expected or walked != expected:
+            print("combinations of {} elements: unranked {}, walked {}, "
+                  "{} expected".format(n, unranked, walked, expected))
+            sys.exit(1)
+
+        for start, stop, step, first in itertools.product(
+                range(0, 1 << n, 3), [None, 1 << (n - 1) if n else 0],
+                [1, 2, 5], [0, 1, 4]):
+            engine = reorderengines.SlicePartialReorderEngine(start, stop,
+                                                              step)
+            expected_slice = list(itertools.islice(expected, start, stop,
+                                                   step))
+            generated = list(engine.generate_sequence(range(n), first))
+            if generated != expected_slice[first:] or \
+                    engine.count_sequences(n) != len(expected_slice):
+                print("slice [{}:{}:{}] from {} of {} elements: {}, "
+                      "{} expected".format(start, stop, step, first, n,
+                                           generated, expected_slice[first:]))
+                sys.exit(1)
+
+
+def check_shard(args):
+    """
+    Compares the failures of an unsharded run with the merged failures of
+    the shards of the run, and checks that the reports of a missing or
+    a duplicated shard are not merged.
+    """
+    import api
+    import shard
+    log = generate_log(args.testdir, "shard", stores=(2, 4))
+    expected = api.run(log, crc_checker(), args.engine, seed=0)
+    expected = [failure.identifier for failure in expected.failures]
+    if not expected:
+        print("no failures found")
+        sys.exit(1)
+
+    results = []
+    for index in range(args.count):
+        log = generate_log(args.testdir, "shard", stores=(2, 4))
+        shard_spec = "{}/{}".format(index, args.count)
+        results.append(api.run(log, crc_checker(), args.engine,
+                               shard=shard_spec).to_dict())
+    merged = shard.merge(results)["failures"]
+    if merged != expected:
+        print("failures of the unsharded run: {}".format(expected))
+        print("merged failures of the shards: {}".format(merged))
+        sys.exit(1)
+
+    for invalid in (results[1:], results + results[:1]):
+        try:
+            shard.merge(invalid)
+        except ValueError:
+            continue
+        print("shards {} merged".format(
+            [result["shard"]["index"] for result in invalid]))
+        sys.exit(1)
+
+
+def logged_stores(log):
+    """
+    Returns the addresses and the sizes of the logged stores.
+    """
+    import storelog
+    stores = []
+    for operation in storelog.open_log(log):
+        fields = operation.split(";")
+        if fields[0] == "STORE":
+            stores.append((int(fields[1], 16), int(fields[3], 16)))
+    return stores
+
+
+def check_minimize(args):
+    """
+    Checks that the minimized sequences are the 1-minimal sets of stores
+    the checker fails on, in a sequential run and in a run with jobs.
+    """
+    import api
+    import loggen
+    # a single barrier of stores to distinct addresses of a zeroed file
+    config = dict(epochs=1, stores=(8, 8), marker_depth=0, seed=5)
+    stores = logged_stores(generate_log(args.testdir, "minimize", **config))
+    if len(set(stores)) != len(stores):
+        print("stores to the same address: {}".format(stores))
+        sys.exit(1)
+    # the image is inconsistent if the stores 2 and 5 are missing, or if
+    # they are persisted while the store 7 is not
+    targets = [stores[2], stores[5]]
+    guard = stores[7]
+
+    def check(name):
+        with open(name, "rb") as image:
+            data = image.read()
+
+        def persisted(store):
+            offset = store[0] - loggen.BASE_ADDRESS
+            return any(data[offset:offset + store[1]])
+
+        if args.kind == "missing":
+            return any(persisted(store) for store in targets)
+        return not all(persisted(store) for store in targets) or \
+            persisted(guard)
+
+    expected = [hex(address) for address, _ in targets]
+    minimized = []
+    for jobs in (1, 2):
+        log = generate_log(args.testdir, "minimize", **config)
+        report = api.run(log, check, "ReorderAccumulative",
+                         seed=1, minimize=args.kind, jobs=jobs)
+        minimized.append(report.minimized)
+        for result in report.minimized:
+            addresses = [store["address"] for store in result["stores"]]
+            if addresses != expected:
+                print("failure {} minimized to {}, {} expected".format(
+                    result["failure"], addresses, expected))
+                sys.exit(1)
+    if not minimized[0]:
+        print("no failures minimized")
+        sys.exit(1)
+    if minimized[0] != minimized[1]:
+        print("minimized sequentially: {}".format(minimized[0]))
+        print("minimized with jobs: {}".format(minimized[1]))
+        sys.exit(1)
+
+
+def check_signatures(args):
+    """
+    Checks that the runs limited by the failures of a signature in its
+    scope and by the number of distinct signatures report the failures of
+    an unlimited run up to the documented stop.
+    """
+    import api
+    import report
+
+    # the signature and the scope of each failure of the unlimited run
+    recorded = []
+    add_failure = report.Report.add_failure
+
+    def record(self, failure, sig=None, scope=None):
+        recorded.append((failure.identifier, sig, scope))
+        return add_failure(self, failure, sig, scope)
+
+    report.Report.add_failure = record
+    try:
+        log = generate_log(args.testdir, "signatures")
+        api.run(log, crc_checker(), args.engine, seed=7,
+                signature_scope=args.scope)
+    finally:
+        report.Report.add_failure = add_failure
+    if len(set(sig for _, sig, _ in recorded)) <= args.max_signatures:
+        print("too few signatures found")
+        sys.exit(1)
+
+    # the rest of the scope is skipped once a signature fails too often
+    expected = []
+    counts = {}
+    exhausted = set()
+    for identifier, sig, scope in recorded:
+        if scope in exhausted:
+            continue
+        expected.append(identifier)
+        counts[scope, sig] = counts.get((scope, sig), 0) + 1
+        if counts[scope, sig] >= args.max_failures:
+            exhausted.add(scope)
+    log = generate_log(args.testdir, "signatures")
+    limited = api.run(log, crc_checker(), args.engine, seed=7,
+                      signature_scope=args.scope,
+                      max_signature_failures=args.max_failures)
+    limited = [failure.identifier for failure in limited.failures]
+    if limited != expected or len(expected) == len(recorded):
+        print("failures limited per signature: {}, {} expected".format(
+            limited, expected))
+        sys.exit(1)
+
+    # the run stops at the first failure of the last allowed signature
+    signatures = []
+    for stop, (_, sig, _) in enumerate(recorded):
+        if sig not in signatures:
+            signatures.append(sig)
+            if len(signatures) == args.max_signatures:
+                break
+    expected = [identifier for identifier, _, _ in recorded[:stop + 1]]
+    log = generate_log(args.testdir, "signatures")
+    limited = api.run(log, crc_checker(), args.engine, seed=7,
+                      signature_scope=args.scope,
+                      max_signatures=args.max_signatures)
+    limited = [failure.identifier for failure in limited.failures]
+    if limited != expected:
+        print("failures limited by signatures: {}, {} expected".format(
+            limited, expected))
+        sys.exit(1)
+
+
+def check_snapshots(args):
+    """
+    Checks that the runs starting from the barrier snapshots report
+    the failures of a complete run at the checked barriers.
+    """
+    import api
+    log = generate_log(args.testdir, "snapshots")
+    expected = api.run(log, crc_checker(), args.engine, seed=7,
+                       snapshot_interval=args.interval).failures
+    snapshots = os.listdir(log + ".snapshots")
+    if not snapshots:
+        print("no snapshots saved")
+        sys.exit(1)
+
+    for barrier in (args.interval * 2, args.interval * 3 + 1):
+        # the state of the files is to be taken from the snapshots only
+        for name in os.listdir(os.path.dirname(log)):
+            if name.startswith("bench_pool"):
+                with open(os.path.join(os.path.dirname(log), name),
+                          "r+b") as pool:
+                    size = pool.seek(0, os.SEEK_END)
+                    pool.seek(0)
+                    pool.write(b"\xff" * size)
+        failures = api.run(log, crc_checker(), args.engine, seed=7,
+                           from_barrier=barrier).failures
+        failures = [str(failure) for failure in failures]
+        checked = [str(failure) for failure in expected
+                   if failure.barrier >= barrier]
+        if failures != checked:
+            print("failures from barrier {}: {}, {} expected".format(
+                barrier, failures, checked))
+            sys.exit(1)
+
+
+def check_jobs(args):
+    """
+    Compares the report of a sequential run with the reports of runs with
+    jobs in worker processes and in threads.
+    """
+    import api
+    reports = {}
+    for jobs, threads in ((1, False), (args.jobs, False), (args.jobs, True)):
+        log = generate_log(args.testdir, "jobs")
+        reports[jobs, threads] = api.run(
+            log, crc_checker(), args.engine, seed=7, jobs=jobs,
+            threads=threads, max_signature_failures=2).to_dict()
+    expected = reports.pop((1, False))
+    if not expected["failures"]:
+        print("no failures found")
+        sys.exit(1)
+    for (jobs, threads), report in reports.items():
+        if report != expected:
+            print("report of the sequential run: {}".format(expected))
+            print("report of {} jobs{}: {}".format(
+                jobs, " in threads" if threads else "", report))
+            sys.exit(1)
+
+
+CHECKER_SCRIPT = """#!/bin/sh
+# inconsistent when the checksum of the file is divisible by 5
+[ $(( $(cksum < "$1" | cut -d' ' -f1) % 5 )) -ne 0 ]
+"""
+
+
+def check_batch(args):
+    """
+    Checks that a batch manifest with relative paths gives the failures of
+    the single runs of its entries and that a broken entry is reported as
+    an error without stopping the batch.
+    """
+    import api
+    import consistencycheckwrap
+    directory = os.path.join(args.testdir, "batch")
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    checker = os.path.join(directory, "checker.sh")
+    with open(checker, "w") as checker_file:
+        checker_file.write(CHECKER_SCRIPT)
+    os.chmod(checker, 0o755)
+    logs = ["first", None, "second"]
+    expected = []
+    for seed, name in enumerate(logs):
+        if name is None:
+            continue
+        log = generate_log(directory, name, epochs=20, seed=seed)
+        failures = api.run(log, consistencycheckwrap.get_checker(
+            "prog", checker, None), args.engine, seed=7).failures
+        expected.append([failure.identifier for failure in failures])
+        # the batch starts from the generated files as well
+        generate_log(directory, name, epochs=20, seed=seed)
+
+    manifest = os.path.join(directory, "manifest.json")
+    with open(manifest, "w") as manifest_file:
+        json.dump({
+            "defaults": {"path": "checker.sh", "engine": args.engine,
+                         "seed": 7},
+            "entries": [{"log": os.path.join(name or "missing",
+                                             "store_log.log")}
+                        for name in logs],
+        }, manifest_file)
+    output = os.path.join(directory, "report.json")
+    # the paths of the manifest are relative to its directory only
+    pmreorder = os.path.abspath(os.path.join(args.pmreorder_dir,
+                                             "pmreorder.py"))
+    proc = subprocess.run([sys.executable, pmreorder, "batch", manifest,
+                           "--output", output],
+                          cwd="/", stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, universal_newlines=True)
+    if proc.returncode != 1 or not os.path.exists(output):
+        print("batch exited with status {}:\n{}".format(proc.returncode,
+                                                        proc.stdout))
+        sys.exit(1)
+    with open(output) as output_file:
+        results = json.load(output_file)["entries"]
+
+    errors = [result["report"]["errors"] for result in results]
+    failures = [result["report"]["failures"] for result in results]
+    if len(results) != len(logs) or not errors[1] or errors[0] or \
+            errors[2] or [failures[0], failures[2]] != expected:
+        print("results of the batch: {}".format(results))
+        print("failures of the single runs: {}".format(expected))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pmreorder_dir")
+    parser.add_argument("testdir")
+    subparsers = parser.add_subparsers(dest="check")
+    subparsers.required = True
+    resume = subparsers.add_parser("resume")
+    resume.add_argument("engine")
+    resume.add_argument("--checks", type=int, default=100,
+                        help="the number of checks before the interruption")
+    resume.set_defaults(function=check_resume)
+    pipe = subparsers.add_parser("pipe")
+    pipe.add_argument("compression", choices=["gzip", "xz", "zstd"])
+    pipe.add_argument("--chunk-size", type=int, default=7,
+                      help="the number of bytes written to the pipe at once")
+    pipe.set_defaults(function=check_pipe)
+    subparsers.add_parser("slice").set_defaults(function=check_slice)
+    shards = subparsers.add_parser("shard")
+    shards.add_argument("engine")
+    shards.add_argument("--count", type=int, default=3,
+                        help="the number of shards")
+    shards.set_defaults(function=check_shard)
+    signatures = subparsers.add_parser("signatures")
+    signatures.add_argument("engine")
+    signatures.add_argument("scope", choices=["barrier", "region"])
+    signatures.add_argument("--max-failures", type=int, default=2,
+                            help="the limit of the failures of a signature")
+    signatures.add_argument("--max-signatures", type=int, default=3,
+                            help="the limit of the distinct signatures")
+    signatures.set_defaults(function=check_signatures)
+    snapshots = subparsers.add_parser("snapshots")
+    snapshots.add_argument("engine")
+    snapshots.add_argument("--interval", type=int, default=8,
+                           help="the number of barriers between snapshots")
+    snapshots.set_defaults(function=check_snapshots)
+    jobs = subparsers.add_parser("jobs")
+    jobs.add_argument("engine")
+    jobs.add_argument("--jobs", type=int, default=3,
+                      help="the number of jobs")
+    jobs.set_defaults(function=check_jobs)
+    batch = subparsers.add_parser("batch")
+    batch.add_argument("engine")
+    batch.set_defaults(function=check_batch)
+    minimize = subparsers.add_parser("minimize")
+    minimize.add_argument("kind", choices=["missing", "applied"])
+    minimize.set_defaults(function=check_minimize)
+    combs = subparsers.add_parser("combinations")
+    combs.add_argument("--max-elements", type=int, default=8)
+    combs.set_defaults(function=check_combinations)
+    args = parser.parse_args()
+
+    sys.path[:0] = [args.pmreorder_dir,
+                    os.path.join(args.pmreorder_dir, "benchmarks")]
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ from basetest import BaseTest, Test, get_testcases  # noqa: E402, F401
 from context import *  # noqa: E402, F401, F403
 from configurator import *  # noqa: E402, F401, F403
 from valgrind import *  # noqa: E402, F401, F403
+from pmreorder import *  # noqa: E402, F401, F403
 from utils import *  # noqa: E402, F401, F403
 from poolset import *  # noqa: E402, F401, F403
 from builds import *  # noqa: E402, F401, F403
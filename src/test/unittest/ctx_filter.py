@@ -13,12 +13,14 @@ import builds
 import futils
 import granularity
 import devdax
+import pmreorder
 
 import context as ctx
 import valgrind as vg
 
 if sys.platform != 'win32':
-    CTX_TYPES = (vg.Valgrind, granularity.Granularity, devdax.DevDaxes)
+    CTX_TYPES = (vg.Valgrind, granularity.Granularity, devdax.DevDaxes,
+                 pmreorder.Pmreorder)
 else:
     CTX_TYPES = (granularity.Granularity, )
 
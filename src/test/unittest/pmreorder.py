@@ -0,0 +1,268 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+#
+"""pmreorder handling tools"""
+
+import atexit
+import os
+import re
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+from os import path
+
+import context as ctx
+import futils
+import valgrind as vg
+
+
+PMREORDER = os.environ.get('PMREORDER',
+                           path.join(futils.ROOTDIR, '..', 'tools',
+                                     'pmreorder', 'pmreorder.py'))
+
+# pmemcheck options recording the store log - the same as used by
+# pmreorder_create_store_log in unittest.sh
+_STORE_LOG_OPTS = (
+    '-q',
+    '--log-stores=yes',
+    '--print-summary=no',
+    '--log-stores-stacktraces=yes',
+    '--log-stores-stacktraces-depth=2',
+)
+
+# the pmemcheck API versions (inclusive, exclusive) recording the store log
+# format read by pmreorder - the same as required by the shell tests
+PMEMCHECK_VERSION_MIN = (1, 0)
+PMEMCHECK_VERSION_MAX = (2, 0)
+
+# the pmemcheck API version, detected once per runner execution
+_pmemcheck_version = None
+
+# store logs recorded during the runner execution, by workload
+_store_logs = {}
+_cache_dir = None
+
+
+def _get_cache_dir():
+    """
+    Get the directory of the recorded store logs. It is removed when the
+    runner exits.
+    """
+    global _cache_dir
+    if _cache_dir is None:
+        _cache_dir = tempfile.mkdtemp(prefix='pmreorder')
+        atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+    return _cache_dir
+
+
+def _get_pmemcheck_version(valgrind_exe):
+    """
+    Get the pmemcheck API version as a (major, minor) tuple, the same as
+    get_pmemcheck_version in unittest.sh
+    """
+    global _pmemcheck_version
+    if _pmemcheck_version is None:
+        proc = sp.run([valgrind_exe, '--tool=pmemcheck', 'true'],
+                      stdout=sp.PIPE, stderr=sp.STDOUT,
+                      universal_newlines=True)
+        banner = proc.stdout.splitlines()[0] if proc.stdout else ''
+        match = re.search(r'-(\d+)\.(\d+)[\d.]*,', banner)
+        if match is None:
+            futils.fail('cannot get the pmemcheck version from: {}'
+                        .format(banner))
+        _pmemcheck_version = (int(match.group(1)), int(match.group(2)))
+    return _pmemcheck_version
+
+
+class _StoreLog:
+    """Store log recorded for a single workload"""
+
+    def __init__(self, log_file, files):
+        self.log_file = log_file
+        # names of the files registered in the store log
+        self.files = files
+
+
+class Pmreorder:
+    """
+    pmreorder management. The test is run once per pmreorder configuration
+    (the default engine and the markers) required by the test. The store
+    log of a workload is recorded only once and it is reused by all tests
+    and contexts running the same workload.
+    """
+
+    def __init__(self, engine, markers, cwd, testnum):
+        if sys.platform == 'win32':
+            raise NotImplementedError(
+                'Pmreorder class should not be used on Windows')
+
+        self.engine = engine
+        self.markers = markers
+        self.cwd = cwd
+        self.log_file = path.join(cwd, 'pmreorder{}.log'.format(testnum))
+        self.store_log = None
+        self.aliases = {}
+
+        # the store log is recorded by pmemcheck, the test is skipped
+        # if it is not available or its log format is not supported
+        self._pmemcheck = vg.Valgrind(vg.PMEMCHECK, cwd, testnum)
+        version = _get_pmemcheck_version(self._pmemcheck.valgrind_exe)
+        if not PMEMCHECK_VERSION_MIN <= version < PMEMCHECK_VERSION_MAX:
+            raise futils.Skip('pmemcheck API version {}.{} is not in the '
+                              'supported range [{}.{}, {}.{})'.format(
+                                  *(version + PMEMCHECK_VERSION_MIN +
+                                    PMEMCHECK_VERSION_MAX)))
+
+    def __str__(self):
+        if self.markers is None:
+            return 'pmreorder:{}'.format(self.engine)
+        return 'pmreorder:{}:{}'.format(self.engine, self.markers)
+
+    @classmethod
+    def filter(cls, config, msg, tc):
+        """
+        Acquire pmreorder configurations for the test to be run based
+        on test requirements
+        """
+        configs, _ = ctx.get_requirement(tc, 'pmreorder', None)
+        if configs is None:
+            return ctx.NO_CONTEXT
+
+        return [cls(engine, markers, tc.cwd, tc.testnum)
+                for engine, markers in configs]
+
+    def _get_env(self, c):
+        env = c.env.copy()
+        futils.add_env_common(env, os.environ.copy())
+        return env
+
+    def create_store_log(self, c, files, cmd, *args):
+        """
+        Record the store log of the binary run with provided arguments
+        under pmemcheck. Files modified by the binary are restored after
+        the recording, as the stores are replayed on them by pmreorder.
+
+        The log is recorded only once for the same binary, arguments,
+        environment (UNITTEST_* variables excluded) and granularity - files
+        paths in the arguments are not taken into account. Tests sharing
+        the workload have to create the files in the same way.
+        """
+        files = futils.to_list(files, str)
+        exe = path.join(self.cwd, cmd) + c.build.exesuffix
+        args = [str(a) for a in args]
+
+        def workload_arg(arg):
+            for i, f in enumerate(files):
+                arg = arg.replace(f, '$(file{})'.format(i))
+            return arg
+
+        env = tuple(sorted((k, v) for k, v in c.env.items()
+                           if not k.startswith('UNITTEST_')))
+        key = (exe, tuple(workload_arg(a) for a in args), env,
+               str(c.granularity))
+
+        # pmemcheck registers the files under their canonical paths
+        files = [path.realpath(f) for f in files]
+        if key not in _store_logs:
+            log_file = path.join(_get_cache_dir(),
+                                 'store_log{}.log'.format(len(_store_logs)))
+            self._record(c, log_file, files, [exe] + args)
+            _store_logs[key] = _StoreLog(log_file, files)
+        else:
+            c.msg.print_verbose('reusing the store log of {}'
+                                .format(' '.join([cmd] + args)))
+
+        store_log = _store_logs[key]
+        self.store_log = store_log.log_file
+        self.aliases = {recorded: f for recorded, f
+                        in zip(store_log.files, files) if recorded != f}
+
+    def _record(self, c, log_file, files, cmd):
+        """Run the workload under pmemcheck logging its stores"""
+        for f in files:
+            shutil.copy(f, f + '.pmr')
+
+        vg_cmd = [self._pmemcheck.valgrind_exe, '--tool=pmemcheck',
+                  '--log-file={}'.format(log_file)]
+        vg_cmd.extend(_STORE_LOG_OPTS)
+        vg_cmd.extend(self._pmemcheck.opts)
+
+        try:
+            proc = sp.run(vg_cmd + cmd, env=self._get_env(c), cwd=self.cwd,
+                          timeout=c.conf.timeout, stdout=sp.PIPE,
+                          stderr=sp.STDOUT, universal_newlines=True)
+        finally:
+            for f in files:
+                os.replace(f + '.pmr', f)
+
+        if proc.returncode != 0:
+            futils.fail(proc.stdout, exit_code=proc.returncode)
+        c.msg.print_verbose(proc.stdout)
+
+    def run(self, c, cmd, *args):
+        """
+        Run pmreorder on the recorded store log with the configured engine
+        and markers, using the binary run with provided arguments as
+        a consistency checker. Return the pmreorder process.
+        """
+        if self.store_log is None:
+            raise futils.Fail('no store log recorded, create_store_log() '
+                              'has to be called first')
+
+        checker = [path.join(self.cwd, cmd) + c.build.exesuffix]
+        checker.extend(str(a) for a in args)
+
+        pmreorder_cmd = [sys.executable, PMREORDER,
+                         '-l', self.store_log,
+                         '-o', self.log_file,
+                         '-r', self.engine,
+                         '-p', ' '.join(checker)]
+        if self.markers is not None:
+            pmreorder_cmd.extend(['-x', self.markers])
+        for recorded, f in self.aliases.items():
+            pmreorder_cmd.extend(['--file-alias',
+                                  '{}={}'.format(recorded, f)])
+
+        if path.isfile(self.log_file):
+            os.remove(self.log_file)
+
+        proc = sp.run(pmreorder_cmd, env=self._get_env(c), cwd=self.cwd,
+                      timeout=c.conf.timeout, stdout=sp.PIPE,
+                      stderr=sp.STDOUT, universal_newlines=True)
+        c.msg.print_verbose(proc.stdout)
+        return proc
+
+    def expect_success(self, c, cmd, *args):
+        """Run pmreorder, expect it to find no inconsistencies"""
+        proc = self.run(c, cmd, *args)
+        if proc.returncode != 0:
+            futils.fail(proc.stdout, exit_code=proc.returncode)
+
+    def expect_failure(self, c, cmd, *args):
+        """Run pmreorder, expect it to find an inconsistency"""
+        proc = self.run(c, cmd, *args)
+        if proc.returncode == 0:
+            futils.fail('pmreorder succeeded unexpectedly')
+
+
+def require_pmreorder(*configs):
+    """
+    Run the test with pmreorder once per provided configuration. Each
+    configuration is either the default engine or a tuple of the default
+    engine and the markers - MARKER=ENGINE,... pairs or the name of
+    the json config file.
+    """
+    configs = [(c, None) if isinstance(c, str) else tuple(c)
+               for c in configs]
+
+    def wrapped(tc):
+        if sys.platform == 'win32':
+            # pmemcheck is not available on windows
+            tc.enabled = False
+            return tc
+
+        ctx.add_requirement(tc, 'pmreorder', configs)
+        return tc
+
+    return wrapped
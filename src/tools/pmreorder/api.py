@@ -0,0 +1,367 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+"""
+The programmatic interface of pmreorder.
+
+Runs the reordering checks in the calling process, e.g. many checks in
+a single long-lived test harness, without starting a new interpreter
+for each check. The modules of the optional features are imported only
+when the features are used. Example::
+
+    import sys
+    sys.path.insert(0, "/usr/share/pmreorder")
+    import api
+
+    report = api.run("store_log", lambda name: check(name),
+                     engine="ReorderAccumulative",
+                     markers={"MY_MARKER": "ReorderFull"})
+    for failure in report.failures:
+        print(failure)
+"""
+
+import os
+
+from consistencycheckwrap import ConsistencyCheckerBase
+import loggingfacility
+import markerparser
+import opscontext
+import statemachine
+import storelog
+import utils
+
+DEFAULT_ENGINE = "NoReorderNoCheck"
+
+
+class FunctionChecker(ConsistencyCheckerBase):
+    """
+    Checks the consistency of the files with a python function.
+
+    :ivar _function: The function taking the name of the checked file and
+        returning True if the file is consistent.
+    :type _function: callable
+    """
+    def __init__(self, function):
+        self._function = function
+
+    def check_consistency(self, filename):
+        """
+        Checks the consistency of the file.
+
+        :param filename: The full name of the file to be checked.
+        :type filename: str
+        :return: 0 if the file is consistent, 1 otherwise, the same as
+            the exit status of the checker programs.
+        :rtype: int
+        """
+        return 0 if self._function(filename) else 1
+
+
+def get_markers(markers):
+    """
+    Returns the marker configuration.
+
+    :param markers: The markers mapped to the engine specifications,
+        the MARKER=ENGINE,... list or the name of the json config file.
+    :type markers: dict or str
+    :return: The markers mapped to the engine specifications.
+    :rtype: dict
+    """
+    if markers is None or isinstance(markers, dict):
+        return markers
+    return markerparser.MarkerParser().get_markers(markers)
+
+
+def _checker(checker):
+    if isinstance(checker, ConsistencyCheckerBase):
+        return checker
+    if callable(checker):
+        return FunctionChecker(checker)
+    raise TypeError("Invalid consistency checker: {!r}".format(checker))
+
+
+def _is_stream(log):
+    return not isinstance(log, str) or storelog.is_stream(log)
+
+
+def create_context(log, checker, engine=DEFAULT_ENGINE, markers=None,
+                   seed=None, replay=None, logger=None, file_aliases=None,
+                   in_memory=False):
+    """
+    Creates the reordering context of a run.
+
+    The state of the previous run made in the process is reset.
+
+    :param log: The name of the store log, "-" for the standard input, or
+        the iterator over the logged operations.
+    :type log: str or iterator
+    :param checker: The consistency checker, or a function taking the name
+        of a file and returning True if the file is consistent.
+    :type checker: ConsistencyCheckerBase or callable
+    :param engine: The default engine specification.
+    :type engine: str
+    :param markers: The marker configuration, see :func:`get_markers`.
+    :type markers: dict or str
+    :param seed: The seed of the randomized engines, random if None.
+    :type seed: int
+    :param replay: The failure whose crash image is to be rebuilt.
+    :type replay: report.Failure
+    :param logger: The logger, by default nothing is logged.
+    :type logger: loggingfacility.LoggingBase
+    :param file_aliases: The files on which the stores to the registered
+        files are replayed, by the names of the registered files.
+    :type file_aliases: dict
+    :param in_memory: Replay the stores on in-memory copies of the
+        registered files, which are left intact.
+    :type in_memory: bool
+    :return: The reordering context.
+    :rtype: opscontext.OpsContext
+    """
+    statemachine.State.trans_stores = []
+    if logger is None:
+        logger = loggingfacility.LoggingBase()
+    context = opscontext.OpsContext(log, _checker(checker), logger, engine,
+                                    get_markers(markers), seed, replay)
+    context.file_aliases = dict(file_aliases or {})
+    context.file_handler.in_memory = in_memory
+    return context
+
+
+def validate(streaming=False, budget=None, shard=None, resume=False,
+             checkpoint=None, snapshot_interval=None, from_barrier=0,
+             jobs=1, max_signatures=None, max_signature_failures=None,
+             signature_scope="barrier", replay=None, in_memory=False,
+             threads=False):
+    """
+    Checks whether the options of a run can be used together.
+
+    :raises: ValueError describing the conflicting options.
+    """
+    if streaming and budget is not None:
+        raise ValueError("budget requires a regular log file")
+    if streaming and resume:
+        raise ValueError("resume requires a regular log file")
+    if streaming and (snapshot_interval is not None or from_barrier):
+        raise ValueError("snapshots require a regular log file")
+    if snapshot_interval is not None and snapshot_interval < 1:
+        raise ValueError("snapshot interval must be positive")
+    if resume and checkpoint is None:
+        raise ValueError("resume requires a checkpoint directory")
+    if shard is not None and budget is not None:
+        raise ValueError("shard cannot be used with budget")
+    if replay is not None and in_memory:
+        # the rebuilt crash image would be lost
+        raise ValueError("replay cannot be used with in-memory images")
+    if jobs < 1:
+        raise ValueError("the number of jobs must be positive")
+    if threads and jobs == 1:
+        raise ValueError("threads require more than one job")
+    if jobs > 1:
+        if budget is not None:
+            raise ValueError("jobs cannot be used with budget")
+        if checkpoint is not None:
+            raise ValueError("jobs cannot be used with checkpoint")
+        if max_signatures is not None:
+            raise ValueError("jobs cannot be used with max signatures")
+        if max_signature_failures is not None and \
+                signature_scope == "region":
+            raise ValueError("jobs cannot be used with max signature " +
+                             "failures in the region scope")
+
+
+def run(log, checker, engine=DEFAULT_ENGINE, markers=None, seed=None,
+        replay=None, logger=None, file_aliases=None, budget=None,
+        shard=None, signature="missing", signature_scope="barrier",
+        max_signature_failures=None, max_signatures=None, minimize=None,
+        checkpoint=None, checkpoint_interval=600, resume=False,
+        snapshot_interval=None, snapshot_dir=None, from_barrier=0, jobs=1,
+        in_memory=False, threads=False):
+    """
+    Replays the store log and checks the consistency of the registered
+    files, the same as the pmreorder command with the corresponding
+    options, see pmreorder(1).
+
+    :param log: The store log, see :func:`create_context`.
+    :type log: str or iterator
+    :param checker: The consistency checker, see :func:`create_context`.
+    :type checker: ConsistencyCheckerBase or callable
+    :param engine: The default engine specification.
+    :type engine: str
+    :param markers: The marker configuration, see :func:`get_markers`.
+    :type markers: dict or str
+    :param seed: The seed of the randomized engines, random if None.
+    :type seed: int
+    :param replay: The failure whose crash image is to be rebuilt.
+    :type replay: report.Failure
+    :param logger: The logger, by default nothing is logged.
+    :type logger: loggingfacility.LoggingBase
+    :param file_aliases: The files on which the stores are replayed, by
+        the names of the registered files.
+    :type file_aliases: dict
+    :param budget: The budget of the checks, e.g. "10000" or "30m".
+    :type budget: str or budget.BudgetScheduler
+    :param shard: The part of the sequences to be checked, e.g. "0/4".
+    :type shard: str or shard.Shard
+    :param signature: "missing" or "applied", see --signature.
+    :type signature: str
+    :param signature_scope: "barrier" or "region".
+    :type signature_scope: str
+    :param max_signature_failures: The limit of the failures of
+        a signature in its scope.
+    :type max_signature_failures: int
+    :param max_signatures: The limit of the distinct signatures.
+    :type max_signatures: int
+    :param minimize: None, "missing" or "applied", see --minimize.
+    :type minimize: str
+    :param checkpoint: The checkpoint directory, None to disable.
+    :type checkpoint: str
+    :param checkpoint_interval: The time between checkpoints in seconds.
+    :type checkpoint_interval: float
+    :param resume: Resume from the last checkpoint.
+    :type resume: bool
+    :param snapshot_interval: The number of barriers between snapshots.
+    :type snapshot_interval: int
+    :param snapshot_dir: The snapshot directory.
+    :type snapshot_dir: str
+    :param from_barrier: The first barrier to be checked.
+    :type from_barrier: int
+    :param jobs: The number of worker processes.
+    :type jobs: int
+    :param in_memory: Replay the stores on in-memory copies of the
+        registered files, which are left intact.
+    :type in_memory: bool
+    :param threads: Run the jobs in threads sharing the checker, which
+        has to be thread-safe, instead of processes.
+    :type threads: bool
+    :return: The report of the run.
+    :rtype: report.Report
+    :raises: ValueError when the options cannot be used together.
+    """
+    if isinstance(budget, str):
+        import budget as budget_module
+        budget = budget_module.BudgetScheduler.parse(budget)
+    if isinstance(shard, str):
+        import shard as shard_module
+        shard = shard_module.Shard.parse(shard)
+    if shard is not None and seed is None:
+        # all shards have to generate the same random sequences
+        seed = 0
+    streaming = _is_stream(log)
+    validate(streaming=streaming, budget=budget, shard=shard, resume=resume,
+             checkpoint=checkpoint, snapshot_interval=snapshot_interval,
+             from_barrier=from_barrier, jobs=jobs,
+             max_signatures=max_signatures,
+             max_signature_failures=max_signature_failures,
+             signature_scope=signature_scope, replay=replay,
+             in_memory=in_memory, threads=threads)
+
+    context = create_context(log, checker, engine=engine, markers=markers,
+                             seed=seed, replay=replay, logger=logger,
+                             file_aliases=file_aliases, in_memory=in_memory)
+    context.budget = budget
+    context.signature_applied = signature == "applied"
+    context.signature_scope = signature_scope
+    context.max_signature_failures = max_signature_failures
+    context.max_signatures = max_signatures
+    if minimize is not None:
+        import minimize as minimize_module
+        context.minimizer = minimize_module.Minimizer(context,
+                                                      minimize == "applied")
+    if shard is not None:
+        context.shard = shard
+        context.report.shard = shard
+        context.report.run = {
+            "logfile": os.path.basename(log if isinstance(log, str)
+                                        else "-"),
+            "logsize": None if streaming else os.path.getsize(log),
+            "engine": engine,
+            "markers": context.markers,
+            "seed": context.seed,
+        }
+
+    context.first_barrier = from_barrier
+    init_state = statemachine.InitState(context)
+    position = 0
+    resumed = None
+    if checkpoint is not None:
+        import checkpoint as checkpoint_module
+        context.checkpointer = checkpoint_module.Checkpointer(
+            checkpoint, checkpoint_interval)
+        if resume:
+            resumed = context.checkpointer.restore(context)
+    if not streaming:
+        import snapshot
+        context.snapshots = snapshot.SnapshotStore(
+            snapshot_dir or log + ".snapshots", log, snapshot_interval)
+        if snapshot_interval is not None:
+            context.file_handler.track_pages()
+        start = from_barrier
+        if replay is not None:
+            start = replay.barrier
+            if replay.engine == "ReorderCoverage":
+                # the coverage of the preceding barriers has to be rebuilt
+                start = 0
+        if resumed is None and start > 0:
+            resumed = context.snapshots.restore(context, start)
+    if resumed is not None:
+        init_state, position = resumed
+    if jobs > 1 and replay is None:
+        import pipeline
+        # the clones of the in-memory copies are kept in memory as well
+        context.pipeline = pipeline.Pipeline(
+            context.checker, jobs,
+            utils.memory_dir() if in_memory else None, threads)
+
+    machine = statemachine.StateMachine(init_state)
+    try:
+        machine.run_all(context.extract_operations(position))
+    finally:
+        try:
+            if context.pipeline is not None:
+                context.pipeline.close(context)
+        finally:
+            context.file_handler.close()
+    # the budget might have been restored from a checkpoint
+    context.report.budget = context.budget
+    return context.report
+
+
+def estimate(log, checker, engine=DEFAULT_ENGINE, markers=None, seed=None,
+             logger=None, file_aliases=None, in_memory=False):
+    """
+    Estimates the cost of a run without checking the stores, the same as
+    the pmreorder command with the --estimate option.
+
+    :param log: The store log, see :func:`create_context`.
+    :type log: str or iterator
+    :param checker: The consistency checker, see :func:`create_context`.
+    :type checker: ConsistencyCheckerBase or callable
+    :param engine: The default engine specification.
+    :type engine: str
+    :param markers: The marker configuration, see :func:`get_markers`.
+    :type markers: dict or str
+    :param seed: The seed of the randomized engines, random if None.
+    :type seed: int
+    :param logger: The logger, by default nothing is logged.
+    :type logger: loggingfacility.LoggingBase
+    :param file_aliases: The files on which the stores are replayed, by
+        the names of the registered files.
+    :type file_aliases: dict
+    :param in_memory: Replay the stores on in-memory copies of the
+        registered files, which are left intact.
+    :type in_memory: bool
+    :return: The estimate, with the checker latency measured.
+    :rtype: estimate.Estimate
+    """
+    import estimate as estimate_module
+    context = create_context(log, checker, engine=engine, markers=markers,
+                             seed=seed, logger=logger,
+                             file_aliases=file_aliases, in_memory=in_memory)
+    context.estimate = estimate_module.Estimate()
+    try:
+        statemachine.StateMachine(statemachine.InitState(context)).run_all(
+            context.extract_operations())
+        context.estimate.calibrate(context.file_handler)
+    finally:
+        context.file_handler.close()
+    return context.estimate
@@ -0,0 +1,281 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from time import monotonic
+import json
+import multiprocessing
+import os
+
+import api
+import consistencycheckwrap
+import loggingfacility
+from report import Report
+
+# the keys of a manifest entry
+ENTRY_KEYS = ("log", "checker", "path", "name", "engine", "markers", "seed",
+              "file_aliases", "output", "output_level")
+
+# the consistency checkers loaded by the process, by their configuration
+_checkers = {}
+
+
+def _resolve(base_dir, name):
+    # the names relative to the manifest directory
+    return os.path.normpath(os.path.join(base_dir, name))
+
+
+class Entry:
+    """
+    A store log of the batch with the configuration of its run, the same
+    as given to a single pmreorder run with the corresponding options.
+
+    :ivar log: The name of the store log.
+    :type log: str
+    :ivar checker: The type of the consistency checker, "prog" or "lib".
+    :type checker: str
+    :ivar path: The path to the consistency checker and its arguments.
+    :type path: str
+    :ivar name: The name of the function of the "lib" checker.
+    :type name: str
+    :ivar engine: The default engine specification.
+    :type engine: str
+    :ivar markers: The marker configuration, see :func:`api.get_markers`.
+    :type markers: dict or str
+    :ivar seed: The seed of the randomized engines, random if None.
+    :type seed: int
+    :ivar file_aliases: The files on which the stores are replayed, by
+        the names of the registered files.
+    :type file_aliases: dict
+    :ivar output: The log file of the run, None to log nothing.
+    :type output: str
+    :ivar output_level: The level of the logged messages.
+    :type output_level: str
+    """
+    def __init__(self, log, path, checker="prog", name=None,
+                 engine=api.DEFAULT_ENGINE, markers=None, seed=None,
+                 file_aliases=None, output=None, output_level=None):
+        self.log = log
+        self.checker = checker
+        self.path = path
+        self.name = name
+        self.engine = engine
+        self.markers = markers
+        self.seed = seed
+        self.file_aliases = file_aliases
+        self.output = output
+        self.output_level = output_level
+
+    @staticmethod
+    def from_dict(data, base_dir):
+        """
+        Creates the entry described in the manifest.
+
+        The names of the store log, the log file, the checker program, the
+        marker config file and the files the stores are replayed on are
+        relative to the manifest directory.
+
+        :param data: The description of the entry.
+        :type data: dict
+        :param base_dir: The directory of the manifest.
+        :type base_dir: str
+        :return: The entry.
+        :rtype: Entry
+        :raises: ValueError when the description is invalid.
+        """
+        unknown = sorted(set(data) - set(ENTRY_KEYS))
+        if unknown:
+            raise ValueError("Unknown entry keys: {}".format(
+                ", ".join(unknown)))
+        for key in ("log", "path"):
+            if not isinstance(data.get(key), str):
+                raise ValueError("Entry without the {}".format(key))
+        data = dict(data)
+        if data["log"] == "-":
+            raise ValueError("The standard input cannot be read in a batch")
+        checker = data.get("checker", "prog")
+        if checker not in consistencycheckwrap.checkers:
+            raise ValueError("Invalid checker: {}".format(checker))
+        if checker == "lib" and data.get("name") is None:
+            raise ValueError("The lib checker requires the name")
+
+        data["log"] = _resolve(base_dir, data["log"])
+        program = data["path"].split(" ", 1)
+        program[0] = _resolve(base_dir, program[0])
+        data["path"] = " ".join(program)
+        if data.get("output") is not None:
+            data["output"] = _resolve(base_dir, data["output"])
+        aliases = data.get("file_aliases")
+        if aliases is not None:
+            if not isinstance(aliases, dict):
+                raise ValueError("Invalid file aliases: {}".format(aliases))
+            # the registered files are named as in the store log
+            data["file_aliases"] = {name: _resolve(base_dir, alias)
+                                    for name, alias in aliases.items()}
+        markers = data.get("markers")
+        if isinstance(markers, str) and \
+                os.path.isfile(_resolve(base_dir, markers)):
+            data["markers"] = _resolve(base_dir, markers)
+        return Entry(**data)
+
+    def to_dict(self):
+        """
+        Describes the configuration of the run.
+
+        :return: The description of the entry.
+        :rtype: dict
+        """
+        return {
+            "log": self.log,
+            "checker": self.checker,
+            "path": self.path,
+            "name": self.name,
+            "engine": self.engine,
+            "markers": self.markers,
+            "seed": self.seed,
+        }
+
+
+def load_manifest(filename):
+    """
+    Reads the entries of the batch.
+
+    The manifest is a json file holding the list of the entries, or
+    an object with the list under "entries" and the keys shared by all
+    entries under "defaults". Each entry is an object with the keys of
+    :data:`ENTRY_KEYS`, "log" and "path" are required.
+
+    :param filename: The name of the manifest.
+    :type filename: str
+    :return: The entries, in order.
+    :rtype: list of :class:`Entry`
+    :raises: ValueError when the manifest is invalid.
+    """
+    with open(filename) as manifest_file:
+        manifest = json.load(manifest_file)
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = manifest.get("defaults", {})
+        manifest = manifest.get("entries")
+    if not isinstance(manifest, list) or not isinstance(defaults, dict):
+        raise ValueError("Invalid manifest format")
+
+    base_dir = os.path.dirname(os.path.abspath(filename))
+    entries = []
+    for num, data in enumerate(manifest):
+        if not isinstance(data, dict):
+            raise ValueError("Invalid entry {}".format(num))
+        try:
+            entries.append(Entry.from_dict(dict(defaults, **data),
+                                           base_dir))
+        except (TypeError, ValueError) as e:
+            raise ValueError("Invalid entry {}: {}".format(num, e))
+    return entries
+
+
+def _get_checker(entry):
+    """
+    Returns the consistency checker of the entry, loaded once per process
+    and shared by all entries of the same checker configuration.
+    """
+    key = (entry.checker, entry.path, entry.name)
+    checker = _checkers.get(key)
+    if checker is None:
+        program = entry.path.split(" ", 1)[0]
+        if not os.path.exists(program):
+            raise ValueError("Invalid path: {}".format(program))
+        checker = consistencycheckwrap.get_checker(entry.checker,
+                                                   entry.path, entry.name)
+        _checkers[key] = checker
+    return checker
+
+
+def run_entry(entry, in_memory=False):
+    """
+    Checks the store log of the entry.
+
+    :param entry: The entry.
+    :type entry: Entry
+    :param in_memory: Replay the stores on in-memory copies of the
+        registered files.
+    :type in_memory: bool
+    :return: The description of the entry, with the time of the run in
+        seconds and the report of the run.
+    :rtype: dict
+    """
+    start = monotonic()
+    logger = None
+    try:
+        checker = _get_checker(entry)
+        if entry.output is not None:
+            logger = loggingfacility.get_logger(entry.output,
+                                                entry.output_level)
+        report = api.run(entry.log, checker, engine=entry.engine,
+                         markers=entry.markers, seed=entry.seed, logger=logger,
+                         file_aliases=entry.file_aliases,
+                         in_memory=in_memory)
+    except Exception as e:
+        # a broken entry does not stop the batch, it is reported as failed
+        report = Report()
+        report.add_error("{}: {}".format(type(e).__name__, e))
+    finally:
+        if logger is not None:
+            logger.close()
+
+    result = entry.to_dict()
+    result["seconds"] = monotonic() - start
+    result["report"] = report.to_dict()
+    return result
+
+
+def run_batch(entries, jobs=1, in_memory=False):
+    """
+    Checks the store logs of the entries.
+
+    The entries are run in the calling process one after another, or
+    handed out to a pool of *jobs* worker processes as they become idle.
+    Each process loads the consistency checker of a configuration only
+    once and reuses it for all entries.
+
+    :param entries: The entries of the batch.
+    :type entries: list of :class:`Entry`
+    :param jobs: The number of worker processes, 1 for none.
+    :type jobs: int
+    :param in_memory: Replay the stores on in-memory copies of the
+        registered files.
+    :type in_memory: bool
+    :return: The results of :func:`run_entry`, in the order of the entries,
+        as they are finished.
+    :rtype: iterator over dict
+    """
+    run = partial(run_entry, in_memory=in_memory)
+    if jobs == 1:
+        yield from map(run, entries)
+        return
+    with ProcessPoolExecutor(jobs,
+                             multiprocessing.get_context("fork")) as executor:
+        yield from executor.map(run, entries)
+
+
+def batch_report(results):
+    """
+    Consolidates the results of the entries.
+
+    The batch is consistent only if the report of every entry is.
+
+    :param results: The results of the entries, see :func:`run_entry`.
+    :type results: list of dict
+    :return: The consolidated report.
+    :rtype: dict
+    """
+    return {
+        "consistent": all(result["report"]["consistent"]
+                          for result in results),
+        "failures": sum(len(result["report"]["failures"])
+                        for result in results),
+        "errors": ["{}: {}".format(result["log"], error)
+                   for result in results
+                   for error in result["report"]["errors"]],
+        "entries": results,
+    }
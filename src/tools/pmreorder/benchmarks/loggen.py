@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+"""
+Generates synthetic store logs in the pmemcheck format, see the PMEMCHECK
+STORE LOG section of pmreorder(1), for benchmarking pmreorder.
+"""
+
+import argparse
+import json
+import os
+import random
+
+CACHE_LINE = 64
+BASE_ADDRESS = 0x10000000
+
+# the flush patterns: a flush of the cache line after each store, a flush
+# of each line once all stores of the epoch are made, or a single flush
+# of the range spanning all stores of the epoch
+FLUSH_PATTERNS = ["store", "epoch", "range"]
+
+
+class LogConfig:
+    """
+    Describes the generated log.
+
+    :ivar epochs: The number of epochs, i.e. of flush-fence barriers.
+    :type epochs: int
+    :ivar stores: The minimal and maximal number of stores per epoch.
+    :type stores: tuple of int
+    :ivar sizes: The sizes of the stores, drawn uniformly.
+    :type sizes: list of int
+    :ivar overlap: The probability that a store overwrites an address
+        already stored to in the epoch.
+    :type overlap: float
+    :ivar flush: The flush pattern, one of :data:`FLUSH_PATTERNS`.
+    :type flush: str
+    :ivar unflushed: The probability that a store is left unflushed.
+    :type unflushed: float
+    :ivar trace_depth: The number of frames of the store call traces.
+    :type trace_depth: int
+    :ivar sites: The number of distinct store call sites.
+    :type sites: int
+    :ivar marker_depth: The maximal nesting of the marker regions.
+    :type marker_depth: int
+    :ivar marker_epochs: The number of epochs in a marker region.
+    :type marker_epochs: int
+    :ivar files: The number of registered files.
+    :type files: int
+    :ivar file_size: The size of each registered file.
+    :type file_size: int
+    :ivar seed: The seed of the generator.
+    :type seed: int
+    """
+    def __init__(self, epochs=1000, stores=(1, 8), sizes=(8,), overlap=0.0,
+                 flush="store", unflushed=0.0, trace_depth=2, sites=16,
+                 marker_depth=0, marker_epochs=10, files=1,
+                 file_size=1 << 20, seed=0):
+        if flush not in FLUSH_PATTERNS:
+            raise ValueError("Unknown flush pattern: {}".format(flush))
+        if stores[0] < 1 or stores[0] > stores[1]:
+            raise ValueError("Invalid number of stores: {}".format(stores))
+        if max(sizes) > CACHE_LINE or file_size < CACHE_LINE:
+            raise ValueError("Stores larger than the files or cache lines")
+        self.epochs = epochs
+        self.stores = tuple(stores)
+        self.sizes = list(sizes)
+        self.overlap = overlap
+        self.flush = flush
+        self.unflushed = unflushed
+        self.trace_depth = trace_depth
+        self.sites = sites
+        self.marker_depth = marker_depth
+        self.marker_epochs = marker_epochs
+        self.files = files
+        self.file_size = file_size
+        self.seed = seed
+
+    def to_dict(self):
+        """
+        Describes the configuration with basic types.
+
+        :return: The configuration.
+        :rtype: dict
+        """
+        return dict(vars(self), stores=list(self.stores))
+
+
+def _trace(site, depth):
+    frames = ["0x{:x}: site_{} (bench.c:{})".format(0x1000 + site, site,
+                                                    site)]
+    for frame in range(1, depth):
+        frames.append("0x{:x}: caller_{} (bench.c:{})".format(
+            0x2000 + frame, frame, 1000 + frame))
+    return frames[:depth]
+
+
+def generate_operations(config, file_names):
+    """
+    Generates the logged operations.
+
+    :param config: The configuration of the log.
+    :type config: LogConfig
+    :param file_names: The names of the registered files.
+    :type file_names: list of str
+    :return: Yields the operations, without the separators.
+    :rtype: iterable of str
+    """
+    rand = random.Random(config.seed)
+    bases = [BASE_ADDRESS + num * (config.file_size + (1 << 20))
+             for num in range(config.files)]
+    yield "START"
+    for name, base in zip(file_names, bases):
+        yield "REGISTER_FILE;{};0x{:x};0x{:x};0x0".format(
+            name, base, config.file_size)
+
+    markers = []
+    for epoch in range(config.epochs):
+        if config.marker_depth and epoch % config.marker_epochs == 0:
+            # leave the innermost region and enter a new one at a random
+            # depth
+            if markers:
+                yield markers.pop() + ".END"
+            depth = rand.randint(1, config.marker_depth)
+            while len(markers) > depth - 1:
+                yield markers.pop() + ".END"
+            while len(markers) < depth:
+                markers.append("BENCH_MARKER_{}".format(len(markers)))
+                yield markers[-1] + ".BEGIN"
+
+        stored = []
+        lines = set()
+        for _ in range(rand.randint(*config.stores)):
+            size = rand.choice(config.sizes)
+            if stored and rand.random() < config.overlap:
+                address, end = rand.choice(stored)
+                address = min(address, end - size)
+            else:
+                base = rand.choice(bases)
+                offset = rand.randrange(0, config.file_size - size + 1,
+                                        size)
+                address = base + offset
+                stored.append((address, base + config.file_size))
+            value = rand.getrandbits(8 * size)
+            site = rand.randrange(config.sites)
+            yield ";".join(["STORE", "0x{:x}".format(address),
+                            "0x{:x}".format(value), "0x{:x}".format(size)] +
+                           _trace(site, config.trace_depth))
+            if rand.random() < config.unflushed:
+                continue
+            line = address & ~(CACHE_LINE - 1)
+            if config.flush == "store":
+                yield "FLUSH;0x{:x};0x{:x}".format(line, CACHE_LINE)
+            else:
+                lines.add(line)
+                lines.add((address + size - 1) & ~(CACHE_LINE - 1))
+        if config.flush == "epoch":
+            for line in sorted(lines):
+                yield "FLUSH;0x{:x};0x{:x}".format(line, CACHE_LINE)
+        elif config.flush == "range" and lines:
+            low = min(lines)
+            yield "FLUSH;0x{:x};0x{:x}".format(
+                low, max(lines) + CACHE_LINE - low)
+        yield "FENCE"
+
+    while markers:
+        yield markers.pop() + ".END"
+    yield "STOP"
+
+
+def generate(config, log_file, directory=None):
+    """
+    Generates the log and creates the registered files.
+
+    :param config: The configuration of the log.
+    :type config: LogConfig
+    :param log_file: The name of the generated log.
+    :type log_file: str
+    :param directory: The directory of the registered files, by default
+        the directory of the log.
+    :type directory: str
+    :return: The names of the registered files.
+    :rtype: list of str
+    """
+    if directory is None:
+        directory = os.path.dirname(os.path.abspath(log_file))
+    file_names = [os.path.join(directory, "bench_pool.{}".format(num))
+                  for num in range(config.files)]
+    for name in file_names:
+        with open(name, "wb") as pool:
+            pool.truncate(config.file_size)
+    with open(log_file, "w") as log:
+        log.write("|".join(generate_operations(config, file_names)))
+    return file_names
+
+
+def stores_range(text):
+    """
+    Parses the number of stores per epoch, e.g. 8 or 1-16.
+    """
+    low, _, high = text.partition("-")
+    return int(low), int(high or low)
+
+
+def sizes_list(text):
+    """
+    Parses the comma separated store sizes.
+    """
+    return [int(size) for size in text.split(",")]
+
+
+def add_arguments(parser):
+    """
+    Adds the options of the generator to the argument parser.
+
+    :param parser: The argument parser.
+    :type parser: argparse.ArgumentParser
+    :return: None
+    """
+    parser.add_argument("--epochs", type=int, default=1000,
+                        help="the number of epochs, default=1000")
+    parser.add_argument("--stores", type=stores_range, default=(1, 8),
+                        metavar="MIN-MAX",
+                        help="the number of stores per epoch, default=1-8")
+    parser.add_argument("--sizes", type=sizes_list, default=[8],
+                        metavar="SIZE,...",
+                        help="the sizes of the stores, default=8")
+    parser.add_argument("--overlap", type=float, default=0.0,
+                        help="the probability of overwriting an address " +
+                        "stored to in the epoch, default=0")
+    parser.add_argument("--flush", choices=FLUSH_PATTERNS, default="store",
+                        help="the flush pattern, default=store")
+    parser.add_argument("--unflushed", type=float, default=0.0,
+                        help="the probability of leaving a store " +
+                        "unflushed, default=0")
+    parser.add_argument("--trace-depth", type=int, default=2,
+                        help="the depth of the call traces, default=2")
+    parser.add_argument("--sites", type=int, default=16,
+                        help="the number of store call sites, default=16")
+    parser.add_argument("--marker-depth", type=int, default=0,
+                        help="the maximal nesting of the marker regions, " +
+                        "default=0")
+    parser.add_argument("--marker-epochs", type=int, default=10,
+                        help="the number of epochs per marker region, " +
+                        "default=10")
+    parser.add_argument("--files", type=int, default=1,
+                        help="the number of registered files, default=1")
+    parser.add_argument("--file-size", type=int, default=1 << 20,
+                        help="the size of the registered files, " +
+                        "default=1048576")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="the seed of the generator, default=0")
+
+
+def config_from_args(args):
+    """
+    Creates the configuration from the parsed options.
+
+    :param args: The options added by :func:`add_arguments`.
+    :type args: argparse.Namespace
+    :return: The configuration.
+    :rtype: LogConfig
+    """
+    return LogConfig(args.epochs, args.stores, args.sizes, args.overlap,
+                     args.flush, args.unflushed, args.trace_depth,
+                     args.sites, args.marker_depth, args.marker_epochs,
+                     args.files, args.file_size, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic pmemcheck store log")
+    parser.add_argument("log", help="the name of the generated log")
+    parser.add_argument("-d", "--directory",
+                        help="the directory of the registered files, " +
+                        "default=the directory of the log")
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        config = config_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    files = generate(config, args.log, args.directory)
+    print(json.dumps({"config": config.to_dict(), "files": files},
+                     indent=4))
+
+
+if __name__ == "__main__":
+    main()
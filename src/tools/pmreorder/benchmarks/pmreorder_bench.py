@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+"""
+Benchmarks pmreorder on synthetic store logs, see loggen.py.
+
+Measures the parse throughput of the store log, the enumeration rate of
+the reorder engines, the replay rate of the stores and the end-to-end time
+of a run with a stub checker. The results are printed and saved as json,
+so that they can be compared between versions with --baseline.
+"""
+
+from time import monotonic
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import loggen  # noqa: E402
+from binaryoutputhandler import BinaryOutputHandler  # noqa: E402
+from consistencycheckwrap import ConsistencyCheckerBase  # noqa: E402
+import loggingfacility  # noqa: E402
+import memoryoperations  # noqa: E402
+import opscontext  # noqa: E402
+import reorderengines  # noqa: E402
+import statemachine  # noqa: E402
+import storelog  # noqa: E402
+
+RESULTS_VERSION = 1
+
+# the engines whose enumeration rate is measured, with the maximal number
+# of stores of the barriers they enumerate
+ENGINES = [
+    ("ReorderFull", 6),
+    ("ReorderAccumulative", None),
+    ("ReorderReverseAccumulative", None),
+    ("ReorderPartial(max_seq=10)", None),
+    ("ReorderSlice(start=0, stop=1024)", 16),
+    ("ReorderMissing(k=1)", None),
+    ("NoReorderDoCheck", None),
+]
+
+
+class StubChecker(ConsistencyCheckerBase):
+    """
+    Counts the checks and reports every file as consistent.
+
+    :ivar calls: The number of checks.
+    :type calls: int
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def check_consistency(self, filename):
+        self.calls += 1
+        return 0
+
+
+def _store_lists(log_file):
+    """
+    Collects the flushed stores of each barrier of the log.
+    """
+    operations = storelog.open_log(log_file)
+    barriers = []
+    stores = []
+    for elem in operations:
+        if elem.startswith("STORE"):
+            stores.append(memoryoperations.Store(elem))
+        elif elem.startswith("FENCE") and stores:
+            barriers.append(stores)
+            stores = []
+    return barriers
+
+
+def _best(repeat, function):
+    """
+    Runs the function repeatedly, returns the shortest time and the result
+    of the last run.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = monotonic()
+        result = function()
+        elapsed = monotonic() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_parse(log_file, repeat):
+    """
+    Measures reading the log and creating the operations.
+    """
+    def parse():
+        context = opscontext.OpsContext(log_file, StubChecker(),
+                                        loggingfacility.LoggingBase(),
+                                        "NoReorderNoCheck", None, 0)
+        count = 0
+        for _ in context.extract_operations():
+            count += 1
+        return count
+
+    seconds, count = _best(repeat, parse)
+    size = os.path.getsize(log_file)
+    return {
+        "seconds": seconds,
+        "operations": count,
+        "operations_per_second": count / seconds,
+        "megabytes_per_second": size / seconds / (1 << 20),
+    }
+
+
+def bench_engines(barriers, repeat, limit):
+    """
+    Measures the enumeration of the sequences by each engine.
+    """
+    results = {}
+    for spec, max_stores in ENGINES:
+        engine = reorderengines.get_engine(spec, 0)
+        selected = [stores if max_stores is None else stores[:max_stores]
+                    for stores in barriers]
+
+        def enumerate_sequences():
+            sequences = stores = 0
+            for store_list in selected:
+                for seq in engine.generate_sequence(store_list):
+                    sequences += 1
+                    stores += len(seq)
+                    if sequences >= limit:
+                        return sequences, stores
+            return sequences, stores
+
+        seconds, (sequences, stores) = _best(repeat, enumerate_sequences)
+        results[spec] = {
+            "seconds": seconds,
+            "sequences": sequences,
+            "sequences_per_second": sequences / seconds if seconds else None,
+            "stores_per_second": stores / seconds if seconds else None,
+        }
+    return results
+
+
+def bench_replay(barriers, file_names, config, repeat):
+    """
+    Measures applying and reverting the stores of each barrier.
+    """
+    def replay():
+        handler = BinaryOutputHandler(StubChecker())
+        for num, name in enumerate(file_names):
+            base = loggen.BASE_ADDRESS + num * (config.file_size + (1 << 20))
+            handler.add_file(name, base, config.file_size)
+        stores = 0
+        for store_list in barriers:
+            handler.do_stores(store_list)
+            for op in reversed(store_list):
+                handler.do_revert(op)
+            stores += len(store_list)
+        return stores
+
+    seconds, stores = _best(repeat, replay)
+    return {
+        "seconds": seconds,
+        "stores": stores,
+        "stores_per_second": stores / seconds,
+    }
+
+
+def bench_end_to_end(log_file, engine, repeat):
+    """
+    Measures the whole run with the stub checker.
+    """
+    def run():
+        checker = StubChecker()
+        context = opscontext.OpsContext(log_file, checker,
+                                        loggingfacility.LoggingBase(),
+                                        engine, None, 0)
+        statemachine.StateMachine(statemachine.InitState(context)).run_all(
+            context.extract_operations())
+        return context.barrier, checker.calls
+
+    seconds, (barriers, checks) = _best(repeat, run)
+    return {
+        "engine": engine,
+        "seconds": seconds,
+        "barriers": barriers,
+        "checks": checks,
+        "checks_per_second": checks / seconds,
+    }
+
+
+def _revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _rates(results, prefix=""):
+    """
+    Flattens the rates of the results, e.g. parse.operations_per_second.
+    """
+    rates = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            rates.update(_rates(value, prefix + key + "."))
+        elif key.endswith("_per_second") and value is not None:
+            rates[prefix + key] = value
+    return rates
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the rates with the baseline results.
+
+    :param results: The current results.
+    :type results: dict
+    :param baseline: The baseline results.
+    :type baseline: dict
+    :param threshold: The relative slowdown reported as a regression.
+    :type threshold: float
+    :return: The names of the regressed rates.
+    :rtype: list of str
+    """
+    current = _rates(results["results"])
+    previous = _rates(baseline["results"])
+    regressions = []
+    for name in sorted(current):
+        if name not in previous or not previous[name]:
+            continue
+        change = current[name] / previous[name] - 1
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(name)
+        print("{:<64} {:>+8.1%}{}".format(name, change,
+                                          "  REGRESSION" if regressed
+                                          else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark pmreorder on a synthetic store log")
+    parser.add_argument("-o", "--output",
+                        help="save the results as a json file")
+    parser.add_argument("--baseline",
+                        help="compare the rates with the results saved " +
+                        "in the given json file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="the relative slowdown reported as " +
+                        "a regression, default=0.1")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="the number of runs of each benchmark, the " +
+                        "fastest one is reported, default=5")
+    parser.add_argument("--engine", default="ReorderPartial(max_seq=10)",
+                        help="the engine of the end-to-end run, " +
+                        "default=ReorderPartial(max_seq=10)")
+    parser.add_argument("--max-sequences", type=int, default=100000,
+                        help="the number of sequences enumerated by each " +
+                        "engine, default=100000")
+    parser.add_argument("--work-dir",
+                        help="the directory of the log and the files, " +
+                        "a temporary one by default")
+    loggen.add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        config = loggen.config_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="pmreorder_bench")
+    log_file = os.path.join(work_dir, "bench.log")
+    file_names = loggen.generate(config, log_file)
+    barriers = _store_lists(log_file)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config.to_dict(),
+        "results": {
+            "parse": bench_parse(log_file, args.repeat),
+            "engines": bench_engines(barriers, args.repeat,
+                                     args.max_sequences),
+            "replay": bench_replay(barriers, file_names, config,
+                                   args.repeat),
+            "end_to_end": bench_end_to_end(log_file, args.engine,
+                                           args.repeat),
+        },
+    }
+    if args.work_dir is None:
+        for name in file_names + [log_file]:
+            os.remove(name)
+        os.rmdir(work_dir)
+
+    print(json.dumps(results["results"], indent=4))
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=4)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright 2018, Intel Corporation
 
+import os
 import utils
 from reorderexceptions import InconsistentFileException
 
@@ -14,17 +15,25 @@ class BinaryOutputHandler:
 
     :ivar _files: A list of registered files, most recent last.
     :type _files: list
+    :ivar in_memory: Whether the stores are replayed on in-memory copies
+        of the registered files instead of the files themselves.
+    :type in_memory: bool
     """
 
-    def __init__(self, checker):
+    def __init__(self, checker, in_memory=False):
         """
         Binary handler constructor.
 
         :param checker: consistency checker object
         :type checker: ConsistencyCheckerBase
+        :param in_memory: Replay the stores on in-memory copies of the
+            registered files, see :class:`BinaryFile`.
+        :type in_memory: bool
         """
         self._files = []
         self._checker = checker
+        self._track_pages = False
+        self.in_memory = in_memory
 
     def add_file(self, file, map_base, size):
         """
@@ -38,7 +47,19 @@ class BinaryOutputHandler:
         :type size: int
         :return: None
         """
-        self._files.append(BinaryFile(file, map_base, size, self._checker))
+        self._files.append(BinaryFile(file, map_base, size, self._checker,
+                                      self.in_memory))
+        if self._track_pages:
+            self._files[-1].dirty = set()
+
+    def has_files(self):
+        """
+        Checks whether any file is registered.
+
+        :return: True if at least one file is registered.
+        :rtype: bool
+        """
+        return bool(self._files)
 
     def remove_file(self, file):
         """Remove file from :attr:`_files`.
@@ -50,6 +71,152 @@ class BinaryOutputHandler:
         for bf in self._files:
             if bf.file_name is file:
                 self._files.remove(bf)
+                bf.close()
+
+    def close(self):
+        """
+        Unmaps all registered files, the in-memory copies are released.
+
+        :return: None
+        """
+        for bf in self._files:
+            bf.close()
+        self._files = []
+
+    def save_images(self, directory):
+        """
+        Saves images of all registered files.
+
+        :param directory: The directory to which the images are saved.
+        :type directory: str
+        :return: The description of the registered files, which allows
+            to restore them with :func:`restore_images`.
+        :rtype: list of tuples
+        """
+        files = []
+        for num, bf in enumerate(self._files):
+            image = "image.{}".format(num)
+            bf.save_image(os.path.join(directory, image))
+            files.append((bf.file_name, bf.get_base_address(),
+                          bf.get_max_address() - bf.get_base_address(),
+                          image))
+        return files
+
+    def restore_images(self, files, directory):
+        """
+        Registers the files and restores their contents from images.
+
+        :param files: The description returned by :func:`save_images`.
+        :type files: list of tuples
+        :param directory: The directory holding the images.
+        :type directory: str
+        :return: None
+        """
+        for file, map_base, size, image in files:
+            self.add_file(file, map_base, size)
+            self._files[-1].load_image(os.path.join(directory, image))
+
+    def clone_files(self, directory, suffix):
+        """
+        Makes copies of all registered files, e.g. to be checked
+        concurrently with the further changes of the files.
+
+        :param directory: The function returning the directory to which
+            the given file is copied.
+        :type directory: callable
+        :param suffix: The suffix distinguishing the copies.
+        :type suffix: str
+        :return: The copies, as the names of the registered files and of
+            their copies, the base addresses and the sizes.
+        :rtype: list of tuples
+        """
+        files = []
+        for bf in self._files:
+            clone = os.path.join(directory(bf.file_name), "{}.{}".format(
+                os.path.basename(bf.file_name), suffix))
+            bf.clone(clone)
+            files.append((bf.file_name, clone, bf.get_base_address(),
+                          bf.get_max_address() - bf.get_base_address()))
+        return files
+
+    def track_pages(self):
+        """
+        Starts tracking the pages of the registered files changed for good,
+        see :meth:`save_snapshot`.
+
+        :return: None
+        """
+        self._track_pages = True
+        for bf in self._files:
+            bf.dirty = set()
+
+    def forget_pages(self):
+        """
+        Forgets the changed pages, once the current contents of the files
+        are known to be saved elsewhere.
+
+        :return: None
+        """
+        for bf in self._files:
+            if bf.dirty is not None:
+                bf.dirty.clear()
+
+    def save_snapshot(self, directory, base_files):
+        """
+        Saves the registered files, as full images or as the pages changed
+        since the base snapshot.
+
+        :param directory: The directory to which the files are saved.
+        :type directory: str
+        :param base_files: The names of the files saved in the base
+            snapshot, the other files are saved as full images.
+        :type base_files: set of str
+        :return: The description of the registered files, which allows
+            to restore them with :func:`restore_snapshot`.
+        :rtype: list of tuples
+        """
+        files = []
+        for num, bf in enumerate(self._files):
+            size = bf.get_max_address() - bf.get_base_address()
+            if bf.file_name in base_files and bf.dirty is not None:
+                image = "pages.{}".format(num)
+                pages = bf.save_pages(os.path.join(directory, image))
+            else:
+                image = "image.{}".format(num)
+                pages = None
+                bf.save_image(os.path.join(directory, image))
+                if bf.dirty is not None:
+                    bf.dirty.clear()
+            files.append((bf.file_name, bf.get_base_address(), size,
+                          image, pages))
+        return files
+
+    def restore_snapshot(self, files, directory):
+        """
+        Restores the files saved with :func:`save_snapshot`.
+
+        The files saved as full images are registered, unless already
+        registered, the changed pages are applied to the registered files.
+
+        :param files: The description returned by :func:`save_snapshot`.
+        :type files: list of tuples
+        :param directory: The directory holding the snapshot.
+        :type directory: str
+        :return: None
+        """
+        for file, map_base, size, image, pages in files:
+            bf = None
+            for registered in self._files:
+                if registered.file_name == file:
+                    bf = registered
+                    break
+            if pages is not None:
+                bf.load_pages(os.path.join(directory, image), pages)
+                continue
+            if bf is None:
+                self.add_file(file, map_base, size)
+                bf = self._files[-1]
+            bf.load_image(os.path.join(directory, image))
 
     def do_store(self, store_op):
         """
@@ -73,6 +240,38 @@ class BinaryOutputHandler:
                           "No suitable file found for store {}"
                           .format(store_op))
 
+    def do_stores(self, store_list, save=True):
+        """
+        Performs the stores in bulk.
+
+        The stores are dispatched to the files in order, adjacent stores are
+        written to each file at once and each file is synced only once.
+
+        :param store_list: The stores to be performed, in order.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :param save: Record the old values, so that the stores can be
+            reverted with :meth:`do_revert`.
+        :type save: bool
+        :return: None
+        :raises: Generic exception - to be precised later.
+        """
+        per_file = {}
+        last = None
+        for store_op in store_list:
+            if last is None or utils.range_cmp(store_op, last) != 0:
+                last = None
+                for bf in self._files:
+                    if utils.range_cmp(store_op, bf) == 0:
+                        last = bf
+                        break
+                if last is None:
+                    raise OSError(
+                                  "No suitable file found for store {}"
+                                  .format(store_op))
+            per_file.setdefault(last, []).append(store_op)
+        for bf, stores in per_file.items():
+            bf.do_stores(stores, save)
+
     def do_revert(self, store_op):
         """
         Reverts a store made to a file.
@@ -114,8 +313,19 @@ class BinaryFile(utils.Rangeable):
     It is a handler for binary file operations. Internally it
     uses mmap to write to and read from the file.
 
+    The stores may be replayed on an in-memory copy of the file instead,
+    a memfd, or an unlinked file on tmpfs where memfd is not supported,
+    filled with the data regions of the file. The file itself is then
+    never modified and the consistency checker gets the copy, as
+    the /proc/<pid>/fd/<fd> path.
+
     :ivar _file_name: Full path of the mapped file.
     :type _file_name: str
+    :ivar _path: The path of the file the stores are replayed on.
+    :type _path: str
+    :ivar _fd: The descriptor of the in-memory copy, None if the file
+        is mapped directly.
+    :type _fd: int
     :ivar _map_base: Base address of the mapped file.
     :type _map_base: int
     :ivar _map_max: Max address of the mapped file.
@@ -124,9 +334,13 @@ class BinaryFile(utils.Rangeable):
     :type _file_map: mmap.mmap
     :ivar _checker: consistency checker object
     :type _checker: ConsistencyCheckerBase
+    :ivar dirty: The indices of the pages changed by the stores which are
+        not to be reverted, None if not tracked.
+    :type dirty: set of int
     """
+    page_size = 4096
 
-    def __init__(self, file_name, map_base, size, checker):
+    def __init__(self, file_name, map_base, size, checker, in_memory=False):
         """
         Initializes the binary file handler.
 
@@ -138,18 +352,34 @@ class BinaryFile(utils.Rangeable):
         :type size: int
         :param checker: consistency checker object
         :type checker: ConsistencyCheckerBase
+        :param in_memory: Replay the stores on an in-memory copy.
+        :type in_memory: bool
         :return: None
         """
         self._file_name = file_name
         self._map_base = map_base
         self._map_max = map_base + size
+        self._path = file_name
+        self._fd = None
+        if in_memory:
+            self._fd, self._path = utils.memory_file(
+                os.path.basename(file_name))
+            utils.copy_sparse(file_name, self._fd)
         # TODO consider mmaping only necessary parts on demand
-        self._file_map = utils.memory_map(file_name)
+        self._file_map = utils.memory_map(self._path)
         self._checker = checker
+        self.dirty = None
 
     def __str__(self):
         return self._file_name
 
+    @property
+    def file_name(self):
+        """
+        Full path of the mapped file.
+        """
+        return self._file_name
+
     def do_store(self, store_op):
         """
         Perform the store on the file.
@@ -168,6 +398,59 @@ class BinaryFile(utils.Rangeable):
         self._file_map[base_off:max_off] = store_op.new_value
         self._file_map.flush(base_off & ~4095, 4096)
 
+    def do_stores(self, store_list, save=True):
+        """
+        Performs the stores in bulk.
+
+        Runs of adjacent stores are coalesced into a single write and the
+        file is synced once, after all stores.
+
+        :param store_list: The stores to be performed, in order.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :param save: Record the old values for reverting. The stores made
+            without saving are never reverted, their pages are marked as
+            changed if tracked.
+        :type save: bool
+        :return: None
+        """
+        if not store_list:
+            return
+        file_map = self._file_map
+        dirty = None if save else self.dirty
+        low = high = None
+        run_start = run_end = None
+        run = []
+
+        def write_run():
+            if save:
+                old = file_map[run_start:run_end]
+                offset = 0
+                for st in run:
+                    st.old_value = old[offset:offset + st.size]
+                    offset += st.size
+            file_map[run_start:run_end] = b"".join(st.new_value
+                                                   for st in run)
+            if dirty is not None:
+                dirty.update(range(run_start // self.page_size,
+                                   (run_end - 1) // self.page_size + 1))
+
+        for store_op in store_list:
+            base_off = store_op.get_base_address() - self._map_base
+            max_off = store_op.get_max_address() - self._map_base
+            low = base_off if low is None else min(low, base_off)
+            high = max_off if high is None else max(high, max_off)
+            if run and base_off == run_end:
+                run.append(store_op)
+                run_end = max_off
+                continue
+            if run:
+                write_run()
+            run = [store_op]
+            run_start, run_end = base_off, max_off
+        write_run()
+        low &= ~4095
+        file_map.flush(low, high - low)
+
     def do_revert(self, store_op):
         """
         Reverts the store.
@@ -186,6 +469,74 @@ class BinaryFile(utils.Rangeable):
         self._file_map[base_off:max_off] = store_op.old_value
         self._file_map.flush(base_off & ~4095, 4096)
 
+    def save_image(self, filename):
+        """
+        Save the current contents of the file.
+
+        :param filename: The file to which the image is saved.
+        :type filename: str
+        :return: None
+        """
+        utils.save_image(self._file_map, filename)
+
+    def load_image(self, filename):
+        """
+        Overwrite the contents of the file with a saved image.
+
+        :param filename: The file holding the image.
+        :type filename: str
+        :return: None
+        """
+        utils.load_image(filename, self._file_map)
+
+    def clone(self, filename):
+        """
+        Copies the current contents of the file, sharing its extents
+        copy-on-write if the filesystem supports it.
+
+        :param filename: The name of the copy.
+        :type filename: str
+        :return: None
+        """
+        if not utils.reflink(self._path, filename):
+            utils.save_image(self._file_map, filename)
+
+    def save_pages(self, filename):
+        """
+        Saves the changed pages and stops tracking them.
+
+        :param filename: The file to which the pages are saved.
+        :type filename: str
+        :return: The indices of the saved pages, in the order of saving.
+        :rtype: list of int
+        """
+        pages = sorted(self.dirty)
+        with open(filename, "wb") as image:
+            for page in pages:
+                offset = page * self.page_size
+                image.write(self._file_map[offset:offset + self.page_size])
+        self.dirty.clear()
+        return pages
+
+    def load_pages(self, filename, pages):
+        """
+        Overwrites the pages of the file with the saved ones.
+
+        :param filename: The file holding the pages.
+        :type filename: str
+        :param pages: The indices of the saved pages, as returned by
+            :meth:`save_pages`.
+        :type pages: list of int
+        :return: None
+        """
+        file_map = self._file_map
+        with open(filename, "rb") as image:
+            for page in pages:
+                offset = page * self.page_size
+                end = min(offset + self.page_size, len(file_map))
+                file_map[offset:end] = image.read(end - offset)
+        file_map.flush()
+
     def check_consistency(self):
         """
         Check consistency of the file.
@@ -193,7 +544,18 @@ class BinaryFile(utils.Rangeable):
         :return: True if consistent, False otherwise.
         :rtype: bool
         """
-        return self._checker.check_consistency(self._file_name) == 0
+        return self._checker.check_consistency(self._path) == 0
+
+    def close(self):
+        """
+        Unmaps the file and releases its in-memory copy.
+
+        :return: None
+        """
+        self._file_map.close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
 
     def get_base_address(self):
         """
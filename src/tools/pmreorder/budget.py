@@ -0,0 +1,226 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+from time import monotonic
+
+import reorderengines
+from reorderexceptions import InconsistentFileException
+
+
+class BudgetScheduler:
+    """
+    Spreads a global budget of consistency checks across the barriers.
+
+    The budget is given either as the number of checker invocations or as
+    the wall-clock time, which is converted to the number of invocations
+    using the measured checker latency. Each checked barrier gets a fair
+    share of the remaining budget. Barriers for which the configured engine
+    generates no more sequences than the share are checked exhaustively,
+    the others are downgraded to the accumulative engine or, if that is
+    still too expensive, to the random partial engine. Once the budget is
+    spent, the remaining barriers are not checked.
+
+    :ivar _budget: The total budget.
+    :type _budget: float
+    :ivar _unit: The unit of the budget, "calls" or "seconds".
+    :type _unit: str
+    :ivar _calls: The number of checker invocations made so far.
+    :type _calls: int
+    :ivar _check_time: The time spent in the checker so far.
+    :type _check_time: float
+    :ivar _elapsed: The wall-clock time of the previous run segments,
+        in case of a resumed run.
+    :type _elapsed: float
+    :ivar _barriers: The number of barriers seen so far.
+    :type _barriers: int
+    :ivar _checked: The number of barriers checked so far.
+    :type _checked: int
+    :ivar _allocation: The engine allocated to the current barrier.
+    :type _allocation: tuple
+    """
+    units = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+    def __init__(self, budget, unit="calls"):
+        """
+        Initializes the scheduler.
+
+        :param budget: The total budget.
+        :type budget: float
+        :param unit: The unit of the budget, "calls" or "seconds".
+        :type unit: str
+        """
+        self._budget = budget
+        self._unit = unit
+        self._calls = 0
+        self._check_time = 0.0
+        self._elapsed = 0.0
+        self._start = monotonic()
+        self._barriers = 0
+        self._checked = 0
+        self._allocation = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_elapsed"] = self.elapsed()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._start = monotonic()
+
+    @staticmethod
+    def parse(text):
+        """
+        Creates the scheduler from the budget description.
+
+        :param text: The number of checker invocations, e.g. "1000",
+            or the time with a unit suffix, e.g. "90s", "30m", "2h".
+        :type text: str
+        :return: The budget scheduler.
+        :rtype: BudgetScheduler
+        :raises: ValueError when the description is malformed.
+        """
+        text = text.strip()
+        if text.isdigit():
+            return BudgetScheduler(int(text))
+        suffix = text[-1:]
+        if suffix not in BudgetScheduler.units or not suffix:
+            raise ValueError("Invalid budget: {}".format(text))
+        return BudgetScheduler(float(text[:-1]) *
+                               BudgetScheduler.units[suffix], "seconds")
+
+    def __str__(self):
+        if self._unit == "calls":
+            return "{} of {} checker calls".format(self._calls,
+                                                   int(self._budget))
+        return "{:.1f} of {:.1f} seconds ({} checker calls)".format(
+            self.elapsed(), self._budget, self._calls)
+
+    def elapsed(self):
+        """
+        Returns the wall-clock time of the run.
+
+        :return: The time in seconds.
+        :rtype: float
+        """
+        return self._elapsed + monotonic() - self._start
+
+    def latency(self):
+        """
+        Returns the mean latency of the checker.
+
+        :return: The latency in seconds, None if not measured yet.
+        :rtype: float
+        """
+        if self._calls == 0:
+            return None
+        return self._check_time / self._calls
+
+    def calibrate(self, file_handler):
+        """
+        Measures the checker latency on the current state of the files.
+
+        :param file_handler: The handler of the registered files.
+        :type file_handler: binaryoutputhandler.BinaryOutputHandler
+        :return: None
+        """
+        start = monotonic()
+        try:
+            file_handler.check_consistency()
+        except InconsistentFileException:
+            pass
+        self.consume(monotonic() - start)
+
+    def consume(self, check_time):
+        """
+        Records a single checker invocation.
+
+        :param check_time: The duration of the invocation in seconds.
+        :type check_time: float
+        :return: None
+        """
+        self._calls += 1
+        self._check_time += check_time
+
+    def remaining(self):
+        """
+        Returns the remaining budget as the number of checker invocations.
+
+        :return: The number of invocations.
+        :rtype: float
+        """
+        if self._unit == "calls":
+            return self._budget - self._calls
+        latency = self.latency() or 0.0
+        remaining_time = self._budget - self.elapsed()
+        if latency == 0.0:
+            return float("inf") if remaining_time > 0 else 0
+        return remaining_time / latency
+
+    def allocate(self, context, barrier, engine, store_list):
+        """
+        Chooses the reorder engine to be used at the given barrier.
+
+        :param context: The reordering context.
+        :type context: opscontext.OpsContext
+        :param barrier: The index of the barrier.
+        :type barrier: int
+        :param engine: The configured reorder engine.
+        :param store_list: The stores to be reordered.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :return: The engine to be used, None if the barrier is not to be
+            checked, and the name or specification of the engine.
+        :rtype: tuple
+        """
+        if self._allocation is not None and self._allocation[0] == barrier:
+            return self._allocation[1:]
+
+        if self._unit == "seconds" and self.latency() is None:
+            self.calibrate(context.file_handler)
+
+        self._barriers += 1
+        self._checked += 1
+        # the barriers outside of the checked regions also end with fences,
+        # scale their number by the ratio of the checked barriers so far
+        ratio = self._checked / self._barriers
+        remaining_barriers = max(1.0, context.remaining_fences() * ratio)
+        remaining = self.remaining()
+        share = remaining / remaining_barriers
+
+        length = len(store_list)
+        name = reorderengines.get_engine_name(engine)
+        count = engine.count_sequences(length)
+        if count <= share:
+            allocation = (engine, name)
+        elif remaining < 1:
+            allocation = (None, name)
+            context.report.add_downgrade(barrier, name, None, length)
+            context.logger.warning(
+                "Budget exhausted, barrier {} with {} stores not checked"
+                .format(barrier, length))
+        else:
+            accumulative = reorderengines.AccumulativeReorderEngine()
+            if accumulative.count_sequences(length) <= share:
+                spec = "ReorderAccumulative"
+            else:
+                spec = "ReorderPartial(max_seq={})".format(
+                    max(1, int(share)))
+            downgraded = reorderengines.get_engine(spec, context.seed)
+            if hasattr(downgraded, "reseed"):
+                downgraded.reseed(barrier)
+            allocation = (downgraded, spec)
+            context.report.add_downgrade(barrier, name, spec, length)
+            context.logger.warning(
+                "Barrier {} with {} stores: engine {} downgraded to {}"
+                .format(barrier, length, name, spec))
+
+        self._allocation = (barrier,) + allocation
+        return allocation
+
+    def skip(self):
+        """
+        Records a barrier which is not checked.
+
+        :return: None
+        """
+        self._barriers += 1
@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+import os
+import pickle
+import shutil
+from time import monotonic
+
+import statemachine
+
+
+class Checkpointer:
+    """
+    Periodically saves the progress of the reordering.
+
+    Each checkpoint is kept in a separate subdirectory of the checkpoint
+    directory, along with the images of the registered files. The name of
+    the most recent complete checkpoint is kept in the *latest* file, which
+    is replaced only after the checkpoint has been fully written.
+
+    :ivar _directory: The checkpoint directory.
+    :type _directory: str
+    :ivar _interval: The minimal time between checkpoints, in seconds.
+    :type _interval: float
+    :ivar _last: The time of the last checkpoint.
+    :type _last: float
+    :ivar _generation: The number of the last written checkpoint.
+    :type _generation: int
+    """
+    version = 2
+    latest = "latest"
+    state = "state"
+
+    def __init__(self, directory, interval):
+        """
+        Initializes the checkpoint writer.
+
+        :param directory: The checkpoint directory.
+        :type directory: str
+        :param interval: The minimal time between checkpoints, in seconds.
+        :type interval: float
+        """
+        self._directory = directory
+        self._interval = interval
+        self._last = monotonic()
+        self._generation = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def due(self):
+        """
+        Checks whether it is time for the next checkpoint.
+
+        :return: True if the checkpoint interval has elapsed.
+        :rtype: bool
+        """
+        return monotonic() - self._last >= self._interval
+
+    def save(self, context, pending=None):
+        """
+        Saves the checkpoint of the reordering.
+
+        The registered files have to hold the state of the persistent
+        memory at the current position in the log, i.e. no sequence of
+        stores may be applied at the moment.
+
+        :param context: The reordering context.
+        :type context: opscontext.OpsContext
+        :param pending: The barrier which is being processed, as the
+            list of its stores and the index of the next sequence to
+            be checked. None if the current barrier has been processed.
+        :type pending: tuple
+        :return: None
+        """
+        self._generation += 1
+        name = "checkpoint.{}".format(self._generation)
+        path = os.path.join(self._directory, name)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+
+        position = context.position if pending else context.position + 1
+        engines, default_engine = context.engines()
+        state = {
+            "version": self.version,
+            "generation": self._generation,
+            "position": position,
+            "pending": pending,
+            "trans_stores": statemachine.State.trans_stores,
+            "stack_engines": context.stack_engines,
+            "reorder_engine": context.reorder_engine,
+            # pickled along with the report, so the restored engines share
+            # the restored coverage and keep their state
+            "engines": engines,
+            "default_engine": default_engine,
+            "test_on_barrier": context.test_on_barrier,
+            "seed": context.seed,
+            "barrier": context.barrier,
+            "report": context.report,
+            "budget": context.budget,
+            "files": context.file_handler.save_images(path),
+        }
+        with open(os.path.join(path, self.state), "wb") as state_file:
+            pickle.dump(state, state_file, pickle.HIGHEST_PROTOCOL)
+
+        latest = os.path.join(self._directory, self.latest)
+        with open(latest + ".tmp", "w") as latest_file:
+            latest_file.write(name)
+        os.replace(latest + ".tmp", latest)
+
+        previous = os.path.join(self._directory,
+                                "checkpoint.{}".format(self._generation - 1))
+        shutil.rmtree(previous, ignore_errors=True)
+        self._last = monotonic()
+        context.logger.info("Checkpoint {} saved at position {}"
+                            .format(self._generation, position))
+
+    def restore(self, context):
+        """
+        Restores the reordering context from the most recent checkpoint.
+
+        :param context: The reordering context, without registered files.
+        :type context: opscontext.OpsContext
+        :return: The state from which the reordering is to be resumed and
+            the position of the first operation to be processed, or None
+            if there is no checkpoint.
+        :rtype: tuple
+        """
+        latest = os.path.join(self._directory, self.latest)
+        if not os.path.exists(latest):
+            return None
+        with open(latest) as latest_file:
+            path = os.path.join(self._directory, latest_file.read().strip())
+        with open(os.path.join(path, self.state), "rb") as state_file:
+            state = pickle.load(state_file)
+        if state["version"] != self.version:
+            raise ValueError("Unsupported checkpoint version: {}"
+                             .format(state["version"]))
+
+        self._generation = state["generation"]
+        statemachine.State.trans_stores = state["trans_stores"]
+        context.stack_engines[:] = state["stack_engines"]
+        context.reorder_engine = state["reorder_engine"]
+        context.test_on_barrier = state["test_on_barrier"]
+        context.seed = state["seed"]
+        context.barrier = state["barrier"]
+        context.report = state["report"]
+        context.restore_engines(state["engines"], state["default_engine"])
+        if context.budget is not None and state["budget"] is not None:
+            context.budget = state["budget"]
+        context.file_handler.restore_images(state["files"], path)
+        context.logger.info("Resuming from checkpoint {} at position {}"
+                            .format(self._generation, state["position"]))
+
+        return (statemachine.ResumedState(context, state["pending"]),
+                state["position"])
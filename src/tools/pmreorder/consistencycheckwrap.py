@@ -4,6 +4,8 @@
 from sys import exit
 from os import path
 from ctypes import cdll, c_char_p, c_int
+from time import monotonic
+from metrics import metrics
 import os
 
 checkers = ["prog", "lib"]
@@ -25,10 +27,13 @@ class LibChecker(ConsistencyCheckerBase):
 
     The function has to be in a shared library. It is then used to check
     consistency of an arbitrary file. The function has to take a file name
-    as the only parameter and return an int: 0 for inconsistent, 1 for
-    consistent. The prototype of the function::
+    as the only parameter and return an int: 0 for consistent, 1 for
+    inconsistent. The prototype of the function::
 
         int func_name(const char* file_name)
+
+    The GIL is released while the function runs, so the function may check
+    many files concurrently in threads if it is thread-safe.
     """
 
     def __init__(self, library_name, func_name):
@@ -53,13 +58,17 @@ class LibChecker(ConsistencyCheckerBase):
 
         :param filename: The full name of the file to be checked.
         :type filename: str
-        :return: 1 if file is consistent, 0 otherwise.
+        :return: 0 if file is consistent, 1 otherwise.
         :rtype: int
         :raises: Generic exception, when no function has been loaded.
         """
         if self._lib_func is None:
             raise RuntimeError("Consistency check function not loaded")
-        return self._lib_func(filename)
+        start = monotonic()
+        result = self._lib_func(os.fsencode(filename))
+        metrics.count("checker_calls")
+        metrics.observe_time("checker_latency", start)
+        return result
 
 
 class ProgChecker(ConsistencyCheckerBase):
@@ -75,17 +84,23 @@ class ProgChecker(ConsistencyCheckerBase):
     def check_consistency(self, filename):
         """
         Checks the consistency of a given file
-        using the previously loaded function.
+        using the consistency checking program.
 
         :param filename: The full name of the file to be checked.
         :type filename: str
-        :return: 1 if file is consistent, 0 otherwise.
+        :return: 0 if file is consistent, the nonzero exit status of the
+            program, as returned by os.system, otherwise.
         :rtype: int
-        :raises: Generic exception, when no function has been loaded.
+        :raises: Generic exception, when no program has been set.
         """
         if self._bin_path is None or self._bin_cmd is None:
             raise RuntimeError("consistency check handle not set")
-        return os.system(self._bin_path + " " + self._bin_cmd + " " + filename)
+        start = monotonic()
+        result = os.system(self._bin_path + " " + self._bin_cmd + " " +
+                           filename)
+        metrics.count("checker_calls")
+        metrics.observe_time("checker_latency", start)
+        return result
 
 
 def get_checker(checker_type, checker_path_args, name):
@@ -0,0 +1,234 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+from collections import OrderedDict
+from math import log10
+from time import monotonic
+import json
+
+import reorderengines
+from reorderexceptions import InconsistentFileException
+
+
+def format_duration(seconds):
+    """
+    Formats the duration in the most suitable unit.
+
+    :param seconds: The duration in seconds.
+    :type seconds: float
+    :return: The formatted duration.
+    :rtype: str
+    """
+    if seconds is None:
+        return "unknown"
+    for unit, length in (("years", 365 * 24 * 3600), ("days", 24 * 3600),
+                         ("hours", 3600), ("minutes", 60)):
+        if seconds >= length:
+            return "{:.3g} {}".format(seconds / length, unit)
+    return "{:.3g} seconds".format(seconds)
+
+
+def format_count(count):
+    """
+    Formats the number of sequences, in the scientific notation if large.
+
+    The numbers of sequences of the exhaustive engines easily exceed both
+    the range of floats and the length of integers convertible to strings.
+
+    :param count: The number of sequences.
+    :type count: int
+    :return: The formatted number.
+    :rtype: str
+    """
+    if count < 10 ** 12:
+        return str(count)
+    shift = max(0, count.bit_length() - 53)
+    exponent = log10(count >> shift) + shift * log10(2)
+    return "{:.3f}e+{}".format(10 ** (exponent % 1), int(exponent))
+
+
+class Estimate:
+    """
+    Estimates the cost of a run without replaying and checking the stores.
+
+    The collecting state machine runs as usual, at each barrier the number
+    of flushed stores and the number of sequences the configured engine
+    would generate are recorded. The engines which cannot count their
+    sequences make the estimate approximate, their barriers are counted
+    as a single sequence.
+
+    :ivar barriers: The estimates of the individual barriers.
+    :type barriers: list of dict
+    :ivar regions: The estimates summed up by the marker regions.
+    :type regions: collections.OrderedDict
+    :ivar latency: The measured checker latency in seconds, None if not
+        measured.
+    :type latency: float
+    """
+    def __init__(self):
+        self.barriers = []
+        self.regions = OrderedDict()
+        self.latency = None
+
+    def add_barrier(self, barrier, region, engine, store_list, checked):
+        """
+        Records the estimate of the barrier.
+
+        :param barrier: The index of the barrier.
+        :type barrier: int
+        :param region: The name of the innermost marker region.
+        :type region: str
+        :param engine: The configured reorder engine.
+        :param store_list: The flushed stores of the barrier.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :param checked: Whether the barrier is checked.
+        :type checked: bool
+        :return: None
+        """
+        exact = True
+        if not checked:
+            sequences = 0
+        elif hasattr(engine, "count_sequences"):
+            sequences = engine.count_sequences(len(store_list))
+        else:
+            sequences = 1
+            exact = False
+        self.barriers.append({
+            "barrier": barrier,
+            "region": region,
+            "engine": reorderengines.get_engine_name(engine),
+            "stores": len(store_list),
+            "sequences": sequences,
+            "exact": exact,
+        })
+
+        summary = self.regions.get(region)
+        if summary is None:
+            summary = self.regions[region] = {
+                "barriers": 0,
+                "checked_barriers": 0,
+                "stores": 0,
+                "max_stores": 0,
+                "sequences": 0,
+                "exact": True,
+            }
+        summary["barriers"] += 1
+        summary["checked_barriers"] += int(checked)
+        summary["stores"] += len(store_list)
+        summary["max_stores"] = max(summary["max_stores"], len(store_list))
+        summary["sequences"] += sequences
+        summary["exact"] = summary["exact"] and exact
+
+    def calibrate(self, file_handler, calls=3):
+        """
+        Measures the checker latency on the current state of the files.
+
+        :param file_handler: The handler of the registered files.
+        :type file_handler: binaryoutputhandler.BinaryOutputHandler
+        :param calls: The number of measured checker invocations.
+        :type calls: int
+        :return: None
+        """
+        if not file_handler.has_files():
+            return
+        times = []
+        for _ in range(calls):
+            start = monotonic()
+            try:
+                file_handler.check_consistency()
+            except InconsistentFileException:
+                pass
+            times.append(monotonic() - start)
+        self.latency = sorted(times)[len(times) // 2]
+
+    def projected(self, sequences):
+        """
+        Projects the time of checking the given number of sequences.
+
+        :param sequences: The number of sequences.
+        :type sequences: int
+        :return: The time in seconds, None if the latency is unknown.
+        :rtype: float
+        """
+        if self.latency is None:
+            return None
+        try:
+            return float(sequences) * self.latency
+        except OverflowError:
+            return float("inf")
+
+    def total(self):
+        """
+        Sums up the estimates of all regions.
+
+        :return: The number of sequences and whether it is exact.
+        :rtype: tuple
+        """
+        return (sum(r["sequences"] for r in self.regions.values()),
+                all(r["exact"] for r in self.regions.values()))
+
+    def to_dict(self):
+        """
+        Describes the estimate with basic types.
+
+        :return: The description of the estimate.
+        :rtype: dict
+        """
+        sequences, exact = self.total()
+        regions = OrderedDict()
+        for name, summary in self.regions.items():
+            regions[name] = dict(summary, projected_seconds=self.projected(
+                summary["sequences"]))
+            regions[name]["sequences"] = self._count(summary["sequences"])
+        barriers = [dict(barrier, sequences=self._count(barrier["sequences"]))
+                    for barrier in self.barriers]
+        return {
+            "sequences": self._count(sequences),
+            "exact": exact,
+            "latency": self.latency,
+            "projected_seconds": self.projected(sequences),
+            "regions": regions,
+            "barriers": barriers,
+        }
+
+    @staticmethod
+    def _count(count):
+        # too large numbers are saved as strings in the scientific notation
+        return count if count.bit_length() <= 1024 else format_count(count)
+
+    def save(self, filename):
+        """
+        Saves the estimate as a json file.
+
+        :param filename: The name of the estimate file.
+        :type filename: str
+        :return: None
+        """
+        with open(filename, "w") as estimate_file:
+            json.dump(self.to_dict(), estimate_file, indent=4)
+
+    def print_summary(self):
+        """
+        Prints the estimate of each marker region and the total.
+
+        :return: None
+        """
+        row = "{:<32} {:>10} {:>10} {:>12} {:>14} {:>16}"
+        print(row.format("region", "barriers", "stores", "max stores",
+                         "sequences", "projected time"))
+        for name, summary in self.regions.items():
+            print(row.format(name, summary["barriers"], summary["stores"],
+                             summary["max_stores"],
+                             self._format_count(summary["sequences"],
+                                                summary["exact"]),
+                             format_duration(
+                                 self.projected(summary["sequences"]))))
+        sequences, exact = self.total()
+        print("Total: {} sequences, checker latency: {}, projected time: {}"
+              .format(self._format_count(sequences, exact),
+                      format_duration(self.latency),
+                      format_duration(self.projected(sequences))))
+
+    @staticmethod
+    def _format_count(count, exact):
+        return format_count(count) if exact else "~" + format_count(count)
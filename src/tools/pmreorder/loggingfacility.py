@@ -1,12 +1,67 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright 2018, Intel Corporation
 
+import atexit
 import logging
+import queue
 
 log_levels = ["debug", "info", "warning", "error", "critical"]
 
 
+class LazyMessage:
+    """
+    Defers building of a log message until it is emitted.
+
+    The loggers accept a callable returning the message instead of the
+    message itself, which is wrapped in this class. Costly messages, e.g.
+    call traces, are then built only if their level is enabled.
+
+    :ivar _builder: The function building the message.
+    :type _builder: callable
+    """
+    def __init__(self, builder):
+        self._builder = builder
+
+    def __str__(self):
+        return str(self._builder())
+
+
+def build_message(text):
+    """
+    Builds the message, calling the message builder if one is given.
+
+    :param text: The message or a callable returning the message.
+    :type text: str or callable
+    :return: The message.
+    :rtype: str
+    """
+    return text() if callable(text) else text
+
+
 class LoggingBase:
+    """
+    Base class for the loggers.
+
+    Each method accepts either the message or a callable building the
+    message, which is called only if the level of the message is enabled.
+
+    :ivar level: The numeric level of the least severe message emitted.
+    :type level: int
+    """
+    def __init__(self, level=logging.WARNING):
+        self.level = level
+
+    def is_enabled_for(self, level):
+        """
+        Checks whether the messages of the given level are emitted.
+
+        :param level: The numeric level, e.g. logging.INFO.
+        :type level: int
+        :return: True if the messages are emitted.
+        :rtype: bool
+        """
+        return level >= self.level
+
     def debug(self, text):
         pass
 
@@ -23,55 +78,109 @@ class LoggingBase:
         pass
 
 
+class _RecordQueueHandler(logging.Handler):
+    """
+    Passes the records to the queue unformatted, so the messages are
+    formatted by the listener thread. The queue never leaves the process,
+    the records do not need to be made picklable.
+    """
+    def __init__(self, record_queue):
+        super(_RecordQueueHandler, self).__init__()
+        self.queue = record_queue
+
+    def emit(self, record):
+        self.queue.put_nowait(record)
+
+
 class DefaultFileLogger(LoggingBase):
-    def __init__(self, name="pmreorder", **kwargs):
-        logging.basicConfig(**kwargs)
+    """
+    Logs to a file through a queue drained by a background thread,
+    so that writing the messages does not block the reordering.
+    """
+    def __init__(self, name="pmreorder", filename=None,
+                 level=logging.WARNING):
+        super(DefaultFileLogger, self).__init__(level)
+        # imported only when logging to a file
+        from logging.handlers import QueueListener
+        handler = logging.FileHandler(filename)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        log_queue = queue.SimpleQueue()
+        self.__listener = QueueListener(log_queue, handler)
+        self.__listener.start()
+        atexit.register(self.close)
         self.__logger = logging.getLogger(name)
+        self.__logger.setLevel(level)
+        self.__logger.propagate = False
+        self.__handler = _RecordQueueHandler(log_queue)
+        self.__logger.addHandler(self.__handler)
+
+    def close(self):
+        """
+        Writes out the queued messages and stops the background thread.
+        The next logger of the same name, e.g. of the next run in the
+        process, does not write to the file any more.
+
+        :return: None
+        """
+        if self.__listener is not None:
+            self.__logger.removeHandler(self.__handler)
+            self.__listener.stop()
+            self.__listener = None
+
+    def _log(self, level, text):
+        if self.__logger.isEnabledFor(level):
+            if callable(text):
+                text = LazyMessage(text)
+            self.__logger.log(level, text)
 
     def debug(self, text):
-        self.__logger.debug(text)
+        self._log(logging.DEBUG, text)
 
     def info(self, text):
-        self.__logger.info(text)
+        self._log(logging.INFO, text)
 
     def warning(self, text):
-        self.__logger.warning(text)
+        self._log(logging.WARNING, text)
 
     def error(self, text):
-        self.__logger.error(text)
+        self._log(logging.ERROR, text)
 
     def critical(self, text):
-        self.__logger.critical(text)
+        self._log(logging.CRITICAL, text)
 
 
 class DefaultPrintLogger(LoggingBase):
 
+    def _print(self, level, text):
+        if self.is_enabled_for(level):
+            print(logging.getLevelName(level) + ":", build_message(text))
+
     def debug(self, text):
-        print("DEBUG:", text)
+        self._print(logging.DEBUG, text)
 
     def info(self, text):
-        print("INFO:", text)
+        self._print(logging.INFO, text)
 
     def warning(self, text):
-        print("WARNING:", text)
+        self._print(logging.WARNING, text)
 
     def error(self, text):
-        print("ERROR:", text)
+        self._print(logging.ERROR, text)
 
     def critical(self, text):
-        print("CRITICAL:", text)
+        self._print(logging.CRITICAL, text)
 
 
 def get_logger(log_output, log_level=None):
     logger = None
     # check if log_level is valid
     log_level = "warning" if log_level is None else log_level
-    numeric_level = getattr(logging, log_level.upper())
+    numeric_level = getattr(logging, log_level.upper(), None)
     if not isinstance(numeric_level, int):
-        raise ValueError('Invalid log level: %s'.format(log_level.upper()))
+        raise ValueError('Invalid log level: {}'.format(log_level.upper()))
 
     if log_output is None:
-        logger = DefaultPrintLogger()
+        logger = DefaultPrintLogger(numeric_level)
     else:
         logger = DefaultFileLogger(filename=log_output, level=numeric_level)
     return logger
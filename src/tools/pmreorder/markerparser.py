@@ -4,6 +4,7 @@
 
 import os
 import json
+import re
 
 
 class MarkerParser:
@@ -33,10 +34,13 @@ class MarkerParser:
         Parse markers passed by cli.
         They should be in specific format:
         MARKER_NAME=ENGINE_TYPE and separated by commas.
+        The engine type may carry parameters, e.g.
+        MARKER_NAME=ReorderPartial(max_seq=10,seed=1).
         """
         try:
-            markers_array = macros.split(",")
-            return dict(pair.split('=') for pair in markers_array)
+            # split on commas which are not inside engine parameters
+            markers_array = re.split(r",(?![^()]*\))", macros)
+            return dict(pair.split('=', 1) for pair in markers_array)
         except ValueError:
             print("Invalid extended macros format: ", macros,
                   "Use: MARKER_NAME1=ENGINE_TYPE1,MARKER_NAME2=ENGINE_TYPE2")
@@ -199,8 +199,15 @@ class Flush(FlushBase):
 class ReorderBase(BaseOperation):
     """
     Base class for all reorder type classes.
+
+    :cvar engine: The name of the reorder engine.
+    :type engine: str
+    :cvar params: The parameters of the reorder engine, assigned to the
+        marker in the extended macros configuration.
+    :type params: dict
     """
-    pass
+    engine = None
+    params = {}
 
 
 class NoReorderDoCheck(ReorderBase):
@@ -347,11 +354,9 @@ class ReorderPartial(ReorderBase):
     """
     Describes the type of reordering engine to be used.
 
-    This marker class triggers writing a subset of all possible
-    sequences of stores between barriers.
-
-    The type of partial reordering is chosen at runtime. Not yet
-    implemented.
+    This marker class triggers writing a random subset of all possible
+    sequences of stores between barriers. The number of sequences and
+    the seed are taken from the marker parameters.
     """
     class Factory:
         """
@@ -369,6 +374,77 @@ class ReorderPartial(ReorderBase):
             return ReorderPartial()
 
 
+class ReorderCoverage(ReorderBase):
+    """
+    Describes the type of reordering engine to be used.
+
+    This marker class triggers writing random sequences of stores
+    between barriers, preferring the sequences which cover new pairs
+    of a store call site and its persistence.
+    """
+    class Factory:
+        """
+        Internal factory class to be used in dynamic object creation.
+        """
+        def create(self, values):
+            """
+            Factory object creation method.
+
+            :param values: Ignored.
+            :type values: str
+            :return: New ReorderCoverage object.
+            :rtype: ReorderCoverage
+            """
+            return ReorderCoverage()
+
+
+class ReorderMissing(ReorderBase):
+    """
+    Describes the type of reordering engine to be used.
+
+    This marker class triggers writing all sequences of stores
+    between barriers with at most k of the stores missing.
+    """
+    class Factory:
+        """
+        Internal factory class to be used in dynamic object creation.
+        """
+        def create(self, values):
+            """
+            Factory object creation method.
+
+            :param values: Ignored.
+            :type values: str
+            :return: New ReorderMissing object.
+            :rtype: ReorderMissing
+            """
+            return ReorderMissing()
+
+
+class ReorderRegistered(ReorderBase):
+    """
+    Describes the type of reordering engine to be used.
+
+    This marker class triggers one of the engines registered in
+    :mod:`reorderengines` which do not have a dedicated marker class,
+    e.g. the engines loaded from plugins.
+    """
+    class Factory:
+        """
+        Internal factory class to be used in dynamic object creation.
+        """
+        def create(self, values):
+            """
+            Factory object creation method.
+
+            :param values: Ignored.
+            :type values: str
+            :return: New ReorderRegistered object.
+            :rtype: ReorderRegistered
+            """
+            return ReorderRegistered()
+
+
 class Register_file(BaseOperation):
     """
     Describes the file to be mapped into processes address space.
@@ -0,0 +1,183 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+from contextlib import contextmanager
+from time import monotonic
+import json
+import os
+import threading
+
+
+class Histogram:
+    """
+    Summarizes the distribution of the observed values.
+
+    The values are counted in buckets of powers of two, e.g. the bucket
+    "<16" holds the values from 8 (inclusive) to 16 (exclusive). The values
+    below 1 go to the bucket "<1".
+
+    :ivar count: The number of observed values.
+    :type count: int
+    :ivar total: The sum of the observed values.
+    :type total: float
+    :ivar min: The smallest observed value.
+    :type min: float
+    :ivar max: The largest observed value.
+    :type max: float
+    :ivar buckets: The number of values in each bucket.
+    :type buckets: dict
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.buckets = {}
+
+    def observe(self, value):
+        """
+        Records the value.
+
+        :param value: The observed value.
+        :type value: float
+        :return: None
+        """
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        bucket = int(value).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def to_dict(self):
+        """
+        Describes the histogram with basic types.
+
+        :return: The summary and the buckets of the histogram.
+        :rtype: dict
+        """
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {"<{}".format(1 << b): n
+                        for b, n in sorted(self.buckets.items())},
+        }
+
+
+class Metrics:
+    """
+    Collects the performance counters and timing histograms of the run.
+
+    The metrics are collected only when enabled, otherwise all methods
+    return immediately. Timings are recorded in microseconds. The metrics
+    may be recorded by many threads, e.g. the checkers run by the worker
+    threads.
+
+    :ivar enabled: Whether the metrics are collected.
+    :type enabled: bool
+    :ivar counters: The counters, by name.
+    :type counters: dict
+    :ivar histograms: The histograms, by name.
+    :type histograms: dict
+    """
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.histograms = {}
+        self._start = monotonic()
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        """
+        Increments the counter.
+
+        :param name: The name of the counter.
+        :type name: str
+        :param value: The increment.
+        :type value: int
+        :return: None
+        """
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """
+        Records the value in the histogram.
+
+        :param name: The name of the histogram.
+        :type name: str
+        :param value: The observed value.
+        :type value: float
+        :return: None
+        """
+        if self.enabled:
+            with self._lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram()
+                histogram.observe(value)
+
+    def observe_time(self, name, start):
+        """
+        Records the time elapsed since the start in the histogram.
+
+        :param name: The name of the histogram.
+        :type name: str
+        :param start: The start time, as returned by :func:`time.monotonic`.
+        :type start: float
+        :return: None
+        """
+        if self.enabled:
+            self.observe(name, (monotonic() - start) * 1e6)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Records the duration of the block in the histogram.
+
+        :param name: The name of the histogram.
+        :type name: str
+        """
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.observe_time(name, start)
+
+    def to_dict(self):
+        """
+        Describes the metrics with basic types.
+
+        :return: The counters and the histograms.
+        :rtype: dict
+        """
+        return {
+            "elapsed": monotonic() - self._start,
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {name: histogram.to_dict() for name, histogram
+                           in sorted(self.histograms.items())},
+        }
+
+    def dump(self, filename):
+        """
+        Saves the metrics as a json file, replacing the previous dump
+        atomically.
+
+        :param filename: The name of the metrics file.
+        :type filename: str
+        :return: None
+        """
+        tmp_name = filename + ".tmp"
+        with open(tmp_name, "w") as metrics_file:
+            json.dump(self.to_dict(), metrics_file, indent=4)
+        os.replace(tmp_name, filename)
+
+
+# the metrics of the run, shared by all modules
+metrics = Metrics()
@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+from time import monotonic
+
+from metrics import metrics
+from reorderexceptions import InconsistentFileException
+
+
+class Minimizer:
+    """
+    Shrinks an inconsistent sequence of stores with delta debugging.
+
+    The minimized set is either the set of the stores missing from the
+    inconsistent image or the set of the stores persisted in it. The
+    ddmin algorithm looks for a subset of it, which still makes the
+    checker fail and none of whose single stores can be dropped. Each
+    candidate image is built with the same apply, check and revert steps
+    as the reordered sequences, the results of the checks are cached.
+
+    :ivar _context: The reordering context.
+    :type _context: opscontext.OpsContext
+    :ivar _applied: Minimize the persisted stores instead of the missing
+        ones.
+    :type _applied: bool
+    :ivar _cache: The results of the checks of the candidate sets.
+    :type _cache: dict
+    """
+    def __init__(self, context, applied=False):
+        """
+        Initializes the minimizer.
+
+        :param context: The reordering context.
+        :type context: opscontext.OpsContext
+        :param applied: Minimize the persisted stores.
+        :type applied: bool
+        """
+        self._context = context
+        self._applied = applied
+        self._cache = {}
+
+    @property
+    def kind(self):
+        """
+        The kind of the minimized stores, "applied" or "missing".
+        """
+        return "applied" if self._applied else "missing"
+
+    def _fails(self, candidate, persisted, missing):
+        """
+        Checks whether the image built for the candidate set is
+        inconsistent.
+
+        :param candidate: The indices of the stores of the candidate set.
+        :type candidate: tuple of int
+        :param persisted: The stores persisted in the inconsistent image.
+        :type persisted: list of :class:`memoryoperations.Store`
+        :param missing: The stores missing from the inconsistent image.
+        :type missing: list of :class:`memoryoperations.Store`
+        :return: True if the image is inconsistent.
+        :rtype: bool
+        """
+        key = frozenset(candidate)
+        if key in self._cache:
+            return self._cache[key]
+
+        if self._applied:
+            # only the candidate stores are persisted
+            seq = [persisted[i] for i in candidate]
+        else:
+            # all stores but the candidate ones are persisted
+            seq = persisted + [st for i, st in enumerate(missing)
+                               if i not in key]
+        handler = self._context.file_handler
+        handler.do_stores(seq)
+        start = monotonic()
+        try:
+            handler.check_consistency()
+            result = False
+        except InconsistentFileException:
+            result = True
+        finally:
+            metrics.count("minimize_checks")
+            if self._context.budget is not None:
+                self._context.budget.consume(monotonic() - start)
+        for op in reversed(seq):
+            handler.do_revert(op)
+
+        self._cache[key] = result
+        return result
+
+    def minimize(self, store_list, seq):
+        """
+        Finds a 1-minimal set of stores making the image inconsistent.
+
+        The registered files have to be in the state preceding
+        the inconsistent sequence.
+
+        :param store_list: All flushed stores of the barrier.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :param seq: The stores persisted in the inconsistent image.
+        :type seq: iterable of :class:`memoryoperations.Store`
+        :return: The minimal set of the persisted or missing stores.
+        :rtype: list of :class:`memoryoperations.Store`
+        """
+        self._cache = {}
+        persisted = list(seq)
+        persisted_set = set(persisted)
+        missing = [st for st in store_list if st not in persisted_set]
+        stores = persisted if self._applied else missing
+
+        def fails(candidate):
+            return self._fails(candidate, persisted, missing)
+
+        current = tuple(range(len(stores)))
+        if fails(()):
+            return []
+        granularity = 2
+        while len(current) >= 2:
+            size = len(current)
+            chunks = [current[size * i // granularity:
+                              size * (i + 1) // granularity]
+                      for i in range(granularity)]
+            for chunk in chunks:
+                if fails(chunk):
+                    current = chunk
+                    granularity = 2
+                    break
+            else:
+                for i in range(len(chunks)):
+                    complement = tuple(index for j, chunk in enumerate(chunks)
+                                       if j != i for index in chunk)
+                    if fails(complement):
+                        current = complement
+                        granularity = max(granularity - 1, 2)
+                        break
+                else:
+                    if granularity >= size:
+                        break
+                    granularity = min(granularity * 2, size)
+        return [stores[i] for i in current]
@@ -2,6 +2,8 @@
 # Copyright 2018-2019, Intel Corporation
 
 import memoryoperations
+import reorderengines
+from reorderengines import parse_engine_spec
 from reorderexceptions import NotSupportedOperationException
 
 
@@ -44,6 +46,28 @@ class OperationFactory:
         """
         OperationFactory.__factories[id_] = operation_factory
 
+    @staticmethod
+    def get_marker_class(engine):
+        """
+        Returns the marker class triggering the given reorder engine.
+
+        The registered engines without a dedicated marker class are
+        triggered by :class:`memoryoperations.ReorderRegistered`.
+
+        :param engine: The name of the reorder engine.
+        :type engine: str
+        :return: The marker class.
+        :raises: NotSupportedOperationException for unknown engines.
+        """
+        mem_ops = getattr(memoryoperations, engine, None)
+        if mem_ops is None and engine in reorderengines.engines:
+            mem_ops = memoryoperations.ReorderRegistered
+        if mem_ops is None:
+            raise NotSupportedOperationException(
+                    "Not supported reorder engine: {}"
+                    .format(engine))
+        return mem_ops
+
     @staticmethod
     def create_operation(string_operation, markers, stack):
 
@@ -98,11 +122,15 @@ class OperationFactory:
 
         :param string_operation: The string describing the operation.
         :param markers: The dict describing the pair marker-engine.
-        :param stack: The stack describing the order of engine changes.
+        :param stack: The stack describing the order of engine changes,
+            each entry holds the marker, its class, the engine name and
+            the engine parameters.
         :return: The specific object instantiated based on the string.
         """
         id_ = string_operation.split(";")[0]
         id_case_sensitive = id_.lower().capitalize()
+        engine = None
+        params = {}
 
         # checks if id_ is one of memoryoperation classes
         mem_ops = getattr(memoryoperations, id_case_sensitive, None)
@@ -116,25 +144,20 @@ class OperationFactory:
                 # BEGIN defined by user
                 marker_name = id_.partition('.')[0]
                 if markers is not None and marker_name in markers:
-                    engine = markers[marker_name]
-                    try:
-                        mem_ops = getattr(memoryoperations, engine)
-                    except AttributeError:
-                        raise NotSupportedOperationException(
-                                "Not supported reorder engine: {}"
-                                .format(engine))
+                    engine, params = parse_engine_spec(markers[marker_name])
+                    mem_ops = OperationFactory.get_marker_class(engine)
                 # BEGIN but not defined by user
                 else:
-                    mem_ops = stack[-1][1]
+                    mem_ops, engine, params = stack[-1][1:]
 
                 if issubclass(mem_ops, memoryoperations.ReorderBase):
-                    stack.append((id_, mem_ops))
+                    stack.append((id_, mem_ops, engine, params))
 
             # END section
             elif id_.endswith(OperationFactory.__suffix[-1]):
                 check_pair_consistency(stack, id_)
                 stack.pop()
-                mem_ops = stack[-1][1]
+                mem_ops, engine, params = stack[-1][1:]
 
         # here we have proper memory operation to perform,
         # it can be Store, Fence, ReorderDefault etc.
@@ -142,4 +165,9 @@ class OperationFactory:
         if id_ not in OperationFactory.__factories:
             OperationFactory.__factories[id_] = mem_ops.Factory()
 
-        return OperationFactory.__factories[id_].create(string_operation)
+        operation = OperationFactory.__factories[id_].create(string_operation)
+        if isinstance(operation, memoryoperations.ReorderBase):
+            operation.engine = engine
+            operation.params = params
+
+        return operation
@@ -3,9 +3,14 @@
 
 from operationfactory import OperationFactory
 from binaryoutputhandler import BinaryOutputHandler
-import reorderengines
 import memoryoperations
-from itertools import repeat
+import reorderengines
+from bisect import bisect_right
+from random import SystemRandom
+from time import monotonic
+from report import Report
+import storelog
+from metrics import metrics
 
 
 class OpsContext:
@@ -13,7 +18,10 @@ class OpsContext:
     Holds the context of the performed operations.
 
     :ivar _operations: The operations to be performed, based on the log file.
-    :type _operations: list of strings
+    :type _operations: list of strings, or iterator of strings if the log
+        is streamed
+    :ivar streaming: Whether the log is read while it is being written.
+    :type streaming: bool
     :ivar reorder_engine: The reordering engine used at the moment.
     :type one of the reorderengine Class
     :ivar default_engine: The default reordering engine.
@@ -23,20 +31,89 @@ class OpsContext:
     :ivar default_barrier: Default consistency barrier status.
     :type default_barrier: bool
     :ivar file_handler: The file handler used.
+    :ivar seed: The seed used by randomized reorder engines.
+    :type seed: int
+    :ivar barrier: The index of the next persistent memory barrier.
+    :type barrier: int
+    :ivar report: The results of the consistency checks.
+    :type report: report.Report
+    :ivar replay: The failure to be replayed, None if not in replay mode.
+    :type replay: report.Failure
+    :ivar finished: Indicates that no more operations are to be processed.
+    :type finished: bool
+    :ivar position: The position of the current operation in the log.
+    :type position: int
+    :ivar checkpointer: The checkpoint writer, None if disabled.
+    :type checkpointer: checkpoint.Checkpointer
+    :ivar budget: The scheduler of the checks budget, None if unlimited.
+    :type budget: budget.BudgetScheduler
+    :ivar shard: The part of the sequences to be checked, None to check
+        all of them.
+    :type shard: shard.Shard
+    :ivar estimate: The estimate of the cost of the run, None if the stores
+        are to be replayed and checked.
+    :type estimate: estimate.Estimate
+    :ivar signature_applied: Compute the failure signatures from the
+        persisted stores instead of the missing ones.
+    :type signature_applied: bool
+    :ivar signature_scope: The scope in which the failures of a signature
+        are counted, "barrier" or "region".
+    :type signature_scope: str
+    :ivar max_signature_failures: The number of failures of a signature
+        after which the rest of its scope is not checked, None if unlimited.
+    :type max_signature_failures: int
+    :ivar max_signatures: The number of distinct failure signatures after
+        which the run stops, None if unlimited.
+    :type max_signatures: int
+    :ivar minimizer: The minimizer of the first inconsistent sequence
+        of each signature, None if the sequences are not minimized.
+    :type minimizer: minimize.Minimizer
+    :ivar file_aliases: The files on which the stores to the registered
+        files are replayed, by the names of the registered files.
+    :type file_aliases: dict
+    :ivar snapshots: The store of the barrier snapshots, None if disabled.
+    :type snapshots: snapshot.SnapshotStore
+    :ivar first_barrier: The index of the first barrier to be checked.
+    :type first_barrier: int
+    :ivar pipeline: The pool checking the barriers concurrently, None if
+        the barriers are checked one after another.
+    :type pipeline: pipeline.Pipeline
     """
-    def __init__(self, log_file, checker, logger, arg_engine, markers):
+    def __init__(self, log_file, checker, logger, arg_engine, markers,
+                 seed=None, replay=None):
         """
         Splits the operations in the log file and sets the instance variables
         to default values.
 
-        :param log_file: The full name of the log file.
-        :type log_file: str
+        :param log_file: The full name of the log file, "-" for the
+            standard input, or the iterator over the operations of
+            a streamed log.
+        :type log_file: str or iterator
+        :param seed: The seed used by randomized reorder engines. If None,
+            a random seed is chosen.
+        :type seed: int
+        :param replay: The failure to be replayed.
+        :type replay: report.Failure
         :return: None
         """
-        # TODO reading the whole file at once is rather naive
-        # change in the future
-        self._operations = open(log_file).read().split("|")
-        engine = reorderengines.get_engine(arg_engine)
+        with metrics.timer("parse"):
+            if isinstance(log_file, str):
+                self._operations = storelog.open_log(log_file)
+            else:
+                self._operations = log_file
+        self.streaming = not isinstance(self._operations, list)
+        if not self.streaming:
+            metrics.count("log_operations", len(self._operations))
+        if replay is not None:
+            seed = replay.seed
+        elif seed is None:
+            seed = SystemRandom().getrandbits(32)
+        self.report = Report()
+        self.seed = seed
+        self._engines = {}
+        engine_name, engine_params = \
+            reorderengines.parse_engine_spec(arg_engine)
+        engine = self.get_engine(engine_name, engine_params)
         self.reorder_engine = engine
         self.test_on_barrier = engine.test_on_barrier
         self.default_engine = self.reorder_engine
@@ -45,16 +122,141 @@ class OpsContext:
         self.checker = checker
         self.logger = logger
         self.markers = markers
-        self.stack_engines = [('START', getattr(memoryoperations, arg_engine))]
+        self.barrier = 0
+        self.replay = replay
+        self.finished = False
+        self.position = 0
+        self.checkpointer = None
+        self.budget = None
+        self.shard = None
+        self.estimate = None
+        self.signature_applied = False
+        self.signature_scope = "barrier"
+        self.max_signature_failures = None
+        self.max_signatures = None
+        self.minimizer = None
+        self.file_aliases = {}
+        self.snapshots = None
+        self.first_barrier = 0
+        self.pipeline = None
+        self._fences = []
+        self.stack_engines = [('START',
+                               OperationFactory.get_marker_class(
+                                   engine_name),
+                               engine_name, engine_params)]
+
+    def get_engine(self, name, params):
+        """
+        Returns the reorder engine for the given specification.
+
+        The engines are created once per specification and cached.
+
+        :param name: The name of the engine.
+        :type name: str
+        :param params: The parameters of the engine.
+        :type params: dict
+        :return: The reorder engine object.
+        """
+        key = (name, repr(sorted(params.items())))
+        if key not in self._engines:
+            self._engines[key] = reorderengines.create_engine(
+                name, params, self.seed, self.report.coverage)
+        return self._engines[key]
+
+    def engines(self):
+        """
+        Returns the cached reorder engines and the default engine, e.g. to
+        be saved in a checkpoint along with the report, whose coverage is
+        shared by the coverage-guided engines.
+
+        :return: The cached engines, by their specifications, and the
+            default engine.
+        :rtype: tuple
+        """
+        return self._engines, self.default_engine
+
+    def restore_engines(self, engines, default_engine):
+        """
+        Replaces the cached reorder engines and the default engine, e.g.
+        with the ones restored from a checkpoint. The engines have to share
+        the coverage of the current report.
+
+        :param engines: The engines, by their specifications, as returned
+            by :meth:`engines`.
+        :type engines: dict
+        :param default_engine: The default engine.
+        :return: None
+        """
+        self._engines = engines
+        self.default_engine = default_engine
+        self.default_barrier = default_engine.test_on_barrier
+
+    def restore_stack(self, markers):
+        """
+        Rebuilds the stack of the reorder engines from the names of the
+        markers entered so far, using the current marker configuration.
+
+        :param markers: The markers on the stack, e.g. MARKER.BEGIN,
+            the first one stands for the default engine.
+        :type markers: list of str
+        :return: None
+        """
+        del self.stack_engines[1:]
+        for id_ in markers[1:]:
+            marker_name = id_.partition(".")[0]
+            if self.markers is not None and marker_name in self.markers:
+                engine, params = \
+                    reorderengines.parse_engine_spec(self.markers[marker_name])
+                self.stack_engines.append(
+                    (id_, OperationFactory.get_marker_class(engine), engine,
+                     params))
+            else:
+                self.stack_engines.append((id_,) + self.stack_engines[-1][1:])
+        mem_ops, engine, params = self.stack_engines[-1][1:]
+        if issubclass(mem_ops, memoryoperations.ReorderDefault):
+            self.reorder_engine = self.default_engine
+            self.test_on_barrier = self.default_barrier
+        else:
+            self.reorder_engine = self.get_engine(engine, params)
+            self.test_on_barrier = self.reorder_engine.test_on_barrier
 
-    # TODO this should probably be made a generator
-    def extract_operations(self):
+    def region(self):
+        """
+        Returns the name of the innermost marker region.
+
+        :return: The name of the marker, START outside of the markers.
+        :rtype: str
+        """
+        return self.stack_engines[-1][0].partition(".")[0]
+
+    def remaining_fences(self):
+        """
+        Counts the fences after the current position in the log.
+
+        :return: The number of remaining fences.
+        :rtype: int
+        """
+        return len(self._fences) - bisect_right(self._fences, self.position)
+
+    def extract_operations(self, start=0):
         """
         Creates specific operation objects based on the labels available
         in the split log file.
 
-        :return: list of subclasses of :class:`memoryoperations.BaseOperation`
+        The operations are created lazily, :attr:`position` holds the
+        position of the most recently created operation.
+
+        :param start: The position of the first operation to be created,
+            counted from the beginning of the logged operations.
+        :type start: int
+        :return: generator of subclasses of
+            :class:`memoryoperations.BaseOperation`
         """
+        if self.streaming:
+            for op in self._extract_streamed(start):
+                yield op
+            return
+
         stop_index = start_index = 0
 
         for i, elem in enumerate(self._operations):
@@ -63,6 +265,54 @@ class OpsContext:
             elif "STOP" in elem:
                 stop_index = i
 
-        return list(map(OperationFactory.create_operation,
-                        self._operations[start_index + 1:stop_index],
-                        repeat(self.markers), repeat(self.stack_engines)))
+        self._fences = [i - start_index - 1
+                        for i in range(start_index + 1, stop_index)
+                        if self._operations[i].startswith("FENCE")]
+
+        for i in range(start_index + 1 + start, stop_index):
+            self.position = i - start_index - 1
+            yield self._create_operation(self._operations[i])
+
+    def _create_operation(self, elem):
+        """
+        Creates the operation of the logged element, measuring the parse
+        time when the metrics are enabled.
+
+        :param elem: The logged operation.
+        :type elem: str
+        :return: The operation.
+        :rtype: memoryoperations.BaseOperation
+        """
+        begin = monotonic() if metrics.enabled else None
+        op = OperationFactory.create_operation(elem, self.markers,
+                                               self.stack_engines)
+        if begin is not None:
+            metrics.count("parse_seconds", monotonic() - begin)
+        return op
+
+    def _extract_streamed(self, start):
+        """
+        Creates the operations of a streamed log while it is being read.
+
+        The fences are not known in advance, :meth:`remaining_fences` counts
+        none.
+
+        :param start: The position of the first operation to be created.
+        :type start: int
+        :return: generator of subclasses of
+            :class:`memoryoperations.BaseOperation`
+        """
+        started = False
+        position = -1
+        for elem in self._operations:
+            if not started:
+                started = "START" in elem
+                continue
+            if elem.strip() == "STOP":
+                break
+            position += 1
+            if position < start:
+                continue
+            self.position = position
+            metrics.count("log_operations")
+            yield self._create_operation(elem)
@@ -0,0 +1,313 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+
+from binaryoutputhandler import BinaryOutputHandler
+from metrics import metrics
+from minimize import Minimizer
+import reorderengines
+from report import Failure
+from report import signature
+from reorderexceptions import InconsistentFileException
+import statemachine
+from storecoverage import StoreCoverage
+
+# the consistency checker of the worker process
+_checker = None
+
+
+def _init_worker(checker):
+    global _checker
+    _checker = checker
+
+
+class _Explorer:
+    """
+    Checks the sequences of a single barrier in a worker process or thread.
+
+    Provides the part of the reordering context used by
+    :class:`minimize.Minimizer`.
+
+    :ivar file_handler: The handler of the copies of the registered files.
+    :type file_handler: binaryoutputhandler.BinaryOutputHandler
+    :ivar budget: Always None, the budget is not supported.
+    """
+    budget = None
+
+    def __init__(self, files, checker):
+        self.file_handler = BinaryOutputHandler(checker)
+        for _, clone, map_base, size in files:
+            self.file_handler.add_file(clone, map_base, size)
+
+    def explore(self, task):
+        """
+        Checks the sequences generated for the barrier.
+
+        :param task: The barrier to be checked, see :meth:`Pipeline.submit`.
+        :type task: dict
+        :return: The failures found, as lists of the sequence index, the
+            error message, the indices of the persisted stores and of the
+            minimized stores, and the coverage of the checked images.
+        :rtype: dict
+        """
+        store_list = task["stores"]
+        index = dict((id(st), num) for num, st in enumerate(store_list))
+        coverage = StoreCoverage()
+        minimizer = None
+        if task["minimize"] is not None:
+            minimizer = Minimizer(self, task["minimize"] == "applied")
+        barrier = task["barrier"]
+        shard = task["shard"]
+        limit = task["max_signature_failures"]
+        counts = {}
+        failures = []
+        sequences = 0
+        handler = self.file_handler
+        for seq_num, seq in enumerate(reorderengines.generate_sequences(
+                task["engine"], store_list)):
+            sequences += 1
+            if shard is not None and not shard.owns(barrier, seq_num):
+                continue
+            handler.do_stores(seq)
+            coverage.cover(store_list, seq)
+            try:
+                handler.check_consistency()
+                failure = None
+            except InconsistentFileException as e:
+                message = str(e)
+                for file, clone, _, _ in task["files"]:
+                    message = message.replace(clone, file)
+                failure = [seq_num, message,
+                           [index[id(st)] for st in seq], None]
+            for op in reversed(seq):
+                handler.do_revert(op)
+            if failure is None:
+                continue
+
+            failures.append(failure)
+            sig = signature(store_list, seq, task["signature_applied"])
+            counts[sig] = counts.get(sig, 0) + 1
+            if counts[sig] == 1 and minimizer is not None:
+                # the first failure of a signature in the barrier is the
+                # only one which may be the first failure of the run
+                failure[3] = [index[id(st)] for st in
+                              minimizer.minimize(store_list, seq)]
+            if limit is not None and counts[sig] >= limit:
+                break
+
+        return {"failures": failures, "coverage": coverage,
+                "sequences": sequences}
+
+
+def _explore(data, checker=None):
+    task = pickle.loads(data)
+    if checker is None:
+        checker = _checker
+    explorer = _Explorer(task["files"], checker)
+    try:
+        return explorer.explore(task)
+    finally:
+        # the clones are removed once the results are merged
+        explorer.file_handler.close()
+
+
+class Pipeline:
+    """
+    Checks the barriers concurrently in a pool of worker processes or
+    threads.
+
+    Checking a barrier depends only on the state of the registered files
+    right before it and on the flushed stores of the barrier. The state
+    machine fast-forwards through the log, at each checked barrier the
+    registered files are cloned, copy-on-write if the filesystem supports
+    it, and the barrier is handed over to a worker, which checks its
+    sequences on the clones. The results are added to the report in the
+    order of the barriers, so the report and the log are the same as
+    those of a sequential run.
+
+    The workers may be threads of the process instead, sharing the
+    consistency checker, which has to be thread-safe then. Each thread
+    checks its barrier on its own clones, the same as a process, but
+    a thread costs much less memory. The checks run concurrently as long
+    as the checker releases the GIL, e.g. a function of a shared library
+    called through ctypes or a checker program.
+
+    The engines depending on the results of the preceding barriers, i.e.
+    the coverage-guided engine, are run by the state machine itself,
+    once all handed over barriers have been checked.
+
+    :ivar _executor: The pool of the worker processes or threads.
+    :type _executor: concurrent.futures.Executor
+    :ivar _checker: The consistency checker shared by the worker threads,
+        None for the worker processes, which inherit it.
+    :type _checker: ConsistencyCheckerBase
+    :ivar _pending: The barriers being checked, in order.
+    :type _pending: collections.deque
+    :ivar _limit: The maximal number of the barriers being checked.
+    :type _limit: int
+    :ivar _dirs: The directories of the clones, by the directories of
+        the registered files.
+    :type _dirs: dict
+    :ivar _directory: The directory in which the directories of the clones
+        are created, None for the directories of the registered files.
+    :type _directory: str
+    """
+    def __init__(self, checker, jobs, directory=None, threads=False):
+        """
+        Starts the workers.
+
+        :param checker: The consistency checker, inherited by the worker
+            processes or shared by the worker threads.
+        :type checker: ConsistencyCheckerBase
+        :param jobs: The number of workers.
+        :type jobs: int
+        :param directory: The directory of the clones, by default they are
+            kept next to the registered files.
+        :type directory: str
+        :param threads: Run the workers in threads instead of processes.
+        :type threads: bool
+        """
+        if threads:
+            self._executor = ThreadPoolExecutor(
+                jobs, thread_name_prefix="pmreorder")
+            self._checker = checker
+        else:
+            self._executor = ProcessPoolExecutor(
+                jobs, multiprocessing.get_context("fork"),
+                initializer=_init_worker, initargs=(checker,))
+            self._checker = None
+        self._pending = deque()
+        self._limit = 2 * jobs
+        self._dirs = {}
+        self._directory = directory
+
+    @staticmethod
+    def accepts(engine):
+        """
+        Checks whether the barriers checked with the engine may be checked
+        concurrently.
+
+        :param engine: The reorder engine.
+        :return: True if the engine does not depend on the other barriers.
+        :rtype: bool
+        """
+        return not isinstance(engine,
+                              reorderengines.CoverageGuidedReorderEngine)
+
+    def _clone_dir(self, file_name):
+        # the clones are kept on the filesystem of the cloned file
+        directory = self._directory or \
+            os.path.dirname(os.path.abspath(file_name))
+        if directory not in self._dirs:
+            self._dirs[directory] = tempfile.mkdtemp(prefix=".pmreorder",
+                                                     dir=directory)
+        return self._dirs[directory]
+
+    def submit(self, context, engine, engine_name, store_list):
+        """
+        Hands the current barrier over to a worker.
+
+        :param context: The reordering context.
+        :type context: opscontext.OpsContext
+        :param engine: The reorder engine of the barrier.
+        :param engine_name: The name of the engine in the failures.
+        :type engine_name: str
+        :param store_list: The flushed stores of the barrier.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :return: None
+        """
+        barrier = context.barrier
+        files = context.file_handler.clone_files(self._clone_dir, barrier)
+        task = {
+            "barrier": barrier,
+            "engine": engine,
+            "stores": store_list,
+            "files": files,
+            "shard": context.shard,
+            "signature_applied": context.signature_applied,
+            "max_signature_failures": context.max_signature_failures,
+            "minimize": None if context.minimizer is None
+            else context.minimizer.kind,
+        }
+        # the task is pickled right away, the engine state changes
+        # at the next barrier, also when the task is run by a thread
+        future = self._executor.submit(
+            _explore, pickle.dumps(task, pickle.HIGHEST_PROTOCOL),
+            self._checker)
+        self._pending.append((barrier, engine_name, store_list, files,
+                              future))
+        while self._pending and (self._pending[0][-1].done() or
+                                 len(self._pending) > self._limit):
+            self._merge(context)
+
+    def _merge(self, context):
+        barrier, engine_name, store_list, files, future = \
+            self._pending.popleft()
+        try:
+            result = future.result()
+        finally:
+            for _, clone, _, _ in files:
+                os.remove(clone)
+        context.report.coverage.update(result["coverage"])
+        metrics.count("sequences", result["sequences"])
+        for seq_num, message, persisted, minimized in result["failures"]:
+            metrics.count("failures")
+            seq = [store_list[i] for i in persisted]
+            failure = Failure(barrier, engine_name, seq_num, context.seed)
+            sig = signature(store_list, seq, context.signature_applied)
+            new = sig not in context.report.signatures
+            count = context.report.add_failure(failure, sig, barrier)
+            context.logger.warning("{} (failure {})".format(message,
+                                                            failure))
+            context.logger.warning(partial(statemachine.call_trace, seq))
+            if new and minimized is not None:
+                stores = [store_list[i] for i in minimized]
+                kind = context.minimizer.kind
+                context.report.add_minimized(failure, kind, stores)
+                context.logger.warning(
+                    "Failure {} minimized to {} {} stores"
+                    .format(failure, len(stores), kind))
+                context.logger.warning(partial(statemachine.call_trace,
+                                               stores))
+            limit = context.max_signature_failures
+            if limit is not None and count >= limit:
+                context.logger.warning(
+                    "{} failures of the same signature in barrier {}, "
+                    "skipping the rest of it".format(count, barrier))
+
+    def drain(self, context):
+        """
+        Waits for all handed over barriers and adds their results to the
+        report.
+
+        :param context: The reordering context.
+        :type context: opscontext.OpsContext
+        :return: None
+        """
+        while self._pending:
+            self._merge(context)
+
+    def close(self, context):
+        """
+        Drains the pipeline, stops the workers and removes the clones.
+
+        :param context: The reordering context.
+        :type context: opscontext.OpsContext
+        :return: None
+        """
+        try:
+            self.drain(context)
+        finally:
+            self._executor.shutdown()
+            for directory in self._dirs.values():
+                shutil.rmtree(directory, ignore_errors=True)
+            self._dirs = {}
@@ -1,14 +1,137 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright 2018-2019, Intel Corporation
 
+import api
 import argparse
-import statemachine
-import opscontext
+import atexit
+import json
+import storelog
 import consistencycheckwrap
 import loggingfacility
 import markerparser
+import os
+import shutil
+import signal
 import sys
 import reorderengines
+from reorderexceptions import NotSupportedOperationException
+from report import Failure
+from metrics import metrics
+
+
+def failure_id(identifier):
+    """
+    Parses the failure identifier given in the command line.
+    """
+    try:
+        return Failure.from_identifier(identifier)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def budget_spec(text):
+    """
+    Parses the budget given in the command line.
+    """
+    import budget
+    try:
+        return budget.BudgetScheduler.parse(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def shard_spec(text):
+    """
+    Parses the shard given in the command line.
+    """
+    import shard
+    try:
+        return shard.Shard.parse(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def merge_main(argv):
+    """
+    Merges the reports of the shards of a run, see the --shard option.
+    """
+    parser = argparse.ArgumentParser(prog="pmreorder merge",
+                                     description="Merge the reports " +
+                                     "of all shards of a pmreorder run")
+    parser.add_argument("reports",
+                        nargs="+",
+                        metavar="REPORT",
+                        help="the report of a shard saved with --report")
+    parser.add_argument("-o", "--output",
+                        help="save the merged report as a json file")
+    args = parser.parse_args(argv)
+    import shard
+    try:
+        merged = shard.merge_files(args.reports, args.output)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error("cannot merge the reports: {}".format(e))
+
+    print("{} shards, {} failures, coverage: {} of {} pairs".format(
+        merged["shards"], len(merged["failures"]),
+        merged["coverage"]["covered"], merged["coverage"]["pairs"]))
+    for failure in merged["failures"]:
+        print("Failure: {}".format(failure))
+    if not merged["consistent"] or merged["errors"]:
+        sys.exit(1)
+
+
+def batch_main(argv):
+    """
+    Checks the store logs listed in a manifest in a single run.
+    """
+    parser = argparse.ArgumentParser(prog="pmreorder batch",
+                                     description="Check many store logs " +
+                                     "listed in a json manifest")
+    parser.add_argument("manifest",
+                        metavar="MANIFEST",
+                        help="the json manifest of the store logs")
+    parser.add_argument("-o", "--output",
+                        help="save the consolidated report as a json file")
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        default=1,
+                        metavar="N",
+                        help="check the store logs concurrently in N worker " +
+                        "processes, 0 for the number of CPUs, default=1")
+    parser.add_argument("--in-memory",
+                        action="store_true",
+                        help="replay the stores on in-memory copies of the " +
+                        "registered files, which are never modified")
+    args = parser.parse_args(argv)
+    import batch
+    try:
+        entries = batch.load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error("cannot load the manifest: {}".format(e))
+    if args.jobs == 0:
+        args.jobs = os.cpu_count()
+    if args.jobs < 1:
+        parser.error("the number of jobs must be positive")
+
+    results = []
+    for result in batch.run_batch(entries, args.jobs, args.in_memory):
+        results.append(result)
+        report = result["report"]
+        for error in report["errors"]:
+            print("{}: error: {}".format(result["log"], error))
+        print("{}: {} failures in {:.1f}s".format(
+            result["log"], len(report["failures"]), result["seconds"]))
+    consolidated = batch.batch_report(results)
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(consolidated, output, indent=4)
+
+    print("{} store logs, {} inconsistent, {} failed".format(
+        len(results),
+        sum(not result["report"]["consistent"] for result in results),
+        sum(bool(result["report"]["errors"]) for result in results)))
+    if not consolidated["consistent"] or consolidated["errors"]:
+        sys.exit(1)
 
 
 def main():
@@ -20,16 +143,26 @@ def main():
     not any of regular parameters we use it as a version of pmreorder and
     remove it from the arguments list.
     '''
-    if len(sys.argv) > 1 and sys.argv[1][0] != "-":
+    if len(sys.argv) > 1 and sys.argv[1][0] != "-" and \
+            sys.argv[1] not in ("merge", "batch"):
         pmreorder_version = sys.argv[1]
         del sys.argv[1]
 
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        merge_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch_main(sys.argv[2:])
+        return
+
     # TODO unicode support
     # TODO parameterize reorder engine type
     parser = argparse.ArgumentParser(description="Store reordering tool")
     parser.add_argument("-l", "--logfile",
-                        required=True,
-                        help="the pmemcheck log file to process")
+                        help="the pmemcheck log file to process, - for " +
+                        "the standard input, may be compressed with gzip, " +
+                        "xz or zstd; with --pmemcheck-cmd, the file the " +
+                        "log is saved to")
     parser.add_argument("-c", "--checker",
                         choices=consistencycheckwrap.checkers,
                         default=consistencycheckwrap.checkers[0],
@@ -55,11 +188,172 @@ def main():
                         version="%(prog)s " + pmreorder_version)
     engines_keys = list(reorderengines.engines.keys())
     parser.add_argument("-r", "--default-engine",
-                        help="set default reorder engine " +
-                        "default=NoReorderNoChecker",
-                        choices=engines_keys,
+                        help="set default reorder engine, optionally " +
+                        "with parameters, e.g. ReorderPartial(max_seq=10) " +
+                        "default=NoReorderNoChecker, available engines: " +
+                        ", ".join(engines_keys),
                         default=engines_keys[0])
+    parser.add_argument("--engine-plugin",
+                        action="append",
+                        default=[],
+                        metavar="MODULE",
+                        help="load additional reorder engines from the " +
+                        "python module or file, may be given multiple times")
+    parser.add_argument("-s", "--seed",
+                        type=int,
+                        help="seed for the randomized reorder engines")
+    parser.add_argument("--replay",
+                        type=failure_id,
+                        metavar="FAILURE_ID",
+                        help="rebuild the crash image of the reported " +
+                        "failure, leave it in the registered files and exit")
+    parser.add_argument("--budget",
+                        type=budget_spec,
+                        help="limit the number of checker calls, e.g. " +
+                        "10000, or the run time, e.g. 90s, 30m or 2h; " +
+                        "the reordering of barriers exceeding their share " +
+                        "of the budget is downgraded")
+    parser.add_argument("--report",
+                        help="save the report of the run as a json file")
+    parser.add_argument("--checkpoint",
+                        metavar="DIR",
+                        help="periodically save the progress to the given " +
+                        "directory")
+    parser.add_argument("--checkpoint-interval",
+                        type=float,
+                        default=600,
+                        metavar="SECONDS",
+                        help="minimal time between checkpoints, " +
+                        "default=600")
+    parser.add_argument("--resume",
+                        action="store_true",
+                        help="resume from the last checkpoint, if any")
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        default=1,
+                        metavar="N",
+                        help="check the barriers concurrently in N worker " +
+                        "processes, 0 for the number of CPUs, default=1")
+    parser.add_argument("--threads",
+                        action="store_true",
+                        help="run the jobs in threads sharing the checker, " +
+                        "which has to be thread-safe")
+    parser.add_argument("--in-memory",
+                        action="store_true",
+                        help="replay the stores on in-memory copies of the " +
+                        "registered files, which are never modified")
+    parser.add_argument("--snapshot-interval",
+                        type=int,
+                        metavar="K",
+                        help="save the state of the registered files at " +
+                        "every K-th barrier, for later runs to start from")
+    parser.add_argument("--snapshot-dir",
+                        metavar="DIR",
+                        help="the directory of the barrier snapshots, " +
+                        "default=LOGFILE.snapshots")
+    parser.add_argument("--from-barrier",
+                        type=int,
+                        default=0,
+                        metavar="B",
+                        help="check only the barriers starting with B, " +
+                        "start from the nearest snapshot if any")
+    parser.add_argument("--shard",
+                        type=shard_spec,
+                        metavar="I/N",
+                        help="check only the I-th of N deterministic, " +
+                        "balanced parts of the sequences, merge the " +
+                        "reports with 'pmreorder merge'")
+    parser.add_argument("--signature",
+                        choices=["missing", "applied"],
+                        default="missing",
+                        help="group the failures by the call sites of the " +
+                        "stores missing from, or applied to, the " +
+                        "inconsistent image, default=missing")
+    parser.add_argument("--max-signature-failures",
+                        type=int,
+                        metavar="N",
+                        help="stop checking the barrier or marker region " +
+                        "after N failures of the same signature")
+    parser.add_argument("--signature-scope",
+                        choices=["barrier", "region"],
+                        default="barrier",
+                        help="the scope of --max-signature-failures, " +
+                        "default=barrier")
+    parser.add_argument("--max-signatures",
+                        type=int,
+                        metavar="M",
+                        help="stop the run after M distinct failure " +
+                        "signatures")
+    parser.add_argument("--minimize",
+                        choices=["missing", "applied"],
+                        help="shrink the first inconsistent sequence of " +
+                        "each signature to a minimal set of the stores " +
+                        "missing from, or applied to, the image")
+    parser.add_argument("--estimate",
+                        action="store_true",
+                        help="only estimate the number of sequences and " +
+                        "the time of the run, without checking the stores; " +
+                        "with --report, the estimate of each barrier is " +
+                        "saved as a json file")
+    parser.add_argument("--metrics",
+                        metavar="FILE",
+                        help="collect the performance counters and timing " +
+                        "histograms and save them as a json file at exit " +
+                        "or on SIGUSR1")
+    parser.add_argument("--pmemcheck-cmd",
+                        metavar="COMMAND",
+                        help="run the application with its arguments under " +
+                        "pmemcheck and check its stores while it runs")
+    parser.add_argument("--log-compression",
+                        choices=[name for name, _ in storelog.COMPRESSIONS],
+                        help="compress the log saved with --pmemcheck-cmd " +
+                        "and -l/--logfile")
+    parser.add_argument("--file-alias",
+                        action="append",
+                        default=[],
+                        metavar="FILE=REPLAY_FILE",
+                        help="replay the stores to the registered FILE on " +
+                        "REPLAY_FILE, may be given multiple times")
+    parser.add_argument("--profile",
+                        metavar="FILE",
+                        help="run under cProfile and save the statistics " +
+                        "to the given file")
     args = parser.parse_args()
+    if args.logfile is None and args.pmemcheck_cmd is None:
+        parser.error("-l/--logfile or --pmemcheck-cmd is required")
+    if args.log_compression is not None:
+        if args.pmemcheck_cmd is None or args.logfile is None:
+            parser.error("--log-compression requires --pmemcheck-cmd and " +
+                         "-l/--logfile")
+        if args.log_compression == "zstd" and storelog.zstandard is None:
+            parser.error("zstd compression requires the zstandard module")
+    streaming = args.pmemcheck_cmd is not None or \
+        storelog.is_stream(args.logfile)
+    if any("=" not in alias for alias in args.file_alias):
+        parser.error("--file-alias requires FILE=REPLAY_FILE")
+    if args.estimate and args.replay is not None:
+        parser.error("--estimate cannot be used with --replay")
+    if args.jobs == 0:
+        args.jobs = os.cpu_count()
+    try:
+        api.validate(streaming=streaming, budget=args.budget,
+                     shard=args.shard, resume=args.resume,
+                     checkpoint=args.checkpoint,
+                     snapshot_interval=args.snapshot_interval,
+                     from_barrier=args.from_barrier, jobs=args.jobs,
+                     max_signatures=args.max_signatures,
+                     max_signature_failures=args.max_signature_failures,
+                     signature_scope=args.signature_scope,
+                     replay=args.replay, in_memory=args.in_memory,
+                     threads=args.threads)
+    except ValueError as e:
+        parser.error(str(e))
+    for plugin in args.engine_plugin:
+        reorderengines.load_plugin(plugin)
+    try:
+        reorderengines.get_engine(args.default_engine)
+    except NotSupportedOperationException as e:
+        parser.error(str(e))
     logger = loggingfacility.get_logger(
                                         args.output,
                                         args.output_level)
@@ -69,18 +363,86 @@ def main():
                                                args.name)
 
     markers = markerparser.MarkerParser().get_markers(args.extended_macros)
+    file_aliases = dict(alias.split("=", 1) for alias in args.file_alias)
+
+    if args.metrics is not None:
+        metrics.enabled = True
+        atexit.register(metrics.dump, args.metrics)
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: metrics.dump(args.metrics))
+    profiler = None
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    pmemcheck = None
+    log = args.logfile
+    if args.pmemcheck_cmd is not None:
+        pmemcheck = storelog.PmemcheckRun(args.pmemcheck_cmd, args.logfile,
+                                          compression=args.log_compression)
+        if shutil.which(pmemcheck.valgrind) is None:
+            parser.error("valgrind not found: {}".format(pmemcheck.valgrind))
+        log = pmemcheck.operations()
+
+    if args.estimate:
+        try:
+            estimate = api.estimate(log, checker,
+                                    engine=args.default_engine,
+                                    markers=markers, seed=args.seed,
+                                    logger=logger, file_aliases=file_aliases,
+                                    in_memory=args.in_memory)
+        except NotSupportedOperationException as e:
+            parser.error(str(e))
+        if pmemcheck is not None:
+            log.close()
+        estimate.print_summary()
+        if args.report is not None:
+            estimate.save(args.report)
+        return
+
+    try:
+        report = api.run(log, checker, engine=args.default_engine,
+                         markers=markers, seed=args.seed, replay=args.replay,
+                         logger=logger, file_aliases=file_aliases,
+                         budget=args.budget, shard=args.shard,
+                         signature=args.signature,
+                         signature_scope=args.signature_scope,
+                         max_signature_failures=args.max_signature_failures,
+                         max_signatures=args.max_signatures,
+                         minimize=args.minimize, checkpoint=args.checkpoint,
+                         checkpoint_interval=args.checkpoint_interval,
+                         resume=args.resume,
+                         snapshot_interval=args.snapshot_interval,
+                         snapshot_dir=args.snapshot_dir,
+                         from_barrier=args.from_barrier, jobs=args.jobs,
+                         in_memory=args.in_memory, threads=args.threads)
+    except NotSupportedOperationException as e:
+        # e.g. an unknown engine of a marker or an unsupported compression
+        parser.error(str(e))
+    if pmemcheck is not None:
+        # stop reading the log and wait for the application
+        log.close()
+        if pmemcheck.returncode != 0:
+            message = "pmemcheck exited with status {}".format(
+                pmemcheck.returncode)
+            logger.error(message)
+            report.add_error(message)
 
-    # create the script context
-    context = opscontext.OpsContext(
-                                    args.logfile,
-                                    checker,
-                                    logger,
-                                    args.default_engine,
-                                    markers)
-
-    # init and run the state machine
-    a = statemachine.StateMachine(statemachine.InitState(context))
-    if a.run_all(context.extract_operations()) is False:
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    if report.budget is not None:
+        logger.info("Budget spent: {}, {} barriers downgraded"
+                    .format(report.budget, len(report.downgrades)))
+    logger.info("Coverage: {}".format(report.coverage))
+    logger.info("{} failures with {} distinct signatures"
+                .format(len(report.failures), len(report.signatures)))
+    if report.signatures:
+        logger.info(report.summary)
+    if args.report is not None:
+        report.save(args.report)
+    if report.errors or not report.consistent():
         sys.exit(1)
 
 
@@ -5,11 +5,17 @@
 from itertools import combinations
 from itertools import permutations
 from itertools import islice
-from itertools import chain
-from random import sample
+from random import Random
 from functools import partial
+from math import comb
 from reorderexceptions import NotSupportedOperationException
+from storecoverage import StoreCoverage
+from inspect import signature
 import collections
+import ast
+import importlib
+import importlib.util
+import os
 
 
 class FullReorderEngine:
@@ -51,6 +57,21 @@ class FullReorderEngine:
             for permutation in permutations(store_list, length):
                 yield permutation
 
+    def count_sequences(self, length):
+        """
+        Counts all permutations of all lengths of the given number of stores.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
+        total = count = 1
+        for k in range(length):
+            count *= length - k
+            total += count
+        return total
+
 
 class AccumulativeReorderEngine:
     def __init__(self):
@@ -80,6 +101,17 @@ class AccumulativeReorderEngine:
             out_list = [store_list[i] for i in range(0, i)]
             yield out_list
 
+    def count_sequences(self, length):
+        """
+        Counts the accumulative lists of the given number of stores.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
+        return length + 1
+
 
 class AccumulativeReverseReorderEngine:
     def __init__(self):
@@ -109,10 +141,25 @@ class AccumulativeReverseReorderEngine:
         for i in range(len(store_list) + 1):
             yield [store_list[j] for j in range(i)]
 
+    def count_sequences(self, length):
+        """
+        Counts the reversed accumulative lists of the given number of stores.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
+        return length + 1
+
 
 class SlicePartialReorderEngine:
     """
     Generates a slice of the full reordering of stores within a given list.
+    The combinations are ordered by their length and lexicographically
+    within the same length. Each combination of the slice is unranked
+    directly from its index, so the slice costs only as much as
+    the sequences it yields, regardless of where it starts.
     Example:
         input: (a, b, c), start = 2, stop = None, step = 2
         output:
@@ -133,7 +180,18 @@ class SlicePartialReorderEngine:
         self._step = step
         self.test_on_barrier = True
 
-    def generate_sequence(self, store_list):
+    def _indices(self, length):
+        """
+        Returns the indices of the combinations within the slice.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The indices of the combinations.
+        :rtype: range
+        """
+        return range(1 << length)[self._start:self._stop:self._step]
+
+    def generate_sequence(self, store_list, first=0):
         """
         This generator yields a slice of all possible combinations.
 
@@ -142,13 +200,130 @@ class SlicePartialReorderEngine:
 
         :param store_list: The list of stores to be reordered.
         :type store_list: list of :class:`memoryoperations.Store`
+        :param first: The number of sequences of the slice to be skipped.
+        :type first: int
         :return: Yields a slice of all combinations of stores.
         :rtype: iterable
         """
-        for sl in islice(chain(*map(lambda x: combinations(store_list, x),
-                         range(0, len(store_list) + 1))),
-                         self._start, self._stop, self._step):
-            yield sl
+        indices = self._indices(len(store_list))[first:]
+        if not indices:
+            return
+        if indices.step != 1:
+            for index in indices:
+                yield tuple(store_list[i] for i in
+                            unrank_combination(len(store_list), index))
+            return
+        # consecutive combinations are cheaper to advance than to unrank
+        combination = unrank_combination(len(store_list), indices.start)
+        for _ in indices:
+            yield tuple(store_list[i] for i in combination)
+            combination = next_combination(len(store_list), combination)
+
+    def count_sequences(self, length):
+        """
+        Counts the combinations within the slice.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
+        # len() of the range overflows beyond 2^63 combinations
+        return _range_length(self._indices(length))
+
+
+def _range_length(indices):
+    """
+    Returns the number of elements of the range, which unlike :func:`len`
+    is not limited to the size of the C integer.
+
+    :param indices: The range.
+    :type indices: range
+    :return: The number of elements.
+    :rtype: int
+    """
+    if indices.step > 0:
+        span = indices.stop - indices.start
+    else:
+        span = indices.start - indices.stop
+    step = abs(indices.step)
+    return max(0, (span + step - 1) // step)
+
+
+def unrank_combination(n, index):
+    """
+    Returns the combination of the given index among all combinations
+    of n elements, ordered by their length and lexicographically
+    within the same length, as generated by chained
+    :func:`itertools.combinations`.
+
+    :param n: The number of elements.
+    :type n: int
+    :param index: The index of the combination, from 0 to 2^n - 1.
+    :type index: int
+    :return: The indices of the elements of the combination.
+    :rtype: list of int
+    """
+    if not 0 <= index < 1 << n:
+        raise IndexError("combination index out of range")
+    length = 0
+    while index >= comb(n, length):
+        index -= comb(n, length)
+        length += 1
+    combination = []
+    element = 0
+    for remaining in range(length, 0, -1):
+        # skip the elements which start too few combinations
+        while index >= comb(n - element - 1, remaining - 1):
+            index -= comb(n - element - 1, remaining - 1)
+            element += 1
+        combination.append(element)
+        element += 1
+    return combination
+
+
+def next_combination(n, combination):
+    """
+    Returns the combination following the given one in the order
+    of :func:`unrank_combination`.
+
+    :param n: The number of elements.
+    :type n: int
+    :param combination: The indices of the elements of the combination.
+    :type combination: list of int
+    :return: The indices of the elements of the next combination, or None
+        after the last combination.
+    :rtype: list of int
+    """
+    length = len(combination)
+    for pos in range(length - 1, -1, -1):
+        if combination[pos] < n - length + pos:
+            first = combination[pos] + 1
+            return combination[:pos] + \
+                list(range(first, first + length - pos))
+    if length == n:
+        return None
+    return list(range(length + 1))
+
+
+def generate_sequences(engine, store_list, first=0):
+    """
+    Yields the sequences generated by the engine, starting from
+    the sequence of the given index. Engines which can skip sequences
+    accept the *first* argument of *generate_sequence*, the sequences
+    of the other engines are generated and dropped.
+
+    :param engine: The reorder engine.
+    :param store_list: The list of stores to be reordered.
+    :type store_list: list of :class:`memoryoperations.Store`
+    :param first: The index of the first sequence.
+    :type first: int
+    :return: Yields the sequences of stores.
+    :rtype: iterable
+    """
+    if first and "first" in signature(engine.generate_sequence).parameters:
+        return engine.generate_sequence(store_list, first)
+    return islice(engine.generate_sequence(store_list), first, None)
 
 
 class FilterPartialReorderEngine:
@@ -179,13 +354,30 @@ class FilterPartialReorderEngine:
                (a, c)
                (b, c)
     """
+    # the filter functions and the arguments they require
+    filters = {
+        "filter_min_elem": ("kwarg1",),
+        "filter_max_elem": ("kwarg1",),
+        "filter_between_elem": ("kwarg1", "kwarg2"),
+    }
+
     def __init__(self, func, **kwargs):
         """
         Initializes the generator with the provided parameters.
 
-        :param func: The filter function.
+        :param func: The name of the filter function.
         :param **kwargs: Arguments to the filter function.
+        :raises: NotSupportedOperationException if the filter function is
+            unknown or its arguments are missing.
         """
+        if not isinstance(func, str) or func not in self.filters:
+            raise NotSupportedOperationException(
+                      "Not supported filter function: {}".format(func))
+        for arg in self.filters[func]:
+            if not isinstance(kwargs.get(arg), int):
+                raise NotSupportedOperationException(
+                          "Filter function {} requires the integer {}"
+                          .format(func, arg))
         self._filter = func
         self._filter_kwargs = kwargs
         self.test_on_barrier = True
@@ -228,12 +420,80 @@ class FilterPartialReorderEngine:
         :return: Yields a filtered set of combinations.
         :rtype: iterable
         """
+        filter_fun = partial(getattr(self, self._filter, None),
+                             **self._filter_kwargs)
+        # the filters depend only on the number of elements, so only
+        # the combinations of the accepted lengths are generated
+        for length in range(0, len(store_list) + 1):
+            if not filter_fun(range(length)):
+                continue
+            for elem in combinations(store_list, length):
+                yield elem
+
+    def count_sequences(self, length):
+        """
+        Counts the combinations passing the filter.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
         filter_fun = getattr(self, self._filter, None)
-        for elem in filter(
-                       partial(filter_fun, **self._filter_kwargs), chain(
-                           *map(lambda x: combinations(store_list, x), range(
-                               0, len(store_list) + 1)))):
-            yield elem
+        return sum(comb(length, k) for k in range(0, length + 1)
+                   if filter_fun(range(k), **self._filter_kwargs))
+
+
+class MissingStoresReorderEngine:
+    """
+    Generates the combinations of stores with at most k stores missing.
+    Example:
+        input: (a, b, c), k = 1
+        output:
+               ('a', 'b', 'c')
+               ('b', 'c')
+               ('a', 'c')
+               ('a', 'b')
+    """
+    def __init__(self, k=1):
+        """
+        Initializes the generator with the provided parameters.
+
+        :param k: The maximal number of missing stores.
+        """
+        self._k = k
+        self.test_on_barrier = True
+
+    def generate_sequence(self, store_list):
+        """
+        This generator yields the combinations missing up to k stores.
+
+        The combinations of the missing stores are generated directly, so
+        the cost is polynomial in the number of stores for a given k.
+
+        :param store_list: The list of stores to be reordered.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :return: Yields the combinations missing up to k stores.
+        :rtype: iterable
+        """
+        length = len(store_list)
+        for missing_count in range(0, min(self._k, length) + 1):
+            for missing in combinations(range(length), missing_count):
+                missing = set(missing)
+                yield tuple(st for i, st in enumerate(store_list)
+                            if i not in missing)
+
+    def count_sequences(self, length):
+        """
+        Counts the combinations missing up to k of the given stores.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
+        return sum(comb(length, k)
+                   for k in range(0, min(self._k, length) + 1))
 
 
 class RandomPartialReorderEngine:
@@ -246,36 +506,181 @@ class RandomPartialReorderEngine:
                ('b',)
                ('a', 'b', 'c')
     """
-    def __init__(self, max_seq=3):
+    def __init__(self, max_seq=3, seed=None, ordered=False):
         """
         Initializes the generator with the provided parameters.
 
         :param max_seq: The number of combinations to be generated.
+        :param seed: The seed of the random number generator. If None,
+            the generator is seeded from the system entropy source.
+        :param ordered: If True, random orderings of the stores are
+            generated instead of subsets preserving the original order.
         """
         self.test_on_barrier = True
         self._max_seq = max_seq
+        self._ordered = ordered
+        self._seed = seed
+        self._random = Random(seed)
+
+    def reseed(self, barrier):
+        """
+        Derives the state of the generator from the seed and the barrier.
+
+        This makes the sequences generated for a given barrier independent
+        of the sequences generated for the preceding ones.
+
+        :param barrier: The index of the barrier.
+        :type barrier: int
+        :return: None
+        """
+        if self._seed is not None:
+            self._random.seed("{}:{}".format(self._seed, barrier))
+
+    def _population_exceeds(self, length):
+        """
+        Checks whether more than max_seq distinct sequences can be drawn.
+        """
+        if not self._ordered:
+            return (1 << length) > self._max_seq
+        total = count = 1
+        for k in range(length):
+            count *= length - k
+            total += count
+            if total > self._max_seq:
+                return True
+        return False
 
     def generate_sequence(self, store_list):
         """
         This generator yields a random sequence of combinations.
-        Number of combinations without replacement has to be limited to
-        1000 because of exponential growth of elements.
-        Example:
-            for 10 element from 80 -> 1646492110120 combinations
-            for 20 element from 80 -> 3.5353161422122E+18 combinations
-            for 40 element from 80 -> 1.0750720873334E+23 combinations
+
+        The sequences are drawn one at a time, without building the
+        population of all combinations. First the length of the sequence
+        is drawn uniformly from 0 to the number of stores, then a random
+        subset (or ordering) of that length is selected. Sequences are not
+        repeated within a single call. If the number of all possible
+        sequences does not exceed max_seq, all of them are generated.
+
         :param store_list: The list of stores to be reordered.
         :type store_list: list of :class:`memoryoperations.Store`
         :return: Yields a random sequence of combinations.
         :rtype: iterable
         """
-        population = list(chain(*map(
-                          lambda x: islice(combinations(store_list, x), 1000),
-                          range(0, len(store_list) + 1))))
-        population_size = len(population)
-        for elem in sample(population, self._max_seq if self._max_seq <=
-                           population_size else population_size):
-            yield elem
+        length = len(store_list)
+        if not self._population_exceeds(length):
+            generate = permutations if self._ordered else combinations
+            for k in range(0, length + 1):
+                for elem in generate(store_list, k):
+                    yield elem
+            return
+
+        drawn = set()
+        while len(drawn) < self._max_seq:
+            indices = self._draw(length, drawn)
+            drawn.add(indices)
+            yield tuple(store_list[i] for i in indices)
+
+    def _draw(self, length, drawn):
+        """
+        Draws the indices of a random sequence not drawn before.
+
+        :param length: The number of stores.
+        :type length: int
+        :param drawn: The indices of the sequences drawn before.
+        :type drawn: set of tuples
+        :return: The indices of the stores in the sequence.
+        :rtype: tuple
+        """
+        while True:
+            indices = self._random.sample(range(length),
+                                          self._random.randint(0, length))
+            if not self._ordered:
+                indices.sort()
+            indices = tuple(indices)
+            if indices not in drawn:
+                return indices
+
+    def count_sequences(self, length):
+        """
+        Counts the random sequences, which is max_seq unless there are
+        fewer distinct sequences.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
+        if self._population_exceeds(length):
+            return self._max_seq
+        if self._ordered:
+            return FullReorderEngine().count_sequences(length)
+        return 1 << length
+
+
+class CoverageGuidedReorderEngine(RandomPartialReorderEngine):
+    """
+    Generates random sequences of stores prioritising new coverage.
+
+    The coverage is the set of pairs of a store call site and whether the
+    store is persisted in the checked crash image. For each sequence a
+    number of random candidates is drawn and the one covering the most
+    pairs not covered before is chosen.
+    Example:
+        input: (a, b, c), max_seq = 3, a and b from the same call site
+        output:
+               ('a',)
+               ('c',)
+               ('b', 'c')
+    """
+    def __init__(self, max_seq=3, seed=None, ordered=False, candidates=16,
+                 coverage=None):
+        """
+        Initializes the generator with the provided parameters.
+
+        :param max_seq: The number of combinations to be generated.
+        :param seed: The seed of the random number generator.
+        :param ordered: If True, random orderings of the stores are
+            generated instead of subsets preserving the original order.
+        :param candidates: The number of candidates drawn per sequence.
+        :param coverage: The coverage of the checked crash images, shared
+            with the rest of the reordering.
+        :type coverage: storecoverage.StoreCoverage
+        """
+        super(CoverageGuidedReorderEngine, self).__init__(max_seq, seed,
+                                                          ordered)
+        self._candidates = candidates
+        self._coverage = coverage if coverage is not None \
+            else StoreCoverage()
+
+    def generate_sequence(self, store_list):
+        """
+        This generator yields the sequences covering the most new pairs.
+
+        :param store_list: The list of stores to be reordered.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :return: Yields a coverage-guided sequence of combinations.
+        :rtype: iterable
+        """
+        length = len(store_list)
+        if not self._population_exceeds(length):
+            for elem in super(CoverageGuidedReorderEngine,
+                              self).generate_sequence(store_list):
+                yield elem
+            return
+
+        drawn = set()
+        while len(drawn) < self._max_seq:
+            best = None
+            best_gain = -1
+            for _ in range(self._candidates):
+                indices = self._draw(length, drawn)
+                seq = tuple(store_list[i] for i in indices)
+                gain = self._coverage.gain(store_list, seq)
+                if gain > best_gain:
+                    best, best_gain = (indices, seq), gain
+            drawn.add(best[0])
+            self._coverage.cover(store_list, best[1])
+            yield best[1]
 
 
 class NoReorderEngine:
@@ -298,6 +703,17 @@ class NoReorderEngine:
         """
         return [store_list]
 
+    def count_sequences(self, length):
+        """
+        Always one sequence - the unmodified list of stores.
+
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
+        return 1
+
 
 class NoCheckerEngine:
     def __init__(self):
@@ -320,22 +736,178 @@ class NoCheckerEngine:
         """
         return [store_list]
 
+    def count_sequences(self, length):
+        """
+        Always one sequence - the unmodified list of stores.
 
-def get_engine(engine):
-    if engine in engines:
-        reorder_engine = engines[engine]()
-    else:
+        :param length: The number of stores to be reordered.
+        :type length: int
+        :return: The number of sequences.
+        :rtype: int
+        """
+        return 1
+
+
+def parse_engine_spec(spec):
+    """
+    Splits an engine specification into the engine name and parameters.
+
+    The specification is either a bare engine name or a call-like
+    expression with keyword arguments given as python literals.
+    Example:
+        "ReorderFull" -> ("ReorderFull", {})
+        "ReorderPartial(max_seq=10)" -> ("ReorderPartial", {"max_seq": 10})
+
+    :param spec: The engine specification.
+    :type spec: str
+    :return: The engine name and the dict of its parameters.
+    :rtype: tuple
+    :raises: NotSupportedOperationException on malformed specification.
+    """
+    try:
+        expr = ast.parse(spec.strip(), mode="eval").body
+        if isinstance(expr, ast.Name):
+            return expr.id, {}
+        if isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name) \
+                and not expr.args:
+            return expr.func.id, {kw.arg: ast.literal_eval(kw.value)
+                                  for kw in expr.keywords}
+    except (SyntaxError, ValueError):
+        pass
+
+    raise NotSupportedOperationException(
+              "Invalid reorder engine specification: {}"
+              .format(spec))
+
+
+def get_engine_name(engine):
+    """
+    Returns the name under which the engine type is registered.
+
+    :param engine: The reorder engine object.
+    :return: The name of the engine.
+    :rtype: str
+    """
+    for name, engine_class in engines.items():
+        if type(engine) is engine_class:
+            return name
+    return type(engine).__name__
+
+
+def create_engine(name, params, seed=None, coverage=None):
+    """
+    Creates the registered reorder engine with the given parameters.
+
+    The seed and the coverage are passed to the engines which accept
+    them, unless given explicitly in the parameters.
+
+    :param name: The name of the engine.
+    :type name: str
+    :param params: The parameters of the engine.
+    :type params: dict
+    :param seed: The default seed for randomized engines.
+    :type seed: int
+    :param coverage: The coverage for coverage-guided engines.
+    :type coverage: storecoverage.StoreCoverage
+    :return: The reorder engine object.
+    :raises: NotSupportedOperationException if the engine is not
+        registered or does not accept the parameters.
+    """
+    if name not in engines:
         raise NotSupportedOperationException(
                   "Not supported reorder engine: {}"
-                  .format(engine))
+                  .format(name))
+
+    params = dict(params)
+    accepted = signature(engines[name]).parameters
+    if "seed" in accepted:
+        params.setdefault("seed", seed)
+    if "coverage" in accepted:
+        params.setdefault("coverage", coverage)
+    try:
+        reorder_engine = engines[name](**params)
+    except TypeError as e:
+        raise NotSupportedOperationException(
+                  "Invalid parameters of reorder engine {}: {}"
+                  .format(name, e))
 
     return reorder_engine
 
 
+def get_engine(engine, seed=None, coverage=None):
+    """
+    Creates the reorder engine described by the specification.
+
+    :param engine: The engine specification, see :func:`parse_engine_spec`.
+    :type engine: str
+    :param seed: The default seed for randomized engines.
+    :type seed: int
+    :param coverage: The coverage for coverage-guided engines.
+    :type coverage: storecoverage.StoreCoverage
+    :return: The reorder engine object.
+    """
+    name, params = parse_engine_spec(engine)
+    return create_engine(name, params, seed, coverage)
+
+
+def register_engine(name, engine_class):
+    """
+    Makes the reorder engine available under the given name.
+
+    The engine class is instantiated with the parameters given in the
+    engine specification. The engine object has to provide:
+
+        * the *test_on_barrier* attribute, False if the stores are not to
+          be checked at all,
+        * the *generate_sequence(store_list)* method, returning an
+          iterable of sequences of stores to be checked,
+        * the *count_sequences(length)* method, returning the number of
+          sequences generated for the given number of stores.
+
+    Optionally, it may provide the *reseed(barrier)* method, called before
+    the sequences for each barrier are generated. Engines accepting the
+    *seed* or *coverage* parameters get the seed of the run and the shared
+    :class:`storecoverage.StoreCoverage` object by default.
+
+    :param name: The name of the engine.
+    :type name: str
+    :param engine_class: The class of the engine.
+    :return: None
+    :raises: ValueError if the name is already taken.
+    """
+    if name in engines:
+        raise ValueError("Reorder engine already registered: {}"
+                         .format(name))
+    engines[name] = engine_class
+
+
+def load_plugin(plugin):
+    """
+    Loads a python module registering additional reorder engines.
+
+    The module is expected to call :func:`register_engine` when imported.
+
+    :param plugin: The name of the module or the path to the python file.
+    :type plugin: str
+    :return: The loaded module.
+    """
+    if plugin.endswith(".py") or os.sep in plugin:
+        name = os.path.splitext(os.path.basename(plugin))[0]
+        spec = importlib.util.spec_from_file_location(name, plugin)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return importlib.import_module(plugin)
+
+
 engines = collections.OrderedDict([
            ('NoReorderNoCheck', NoCheckerEngine),
            ('ReorderFull', FullReorderEngine),
            ('NoReorderDoCheck', NoReorderEngine),
            ('ReorderAccumulative', AccumulativeReorderEngine),
            ('ReorderReverseAccumulative', AccumulativeReverseReorderEngine),
-           ('ReorderPartial', RandomPartialReorderEngine)])
+           ('ReorderPartial', RandomPartialReorderEngine),
+           ('ReorderCoverage', CoverageGuidedReorderEngine),
+           ('ReorderMissing', MissingStoresReorderEngine),
+           ('ReorderSlice', SlicePartialReorderEngine),
+           ('ReorderFilter', FilterPartialReorderEngine)])
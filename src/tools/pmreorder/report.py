@@ -0,0 +1,298 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+from collections import OrderedDict
+import json
+from storecoverage import StoreCoverage
+
+
+def signature(store_list, seq, applied=False):
+    """
+    Computes the signature of an inconsistent sequence.
+
+    The signature is the set of the call sites of the stores missing from
+    the crash image, or of the stores persisted in it. Failures with the
+    same signature usually have the same root cause.
+
+    :param store_list: All flushed stores of the barrier.
+    :type store_list: list of :class:`memoryoperations.Store`
+    :param seq: The stores persisted in the crash image.
+    :type seq: iterable of :class:`memoryoperations.Store`
+    :param applied: Use the persisted stores instead of the missing ones.
+    :type applied: bool
+    :return: The sorted call sites.
+    :rtype: tuple
+    """
+    if applied:
+        stores = seq
+    else:
+        persisted = set(seq)
+        stores = [st for st in store_list if st not in persisted]
+    return tuple(sorted(set(StoreCoverage.site(st) for st in stores)))
+
+
+class Failure:
+    """
+    Describes a single inconsistent sequence of stores.
+
+    The failure is identified by the index of the persistent memory barrier,
+    the reorder engine used at that barrier, the index of the sequence
+    generated by the engine and the seed of the randomized engines. This is
+    enough to rebuild the crash image in a subsequent run with the same
+    store log and configuration.
+
+    :ivar barrier: The index of the barrier, counted from 0.
+    :type barrier: int
+    :ivar engine: The name of the reorder engine.
+    :type engine: str
+    :ivar sequence: The index of the sequence generated by the engine.
+    :type sequence: int
+    :ivar seed: The seed of the randomized reorder engines.
+    :type seed: int
+    """
+    separator = ":"
+
+    def __init__(self, barrier, engine, sequence, seed):
+        """
+        Initializes the failure description.
+
+        :param barrier: The index of the barrier.
+        :type barrier: int
+        :param engine: The name of the reorder engine.
+        :type engine: str
+        :param sequence: The index of the sequence.
+        :type sequence: int
+        :param seed: The seed of the randomized reorder engines.
+        :type seed: int
+        """
+        self.barrier = barrier
+        self.engine = engine
+        self.sequence = sequence
+        self.seed = seed
+
+    def __str__(self):
+        return self.identifier
+
+    @property
+    def identifier(self):
+        """
+        The stable identifier of the failure.
+
+        :return: The identifier in the barrier:engine:sequence:seed format.
+        :rtype: str
+        """
+        return self.separator.join(map(str, (self.barrier, self.engine,
+                                             self.sequence, self.seed)))
+
+    @staticmethod
+    def from_identifier(identifier):
+        """
+        Creates the failure description from its identifier.
+
+        :param identifier: The identifier of the failure.
+        :type identifier: str
+        :return: The failure description.
+        :rtype: Failure
+        :raises: ValueError when the identifier is malformed.
+        """
+        fields = identifier.split(Failure.separator)
+        if len(fields) != 4:
+            raise ValueError("Invalid failure identifier: {}"
+                             .format(identifier))
+        barrier, engine, sequence, seed = fields
+        return Failure(int(barrier), engine, int(sequence), int(seed))
+
+
+class Report:
+    """
+    Aggregates the results of the consistency checks.
+
+    :ivar failures: The inconsistent sequences found, in order.
+    :type failures: list of :class:`Failure`
+    :ivar downgrades: The barriers checked with a different engine than
+        configured, or not checked at all, because of the limited budget.
+    :type downgrades: list of dict
+    :ivar coverage: The coverage of the checked crash images.
+    :type coverage: storecoverage.StoreCoverage
+    :ivar shard: The part of the checks done by the run, None if the run
+        is not sharded.
+    :type shard: shard.Shard
+    :ivar run: The description of the run configuration, recorded in
+        sharded runs to verify that the merged reports belong together.
+    :type run: dict
+    :ivar signatures: The failures grouped by their signatures, in the
+        order of the first failure of each signature.
+    :type signatures: collections.OrderedDict
+    :ivar minimized: The minimized inconsistent sequences.
+    :type minimized: list of dict
+    :ivar errors: The errors which made the run fail, apart from the
+        inconsistent sequences, e.g. a failure which cannot be replayed.
+    :type errors: list of str
+    :ivar budget: The scheduler of the checks budget of the run, None if
+        unlimited.
+    :type budget: budget.BudgetScheduler
+    """
+    def __init__(self):
+        self.failures = []
+        self.downgrades = []
+        self.coverage = StoreCoverage()
+        self.shard = None
+        self.run = None
+        self.signatures = OrderedDict()
+        self.minimized = []
+        self.errors = []
+        self.budget = None
+        self._scope_failures = {}
+
+    def add_failure(self, failure, sig=None, scope=None):
+        """
+        Records an inconsistent sequence.
+
+        :param failure: The failure description.
+        :type failure: Failure
+        :param sig: The signature of the failure, see :func:`signature`.
+        :type sig: tuple
+        :param scope: The part of the run, e.g. the barrier or the marker
+            region, in which the failures of the signature are counted.
+        :return: The number of failures with the signature in the scope.
+        :rtype: int
+        """
+        self.failures.append(failure)
+        if sig is None:
+            return 1
+        group = self.signatures.get(sig)
+        if group is None:
+            group = self.signatures[sig] = {"failures": 0, "first": failure,
+                                            "barriers": set()}
+        group["failures"] += 1
+        group["barriers"].add(failure.barrier)
+        key = (scope, sig)
+        self._scope_failures[key] = self._scope_failures.get(key, 0) + 1
+        return self._scope_failures[key]
+
+    def add_downgrade(self, barrier, engine, replacement, stores):
+        """
+        Records a barrier which was not checked as configured.
+
+        :param barrier: The index of the barrier.
+        :type barrier: int
+        :param engine: The name of the configured engine.
+        :type engine: str
+        :param replacement: The specification of the engine used instead,
+            None if the barrier was not checked.
+        :type replacement: str
+        :param stores: The number of stores at the barrier.
+        :type stores: int
+        :return: None
+        """
+        self.downgrades.append({
+            "barrier": barrier,
+            "engine": engine,
+            "replacement": replacement,
+            "stores": stores,
+        })
+
+    def add_minimized(self, failure, kind, stores):
+        """
+        Records the minimal set of stores of an inconsistent sequence.
+
+        :param failure: The failure description.
+        :type failure: Failure
+        :param kind: "missing" or "applied", the kind of the stores.
+        :type kind: str
+        :param stores: The minimal set of stores.
+        :type stores: list of :class:`memoryoperations.Store`
+        :return: None
+        """
+        self.minimized.append({
+            "failure": failure.identifier,
+            "kind": kind,
+            "stores": [{"address": hex(st.address), "size": st.size,
+                        "trace": list(StoreCoverage.site(st))}
+                       for st in stores],
+        })
+
+    def summary(self):
+        """
+        Describes the failures deduplicated by their signatures.
+
+        :return: The description of each signature, one per line.
+        :rtype: str
+        """
+        lines = []
+        for num, (sig, group) in enumerate(self.signatures.items()):
+            lines.append("Signature {}: {} failures at {} barriers, "
+                         "first failure {}".format(
+                             num, group["failures"], len(group["barriers"]),
+                             group["first"]))
+            for site in sig:
+                lines.append("    " + " <- ".join(site))
+        return "\n".join(lines)
+
+    def scope_failures(self, scope):
+        """
+        Returns the largest number of failures of a single signature
+        in the scope.
+
+        :param scope: The scope, as given to :meth:`add_failure`.
+        :return: The number of failures.
+        :rtype: int
+        """
+        return max((count for (s, sig), count in self._scope_failures.items()
+                    if s == scope), default=0)
+
+    def to_dict(self):
+        """
+        Describes the report with basic types, e.g. to be saved as json.
+
+        :return: The description of the report.
+        :rtype: dict
+        """
+        result = {
+            "consistent": self.consistent(),
+            "failures": [failure.identifier for failure in self.failures],
+            "signatures": [{
+                "sites": [list(site) for site in sig],
+                "failures": group["failures"],
+                "first": group["first"].identifier,
+                "barriers": sorted(group["barriers"]),
+            } for sig, group in self.signatures.items()],
+            "minimized": self.minimized,
+            "errors": self.errors,
+            "downgrades": self.downgrades,
+            "coverage": self.coverage.to_dict(self.shard is not None),
+        }
+        if self.shard is not None:
+            result["shard"] = self.shard.to_dict()
+            result["run"] = self.run
+        return result
+
+    def save(self, filename):
+        """
+        Saves the report as a json file.
+
+        :param filename: The name of the report file.
+        :type filename: str
+        :return: None
+        """
+        with open(filename, "w") as report_file:
+            json.dump(self.to_dict(), report_file, indent=4)
+
+    def add_error(self, message):
+        """
+        Records an error which made the run fail.
+
+        :param message: The description of the error.
+        :type message: str
+        :return: None
+        """
+        self.errors.append(message)
+
+    def consistent(self):
+        """
+        Checks whether no inconsistent sequence has been found.
+
+        :return: True if all checked sequences were consistent.
+        :rtype: bool
+        """
+        return not self.failures
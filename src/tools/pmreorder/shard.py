@@ -0,0 +1,180 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+import json
+
+
+class Shard:
+    """
+    Selects a deterministic part of the (barrier, sequence) space.
+
+    The sequence of the given index at the given barrier belongs to the
+    shard *(barrier + sequence) mod count*. The sequences of every barrier
+    are dealt out round robin, starting with a different shard at each
+    barrier, so the shards get the same number of checks, give or take
+    one per barrier, and no coordination is needed between them.
+
+    :ivar index: The index of the shard, counted from 0.
+    :type index: int
+    :ivar count: The number of shards.
+    :type count: int
+    """
+    def __init__(self, index, count):
+        """
+        Initializes the shard.
+
+        :param index: The index of the shard.
+        :type index: int
+        :param count: The number of shards.
+        :type count: int
+        :raises: ValueError when the index is out of range.
+        """
+        if count < 1 or not 0 <= index < count:
+            raise ValueError("Invalid shard: {}/{}".format(index, count))
+        self.index = index
+        self.count = count
+
+    def __str__(self):
+        return "{}/{}".format(self.index, self.count)
+
+    @staticmethod
+    def parse(text):
+        """
+        Parses the shard given as index/count, e.g. 0/4.
+
+        :param text: The shard description.
+        :type text: str
+        :return: The shard.
+        :rtype: Shard
+        :raises: ValueError when the description is malformed.
+        """
+        fields = text.split("/")
+        if len(fields) != 2:
+            raise ValueError("Invalid shard: {}".format(text))
+        return Shard(int(fields[0]), int(fields[1]))
+
+    def owns(self, barrier, sequence):
+        """
+        Checks whether the sequence belongs to the shard.
+
+        :param barrier: The index of the barrier.
+        :type barrier: int
+        :param sequence: The index of the sequence at the barrier.
+        :type sequence: int
+        :return: True if the sequence is to be checked by the shard.
+        :rtype: bool
+        """
+        return (barrier + sequence) % self.count == self.index
+
+    def to_dict(self):
+        """
+        Describes the shard with basic types.
+
+        :return: The index and the count of shards.
+        :rtype: dict
+        """
+        return {"index": self.index, "count": self.count}
+
+
+def merge(results):
+    """
+    Merges the reports of all shards of a run into a single report.
+
+    The merged report is consistent only if the report of every shard
+    is consistent. The failure identifiers do not depend on the shard,
+    so the failures can be replayed without sharding.
+
+    :param results: The reports of the shards, as saved with --report.
+    :type results: list of dict
+    :return: The merged report.
+    :rtype: dict
+    :raises: ValueError when the reports do not cover each shard of
+        the same run exactly once.
+    """
+    if not results:
+        raise ValueError("No shard results to merge")
+    for result in results:
+        if "shard" not in result:
+            raise ValueError("Not a shard result")
+    run = results[0].get("run")
+    count = results[0]["shard"]["count"]
+    indices = sorted(result["shard"]["index"] for result in results)
+    for result in results:
+        if result.get("run") != run:
+            raise ValueError("Shard results of different runs")
+        if result["shard"]["count"] != count:
+            raise ValueError("Shard results with different shard counts")
+    if indices != list(range(count)):
+        missing = sorted(set(range(count)) - set(indices))
+        raise ValueError("Shards missing: {}, duplicated: {}".format(
+            missing, sorted(set(i for i in indices
+                                if indices.count(i) > 1))))
+
+    def order(identifier):
+        # failure identifiers start with the barrier and the sequence index
+        # follows the engine, sort them the way an unsharded run does
+        fields = identifier.split(":")
+        return int(fields[0]), int(fields[-2])
+
+    failures = []
+    for result in results:
+        failures.extend(result["failures"])
+    failures.sort(key=order)
+
+    sites = set()
+    covered = set()
+    for result in results:
+        coverage = result["coverage"]
+        sites.update(tuple(site) for site in coverage.get("sites", []))
+        covered.update((tuple(site), persisted) for site, persisted in
+                       coverage.get("covered_pairs", []))
+
+    signatures = {}
+    for result in results:
+        for group in result.get("signatures", []):
+            key = tuple(tuple(site) for site in group["sites"])
+            merged = signatures.get(key)
+            if merged is None:
+                signatures[key] = dict(group)
+                continue
+            merged["failures"] += group["failures"]
+            merged["barriers"] = sorted(set(merged["barriers"]) |
+                                        set(group["barriers"]))
+            if order(group["first"]) < order(merged["first"]):
+                merged["first"] = group["first"]
+
+    return {
+        "consistent": all(result["consistent"] for result in results),
+        "failures": failures,
+        "signatures": sorted(signatures.values(),
+                             key=lambda group: order(group["first"])),
+        "downgrades": [d for result in results
+                       for d in result["downgrades"]],
+        "errors": [e for result in results for e in result.get("errors", [])],
+        "coverage": {"covered": len(covered), "pairs": 2 * len(sites)},
+        "run": run,
+        "shards": count,
+    }
+
+
+def merge_files(filenames, output):
+    """
+    Merges the shard reports saved in the given files.
+
+    :param filenames: The names of the shard report files.
+    :type filenames: list of str
+    :param output: The name of the merged report file, None to skip saving.
+    :type output: str
+    :return: The merged report.
+    :rtype: dict
+    :raises: ValueError when the reports cannot be merged.
+    """
+    results = []
+    for filename in filenames:
+        with open(filename) as result_file:
+            results.append(json.load(result_file))
+    merged = merge(results)
+    if output is not None:
+        with open(output, "w") as merged_file:
+            json.dump(merged, merged_file, indent=4)
+    return merged
@@ -0,0 +1,198 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+import json
+import os
+import pickle
+import shutil
+
+from metrics import metrics
+import statemachine
+
+
+class SnapshotStore:
+    """
+    Caches the state of the registered files at every K-th barrier.
+
+    The snapshot of the barrier *N* holds the files and the collecting
+    state right before the barrier *N* is processed, so a later run with
+    the same store log can start at any snapshot instead of replaying the
+    whole log. The first snapshot written by a run holds full, sparse
+    images of the files, the following ones only the pages changed since
+    the previous snapshot. Each snapshot is written to a temporary
+    directory, which is renamed once complete.
+
+    The snapshots depend only on the store log, the store is cleared
+    when the log changes.
+
+    :ivar _directory: The snapshot directory.
+    :type _directory: str
+    :ivar _interval: The number of barriers between snapshots, None if
+        the snapshots are only read.
+    :type _interval: int
+    :ivar _base: The barrier of the snapshot holding the state the files
+        had when the changed pages started to be tracked, None if the
+        next snapshot is to hold full images.
+    :type _base: int
+    :ivar _fingerprint: The description of the store log.
+    :type _fingerprint: dict
+    :ivar valid: Whether the snapshots belong to the store log.
+    :type valid: bool
+    """
+    version = 1
+    log = "log"
+    state = "state"
+
+    def __init__(self, directory, log_file, interval=None):
+        """
+        Opens the snapshot store.
+
+        :param directory: The snapshot directory.
+        :type directory: str
+        :param log_file: The name of the store log.
+        :type log_file: str
+        :param interval: The number of barriers between snapshots, None
+            to only read the existing snapshots.
+        :type interval: int
+        """
+        self._directory = directory
+        self._interval = interval
+        self._base = None
+        stat = os.stat(log_file)
+        self._fingerprint = {
+            "version": self.version,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        self.valid = self._read_fingerprint() == self._fingerprint
+        if interval is not None and not self.valid:
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            with open(os.path.join(directory, self.log), "w") as log:
+                json.dump(self._fingerprint, log)
+            self.valid = True
+
+    def _read_fingerprint(self):
+        try:
+            with open(os.path.join(self._directory, self.log)) as log:
+                return json.load(log)
+        except (OSError, ValueError):
+            return None
+
+    def _path(self, barrier):
+        return os.path.join(self._directory, "barrier.{}".format(barrier))
+
+    def barriers(self):
+        """
+        Lists the barriers with a snapshot.
+
+        :return: The sorted indices of the barriers.
+        :rtype: list of int
+        """
+        if not self.valid:
+            return []
+        barriers = []
+        for name in os.listdir(self._directory):
+            prefix, _, barrier = name.partition(".")
+            if prefix == "barrier" and barrier.isdigit():
+                barriers.append(int(barrier))
+        return sorted(barriers)
+
+    def nearest(self, barrier):
+        """
+        Finds the latest snapshot preceding the barrier.
+
+        :param barrier: The index of the barrier.
+        :type barrier: int
+        :return: The barrier of the snapshot, None if there is none.
+        :rtype: int
+        """
+        preceding = [b for b in self.barriers() if b <= barrier]
+        return preceding[-1] if preceding else None
+
+    def save(self, context):
+        """
+        Saves the snapshot of the current barrier if it is due.
+
+        The registered files have to hold the state of the persistent
+        memory right before the current barrier.
+
+        :param context: The reordering context.
+        :type context: opscontext.OpsContext
+        :return: None
+        """
+        barrier = context.barrier
+        if self._interval is None or barrier % self._interval != 0:
+            return
+        handler = context.file_handler
+        path = self._path(barrier)
+        if os.path.exists(path):
+            # the files are in the state saved by a previous run
+            handler.forget_pages()
+            self._base = barrier
+            return
+
+        base_files = set()
+        if self._base is not None:
+            base_files = set(entry[0] for entry in
+                             self._load(self._base)["files"])
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        state = {
+            "barrier": barrier,
+            "base": self._base,
+            "position": context.position + 1,
+            "trans_stores": statemachine.State.trans_stores,
+            "stack": [entry[0] for entry in context.stack_engines],
+            "files": handler.save_snapshot(tmp, base_files),
+        }
+        with open(os.path.join(tmp, self.state), "wb") as state_file:
+            pickle.dump(state, state_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+        self._base = barrier
+        metrics.count("snapshots")
+        context.logger.info("Snapshot of barrier {} saved".format(barrier))
+
+    def _load(self, barrier):
+        with open(os.path.join(self._path(barrier), self.state),
+                  "rb") as state_file:
+            return pickle.load(state_file)
+
+    def restore(self, context, barrier):
+        """
+        Restores the reordering context from the latest snapshot preceding
+        the barrier.
+
+        :param context: The reordering context, without registered files.
+        :type context: opscontext.OpsContext
+        :param barrier: The index of the barrier.
+        :type barrier: int
+        :return: The state from which the reordering is to be resumed and
+            the position of the first operation to be processed, or None
+            if there is no snapshot.
+        :rtype: tuple
+        """
+        nearest = self.nearest(barrier)
+        if nearest is None:
+            return None
+        chain = []
+        snapshot = nearest
+        while snapshot is not None:
+            state = self._load(snapshot)
+            chain.append(state)
+            snapshot = state["base"]
+        for state in reversed(chain):
+            context.file_handler.restore_snapshot(
+                state["files"], self._path(state["barrier"]))
+        context.file_handler.forget_pages()
+
+        state = chain[0]
+        self._base = nearest
+        statemachine.State.trans_stores = state["trans_stores"]
+        context.restore_stack(state["stack"])
+        context.barrier = nearest
+        context.logger.info("Starting from the snapshot of barrier {}"
+                            .format(nearest))
+
+        return (statemachine.ResumedState(context), state["position"])
@@ -3,10 +3,31 @@
 
 import memoryoperations as memops
 import reorderengines
+from metrics import metrics
+from functools import partial
+from time import monotonic
+from report import Failure
+from report import signature
 from reorderexceptions import InconsistentFileException
 from reorderexceptions import NotSupportedOperationException
 
 
+def call_trace(seq):
+    """
+    Describes the call traces of the stores of the sequence.
+
+    :param seq: The sequence of stores.
+    :type seq: iterable of :class:`memoryoperations.Store`
+    :return: The call traces.
+    :rtype: str
+    """
+    stacktrace = "Call trace:\n"
+    for num, op in enumerate(seq):
+        stacktrace += "Store [{}]:\n".format(num)
+        stacktrace += str(op.trace)
+    return stacktrace
+
+
 class State:
     """
     The base class of all states.
@@ -51,6 +72,15 @@ class State:
         """
         raise NotImplementedError
 
+    def finished(self):
+        """
+        Checks whether the processing of operations should be stopped.
+
+        :return: True if no more operations are to be processed.
+        :rtype: bool
+        """
+        return self._context.finished
+
 
 class InitState(State):
     """
@@ -85,6 +115,51 @@ class InitState(State):
         return True
 
 
+class ResumedState(State):
+    """
+    The initial no-op state of the reordering resumed from a checkpoint.
+
+    :ivar _pending: The barrier interrupted by the checkpoint, as the list
+        of its stores and the index of the next sequence to be checked.
+    :type _pending: tuple
+    """
+    def __init__(self, context, pending=None):
+        """
+        Saves the reordering context.
+
+        :param context: The reordering context.
+        :type context: opscontext.OpsContext
+        :param pending: The barrier interrupted by the checkpoint, None if
+            the checkpoint was made between barriers.
+        :type pending: tuple
+        """
+        super(ResumedState, self).__init__(context)
+        self._pending = pending
+
+    def next(self, in_op):
+        """
+        Switch to the next valid state.
+
+        :param in_op: Ignored.
+        :return: The next valid state.
+        :rtype: ReplayingState if a barrier was interrupted,
+            CollectingState otherwise
+        """
+        if self._pending is not None:
+            ops_list, first_sequence = self._pending
+            return ReplayingState(ops_list, self._context, first_sequence)
+        return CollectingState(self._context)
+
+    def run(self, in_op):
+        """
+        Does nothing.
+
+        :param in_op: Ignored.
+        :return: always True
+        """
+        return True
+
+
 class CollectingState(State):
     """
     Collects appropriate operations.
@@ -155,49 +230,22 @@ class CollectingState(State):
 
     def substitute_reorder(self, order_ops):
         """
-        Changes the reordering engine based on the log marker class.
+        Changes the reordering engine based on the log marker.
+
+        The engines are created once per specification and reused.
 
         :param order_ops: The reordering marker class.
         :type order_ops: subclass of :class:`memoryoperations.ReorderBase`
         :return: None
         """
-        if isinstance(order_ops, memops.ReorderFull):
-            self._context.reorder_engine = \
-                reorderengines.FullReorderEngine()
-            self._context.test_on_barrier = \
-                self._context.reorder_engine.test_on_barrier
-        elif isinstance(order_ops, memops.ReorderPartial):
-            # TODO add macro in valgrind or
-            # parameter inside the tool to support parameters?
-            self._context.reorder_engine = \
-                 reorderengines.RandomPartialReorderEngine(3)
-            self._context.test_on_barrier = \
-                self._context.reorder_engine.test_on_barrier
-        elif isinstance(order_ops, memops.ReorderAccumulative):
-            self._context.reorder_engine = \
-                reorderengines.AccumulativeReorderEngine()
-            self._context.test_on_barrier = \
-                self._context.reorder_engine.test_on_barrier
-        elif isinstance(order_ops, memops.ReorderReverseAccumulative):
-            self._context.reorder_engine = \
-                reorderengines.AccumulativeReverseReorderEngine()
-            self._context.test_on_barrier = \
-                self._context.reorder_engine.test_on_barrier
-        elif isinstance(order_ops, memops.NoReorderDoCheck):
-            self._context.reorder_engine = reorderengines.NoReorderEngine()
-            self._context.test_on_barrier = \
-                self._context.reorder_engine.test_on_barrier
-        elif isinstance(order_ops, memops.NoReorderNoCheck):
-            self._context.reorder_engine = reorderengines.NoCheckerEngine()
-            self._context.test_on_barrier = \
-                self._context.reorder_engine.test_on_barrier
-        elif isinstance(order_ops, memops.ReorderDefault):
+        if isinstance(order_ops, memops.ReorderDefault):
             self._context.reorder_engine = self._context.default_engine
             self._context.test_on_barrier = self._context.default_barrier
         else:
-            raise NotSupportedOperationException(
-                                   "Not supported reorder engine: {}"
-                                   .format(order_ops))
+            self._context.reorder_engine = \
+                self._context.get_engine(order_ops.engine, order_ops.params)
+            self._context.test_on_barrier = \
+                self._context.reorder_engine.test_on_barrier
 
     def flush_stores(self, flush_op):
         """
@@ -222,7 +270,8 @@ class CollectingState(State):
         :type file_op: memoryoperations.Register_file
         :return: None
         """
-        self._context.file_handler.add_file(file_op.name,
+        name = self._context.file_aliases.get(file_op.name, file_op.name)
+        self._context.file_handler.add_file(name,
                                             file_op.address,
                                             file_op.size)
 
@@ -258,15 +307,18 @@ class ReplayingState(State):
     :ivar _ops_list: The list of stores to be reordered and replayed.
     :type _ops_list: list of :class:`memoryoperations.Store`
     """
-    def __init__(self, in_ops_list, context):
+    def __init__(self, in_ops_list, context, first_sequence=0):
         """
 
         :param in_ops_list:
         :param context:
+        :param first_sequence: The index of the first sequence to be
+            checked, used when resuming from a checkpoint.
         :return:
         """
         super(ReplayingState, self).__init__(context)
         self._ops_list = in_ops_list
+        self._first_sequence = first_sequence
 
     def next(self, in_op):
         """
@@ -297,42 +349,273 @@ class ReplayingState(State):
         # consider only flushed stores
         flushed_stores = list(filter(lambda x: x.flushed, self._ops_list))
 
-        # already flushed stores should be removed from the transitive list
-        common_part = list(set(flushed_stores) & set(State.trans_stores))
-        State.trans_stores = list(set(State.trans_stores) - set(common_part))
+        # already flushed stores should be removed from the transitive list,
+        # the order of the stores is kept to make the sequences repeatable
+        common_part = set(flushed_stores)
+        State.trans_stores = [st for st in State.trans_stores
+                              if st not in common_part]
 
         # do not add redundant stores
-        State.trans_stores = list(set(State.trans_stores) |
-                                  set(list(filter(lambda x: x.flushed is False,
-                                      self._ops_list))))
-
-        if self._context.test_on_barrier:
-            for seq in self._context.reorder_engine.generate_sequence(
-                                                              flushed_stores):
-                for op in seq:
-                    # do stores
-                    self._context.file_handler.do_store(op)
+        trans_part = set(State.trans_stores)
+        State.trans_stores += [st for st in self._ops_list
+                               if st.flushed is False and
+                               st not in trans_part]
+
+        barrier = self._context.barrier
+        engine = self._context.reorder_engine
+        metrics.count("barriers")
+        metrics.observe("stores_per_barrier", len(flushed_stores))
+
+        if self._context.estimate is not None:
+            self._context.estimate.add_barrier(barrier,
+                                               self._context.region(), engine,
+                                               flushed_stores,
+                                               self._context.test_on_barrier)
+            self._context.barrier += 1
+            return True
+        if hasattr(engine, "reseed"):
+            engine.reseed(barrier)
+
+        if self._context.replay is not None:
+            if barrier == self._context.replay.barrier:
+                return self.replay_failure(flushed_stores)
+            if self._context.test_on_barrier and \
+                    self._context.replay.engine == "ReorderCoverage":
+                # coverage-guided sequences depend on the coverage
+                # of the preceding barriers, which has to be rebuilt
+                for seq in engine.generate_sequence(flushed_stores):
+                    self._context.report.coverage.cover(flushed_stores, seq)
+        elif self._context.test_on_barrier and \
+                barrier >= self._context.first_barrier and \
+                not self.scope_exhausted():
+            engine_name = reorderengines.get_engine_name(engine)
+            budget = self._context.budget
+            if budget is not None:
+                engine, engine_name = budget.allocate(self._context, barrier,
+                                                      engine, flushed_stores)
+            sequences = reorderengines.generate_sequences(
+                engine, flushed_stores, self._first_sequence) \
+                if engine is not None else []
+            pipeline = self._context.pipeline
+            if pipeline is not None and engine is not None:
+                if pipeline.accepts(engine):
+                    # the sequences are checked by the pipeline workers
+                    pipeline.submit(self._context, engine, engine_name,
+                                    flushed_stores)
+                    sequences = []
+                else:
+                    # the engine depends on the results of the preceding
+                    # barriers
+                    pipeline.drain(self._context)
+            shard = self._context.shard
+            metrics.count("checked_barriers")
+            for seq_num, seq in enumerate(sequences, self._first_sequence):
+                metrics.count("sequences")
+                if shard is not None and not shard.owns(barrier, seq_num):
+                    continue
+                self.checkpoint(seq_num)
+                stop = False
+                minimize = None
+                # do stores
+                self._context.file_handler.do_stores(seq)
+                metrics.count("stores_applied", len(seq))
+                self._context.report.coverage.cover(flushed_stores, seq)
                 # check consistency of all files
+                start = monotonic()
                 try:
                     self._context.file_handler.check_consistency()
                 except InconsistentFileException as e:
                     consistency = False
-                    self._context.logger.warning(e)
-                    stacktrace = "Call trace:\n"
-                    for num, op in enumerate(seq):
-                        stacktrace += "Store [{}]:\n".format(num)
-                        stacktrace += str(op.trace)
-                    self._context.logger.warning(stacktrace)
+                    metrics.count("failures")
+                    failure = Failure(barrier, engine_name, seq_num,
+                                      self._context.seed)
+                    if self._context.minimizer is not None and \
+                            signature(flushed_stores, seq,
+                                      self._context.signature_applied) \
+                            not in self._context.report.signatures:
+                        # minimize the first failure of each signature
+                        minimize = failure
+                    stop = self.add_failure(failure, flushed_stores, seq)
+                    self._context.logger.warning(
+                        "{} (failure {})".format(e, failure))
+                    # the call trace is built only if it is emitted
+                    self._context.logger.warning(partial(call_trace, seq))
+
+                finally:
+                    metrics.observe_time("check", start)
+                    if budget is not None:
+                        budget.consume(monotonic() - start)
 
                 for op in reversed(seq):
                     # revert the changes
                     self._context.file_handler.do_revert(op)
-        # write all flushed stores
-        for op in flushed_stores:
-            self._context.file_handler.do_store(op)
+                metrics.count("stores_reverted", len(seq))
+                if minimize is not None:
+                    self.minimize(minimize, flushed_stores, seq)
+                if stop:
+                    break
+        elif self._context.budget is not None:
+            self._context.budget.skip()
+        # write all flushed stores, they are never reverted
+        self._context.file_handler.do_stores(flushed_stores, save=False)
+        metrics.count("stores_applied", len(flushed_stores))
+        self._context.barrier += 1
+        if self._context.snapshots is not None:
+            self._context.snapshots.save(self._context)
+        self.checkpoint()
 
         return consistency
 
+    def scope(self):
+        """
+        Returns the scope in which the failures of a signature are counted.
+
+        :return: The index of the barrier or the name of the marker region.
+        """
+        if self._context.signature_scope == "region":
+            return self._context.region()
+        return self._context.barrier
+
+    def scope_exhausted(self):
+        """
+        Checks whether the checks of the current scope have been stopped
+        after too many failures of a single signature.
+
+        :return: True if the barrier is not to be checked.
+        :rtype: bool
+        """
+        limit = self._context.max_signature_failures
+        return limit is not None and \
+            self._context.report.scope_failures(self.scope()) >= limit
+
+    def add_failure(self, failure, flushed_stores, seq):
+        """
+        Records the failure and decides whether to stop the checks.
+
+        :param failure: The failure description.
+        :type failure: report.Failure
+        :param flushed_stores: All flushed stores of the barrier.
+        :type flushed_stores: list of :class:`memoryoperations.Store`
+        :param seq: The stores persisted in the inconsistent image.
+        :type seq: iterable of :class:`memoryoperations.Store`
+        :return: True if no more sequences are to be checked
+            at the barrier.
+        :rtype: bool
+        """
+        context = self._context
+        sig = signature(flushed_stores, seq, context.signature_applied)
+        count = context.report.add_failure(failure, sig, self.scope())
+        if context.max_signatures is not None and \
+                len(context.report.signatures) >= context.max_signatures:
+            context.logger.warning(
+                "{} distinct failure signatures found, stopping"
+                .format(len(context.report.signatures)))
+            context.finished = True
+            return True
+        limit = context.max_signature_failures
+        if limit is not None and count >= limit:
+            context.logger.warning(
+                "{} failures of the same signature in {} {}, "
+                "skipping the rest of it"
+                .format(count, context.signature_scope, self.scope()))
+            return True
+        return False
+
+    def minimize(self, failure, flushed_stores, seq):
+        """
+        Minimizes the inconsistent sequence and reports the result.
+
+        :param failure: The failure description.
+        :type failure: report.Failure
+        :param flushed_stores: All flushed stores of the barrier.
+        :type flushed_stores: list of :class:`memoryoperations.Store`
+        :param seq: The stores persisted in the inconsistent image.
+        :type seq: iterable of :class:`memoryoperations.Store`
+        :return: None
+        """
+        minimizer = self._context.minimizer
+        stores = minimizer.minimize(flushed_stores, seq)
+        kind = minimizer.kind
+        self._context.report.add_minimized(failure, kind, stores)
+        self._context.logger.warning(
+            "Failure {} minimized to {} {} stores"
+            .format(failure, len(stores), kind))
+        self._context.logger.warning(partial(call_trace, stores))
+
+    def checkpoint(self, sequence=None):
+        """
+        Saves the checkpoint of the reordering if it is due.
+
+        :param sequence: The index of the next sequence to be checked,
+            None if the barrier has been processed.
+        :type sequence: int
+        :return: None
+        """
+        checkpointer = self._context.checkpointer
+        if checkpointer is None or not checkpointer.due():
+            return
+        if sequence is None:
+            checkpointer.save(self._context)
+        else:
+            checkpointer.save(self._context, (self._ops_list, sequence))
+
+    def replay_error(self, message):
+        """
+        Logs and reports the error of the replay.
+
+        :param message: The description of the error.
+        :type message: str
+        :return: None
+        """
+        self._context.logger.error(message)
+        self._context.report.add_error(message)
+
+    def replay_failure(self, flushed_stores):
+        """
+        Rebuilds the crash image of the replayed failure.
+
+        The stores of the failing sequence are written to the registered
+        files and left there for inspection. No consistency check is made
+        and the processing of the log is finished afterwards.
+
+        :param flushed_stores: The flushed stores of the replayed barrier.
+        :type flushed_stores: list of :class:`memoryoperations.Store`
+        :return: True if the crash image was rebuilt, False otherwise.
+        :rtype: bool
+        """
+        failure = self._context.replay
+        engine = self._context.reorder_engine
+        engine_name = reorderengines.get_engine_name(engine)
+        self._context.finished = True
+        if engine_name != failure.engine:
+            # the engine might have been downgraded by the budget scheduler
+            self._context.logger.warning(
+                "Engine {} used at barrier {}, replaying with {}"
+                .format(engine_name, failure.barrier, failure.engine))
+            try:
+                engine = reorderengines.get_engine(failure.engine,
+                                                   failure.seed)
+            except NotSupportedOperationException as e:
+                self.replay_error("Cannot replay failure {}: {}"
+                                  .format(failure, e))
+                return False
+            if hasattr(engine, "reseed"):
+                engine.reseed(failure.barrier)
+
+        seq = next(reorderengines.generate_sequences(
+            engine, flushed_stores, failure.sequence), None)
+        if seq is None:
+            self.replay_error("Cannot replay failure {}: sequence out of "
+                              "range".format(failure))
+            return False
+
+        self._context.file_handler.do_stores(seq, save=False)
+        self._context.logger.warning(
+            "Crash image of failure {} left in the registered files"
+            .format(failure))
+
+        return True
+
 
 class StateMachine:
     """
@@ -362,8 +645,18 @@ class StateMachine:
         all_consistent = True
         for ops in operations:
             self._curr_state = self._curr_state.next(ops)
-            check = self._curr_state.run(ops)
+            if metrics.enabled:
+                state = type(self._curr_state).__name__
+                metrics.count("operations")
+                start = monotonic()
+                check = self._curr_state.run(ops)
+                metrics.count("state_runs." + state)
+                metrics.count("state_seconds." + state, monotonic() - start)
+            else:
+                check = self._curr_state.run(ops)
             if check is False:
                 all_consistent = check
+            if self._curr_state.finished():
+                break
 
         return all_consistent
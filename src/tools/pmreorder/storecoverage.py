@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+
+class StoreCoverage:
+    """
+    Tracks the coverage of the checked crash images.
+
+    A crash image covers a pair of a store call site, identified by the
+    stack trace of the store, and whether the store is persisted in the
+    image or not.
+
+    :ivar _sites: The call sites of all stores seen at checked barriers.
+    :type _sites: set of tuples
+    :ivar _covered: The covered pairs of a call site and the persistence.
+    :type _covered: set of tuples
+    """
+    def __init__(self):
+        self._sites = set()
+        self._covered = set()
+
+    def __str__(self):
+        return "{} of {} (trace site, persisted) pairs covered".format(
+            len(self._covered), 2 * len(self._sites))
+
+    @staticmethod
+    def site(store):
+        """
+        Returns the call site of the store.
+
+        :param store: The store operation.
+        :type store: memoryoperations.Store
+        :return: The stack trace of the store.
+        :rtype: tuple
+        """
+        return tuple(store.trace.trace or ())
+
+    def _pairs(self, store_list, seq):
+        persisted = set(seq)
+        return set((self.site(st), st in persisted) for st in store_list)
+
+    def gain(self, store_list, seq):
+        """
+        Counts the pairs not covered before by the given crash image.
+
+        :param store_list: All flushed stores of the barrier.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :param seq: The stores persisted in the crash image.
+        :type seq: iterable of :class:`memoryoperations.Store`
+        :return: The number of new pairs.
+        :rtype: int
+        """
+        return len(self._pairs(store_list, seq) - self._covered)
+
+    def cover(self, store_list, seq):
+        """
+        Records the pairs covered by the given crash image.
+
+        :param store_list: All flushed stores of the barrier.
+        :type store_list: list of :class:`memoryoperations.Store`
+        :param seq: The stores persisted in the crash image.
+        :type seq: iterable of :class:`memoryoperations.Store`
+        :return: None
+        """
+        self._sites.update(self.site(st) for st in store_list)
+        self._covered |= self._pairs(store_list, seq)
+
+    def update(self, other):
+        """
+        Adds the coverage tracked separately, e.g. by another process.
+
+        :param other: The coverage to be added.
+        :type other: StoreCoverage
+        :return: None
+        """
+        self._sites |= other._sites
+        self._covered |= other._covered
+
+    def to_dict(self, detailed=False):
+        """
+        Describes the coverage with basic types.
+
+        :param detailed: Also list the call sites and the covered pairs,
+            e.g. to merge the coverage of several runs.
+        :type detailed: bool
+        :return: The number of covered and all pairs.
+        :rtype: dict
+        """
+        result = {"covered": len(self._covered),
+                  "pairs": 2 * len(self._sites)}
+        if detailed:
+            result["sites"] = sorted(self._sites)
+            result["covered_pairs"] = sorted(self._covered)
+        return result
@@ -0,0 +1,330 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2020, Intel Corporation
+
+import gzip
+import io
+import lzma
+import os
+import shlex
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+
+from reorderexceptions import NotSupportedOperationException
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# the pmemcheck options producing the store log expected by pmreorder
+PMEMCHECK_OPTIONS = [
+    "--tool=pmemcheck",
+    "-q",
+    "--log-stores=yes",
+    "--print-summary=no",
+    "--log-stores-stacktraces=yes",
+    "--log-stores-stacktraces-depth=2",
+    "--expect-fence-after-clflush=yes",
+]
+
+# the compression methods of the logs, with the leading bytes of the
+# compressed data
+COMPRESSIONS = [
+    ("gzip", b"\x1f\x8b"),
+    ("xz", b"\xfd7zXZ\x00"),
+    ("zstd", b"\x28\xb5\x2f\xfd"),
+]
+
+# the number of leading bytes needed to detect the compression
+MAGIC_SIZE = max(len(magic) for _, magic in COMPRESSIONS)
+
+
+def is_stream(log_file):
+    """
+    Checks whether the log is to be read as a stream, i.e. it is the
+    standard input, given as "-", or a named pipe.
+
+    :param log_file: The name of the log file.
+    :type log_file: str
+    :return: True if the log is a stream.
+    :rtype: bool
+    """
+    if log_file == "-":
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(log_file).st_mode)
+    except OSError:
+        return False
+
+
+def get_compression(head):
+    """
+    Detects the compression of the log.
+
+    :param head: The leading bytes of the log.
+    :type head: bytes
+    :return: The compression method, None if the log is not compressed.
+    :rtype: str
+    """
+    for name, magic in COMPRESSIONS:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise NotSupportedOperationException(
+            "zstd compressed logs require the zstandard module")
+
+
+class _PrefixedReader(io.RawIOBase):
+    """
+    Reads the leading bytes already read from the stream, followed by
+    the rest of the stream.
+    """
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._stream.read1(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        super(_PrefixedReader, self).close()
+        self._stream.close()
+
+
+def _read_head(raw):
+    """
+    Reads the leading bytes of the log needed to detect its compression.
+
+    A stream may have fewer bytes available than the magic number when it
+    is opened, e.g. a pipe written in small chunks, so the bytes are read
+    until there are enough of them or the stream ends. The returned stream
+    reads the log from the beginning.
+
+    :param raw: The log opened for reading in binary mode.
+    :type raw: io.BufferedReader
+    :return: The leading bytes and the stream of the whole log.
+    :rtype: tuple
+    """
+    head = raw.peek(MAGIC_SIZE)
+    if len(head) >= MAGIC_SIZE:
+        return head, raw
+    head = b""
+    while len(head) < MAGIC_SIZE:
+        chunk = raw.read1(MAGIC_SIZE - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head, io.BufferedReader(_PrefixedReader(head, raw))
+
+
+def open_text(raw):
+    """
+    Opens the log for reading as text, decompressing it if it is
+    compressed.
+
+    :param raw: The log opened for reading in binary mode.
+    :type raw: io.BufferedReader
+    :return: The text stream of the log.
+    :rtype: io.TextIOBase
+    """
+    head, raw = _read_head(raw)
+    compression = get_compression(head)
+    if compression == "gzip":
+        raw = gzip.GzipFile(fileobj=raw, mode="rb")
+    elif compression == "xz":
+        raw = lzma.LZMAFile(raw)
+    elif compression == "zstd":
+        _require_zstandard()
+        raw = zstandard.ZstdDecompressor().stream_reader(
+            raw, read_across_frames=True)
+    return io.TextIOWrapper(raw)
+
+
+def create_log(log_file, compression=None):
+    """
+    Creates the log file for writing as text.
+
+    :param log_file: The name of the log file.
+    :type log_file: str
+    :param compression: The compression method of the log, one of
+        :data:`COMPRESSIONS`, None if the log is not to be compressed.
+    :type compression: str
+    :return: The log file opened for writing.
+    :rtype: io.TextIOBase
+    """
+    if compression is None:
+        return open(log_file, "w")
+    if compression == "gzip":
+        # the compression level of the gzip tool, the highest one is
+        # too slow to keep up with the application
+        return gzip.open(log_file, "wt", compresslevel=6)
+    if compression == "xz":
+        return lzma.open(log_file, "wt")
+    _require_zstandard()
+    return zstandard.open(log_file, "wt")
+
+
+def read_operations(log, chunk_size=1 << 20, copy=None):
+    """
+    Splits the logged operations while the log is being read.
+
+    :param log: The log file opened for reading.
+    :type log: file object
+    :param chunk_size: The number of characters read at once.
+    :type chunk_size: int
+    :param copy: The file to which the read log is copied, None if the log
+        is not to be saved.
+    :type copy: file object
+    :return: Yields the logged operations.
+    :rtype: iterable of str
+    """
+    rest = ""
+    while True:
+        chunk = log.read(chunk_size)
+        if not chunk:
+            break
+        if copy is not None:
+            copy.write(chunk)
+        operations = (rest + chunk).split("|")
+        rest = operations.pop()
+        for operation in operations:
+            yield operation
+    yield rest
+
+
+def open_log(log_file):
+    """
+    Reads the logged operations.
+
+    Regular files are read at once, streams are read lazily, so the
+    operations can be processed while they are being logged. Logs
+    compressed with gzip, xz or zstd are decompressed while being read.
+
+    :param log_file: The name of the log file, "-" for the standard input.
+    :type log_file: str
+    :return: The list of operations of a regular file or the iterator
+        over the operations of a stream.
+    """
+    if not is_stream(log_file):
+        with open_text(open(log_file, "rb")) as log:
+            return log.read().split("|")
+    if log_file == "-":
+        return read_operations(open_text(sys.stdin.buffer))
+    return read_operations(open_text(open(log_file, "rb")))
+
+
+class PmemcheckRun:
+    """
+    Runs the application under pmemcheck, which logs the stores to a named
+    pipe read by pmreorder.
+
+    The application must not modify the files the stores are replayed on,
+    see the --file-alias option of pmreorder.
+
+    :ivar _command: The application and its arguments.
+    :type _command: list of str
+    :ivar _log_copy: The name of the file to which the log is copied,
+        None if the log is not saved.
+    :type _log_copy: str
+    :ivar _compression: The compression method of the copy of the log.
+    :type _compression: str
+    :ivar valgrind: The valgrind executable.
+    :type valgrind: str
+    :ivar returncode: The exit code of valgrind, None until it finishes.
+    :type returncode: int
+    """
+    def __init__(self, command, log_copy=None, valgrind=None,
+                 compression=None):
+        """
+        Initializes the run.
+
+        :param command: The application and its arguments.
+        :type command: str
+        :param log_copy: The name of the file to which the log is copied.
+        :type log_copy: str
+        :param valgrind: The valgrind executable, by default taken from
+            the VALGRIND environment variable or searched in the PATH.
+        :type valgrind: str
+        :param compression: The compression method of the copy of the log,
+            see :func:`create_log`.
+        :type compression: str
+        """
+        self._command = shlex.split(command)
+        self._log_copy = log_copy
+        self._compression = compression
+        self.valgrind = valgrind or os.environ.get("VALGRIND", "valgrind")
+        self._dir = None
+        self._process = None
+        self._watcher = None
+        self.returncode = None
+
+    def operations(self):
+        """
+        Starts the application and yields the logged operations.
+
+        :return: Yields the logged operations.
+        :rtype: iterable of str
+        """
+        self._dir = tempfile.mkdtemp(prefix="pmreorder")
+        fifo = os.path.join(self._dir, "store_log")
+        os.mkfifo(fifo)
+        self._process = subprocess.Popen(
+            [self.valgrind] + PMEMCHECK_OPTIONS +
+            ["--log-file=" + fifo] + self._command)
+        # opening the pipe blocks until valgrind opens it, unblock it
+        # if valgrind exits without ever opening the pipe
+        self._watcher = threading.Thread(target=self._watch, args=(fifo,),
+                                         daemon=True)
+        self._watcher.start()
+        copy = None
+        if self._log_copy:
+            copy = create_log(self._log_copy, self._compression)
+        try:
+            with open(fifo) as log:
+                for operation in read_operations(log, copy=copy):
+                    yield operation
+        finally:
+            if copy is not None:
+                copy.close()
+            self.wait()
+
+    def _watch(self, fifo):
+        self.returncode = self._process.wait()
+        try:
+            os.close(os.open(fifo, os.O_WRONLY | os.O_NONBLOCK))
+        except OSError:
+            # the pipe has no reader any more
+            pass
+
+    def wait(self):
+        """
+        Waits for the application and removes the named pipe.
+
+        :return: The exit code of valgrind.
+        :rtype: int
+        """
+        if self._process is not None:
+            self._watcher.join()
+            self._process = None
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+        return self.returncode
@@ -2,8 +2,18 @@
 # Copyright 2018, Intel Corporation
 
 
+import errno
+import fcntl
 import os
 import mmap
+import tempfile
+
+# the ioctl sharing the extents of a file with another file on the
+# filesystems supporting copy-on-write, e.g. btrfs or xfs
+FICLONE = 0x40049409
+
+# the tmpfs directory holding the in-memory files if memfd is not supported
+SHM_DIR = "/dev/shm"
 
 
 class Rangeable:
@@ -69,6 +79,71 @@ def memory_map(filename, size=0, access=mmap.ACCESS_WRITE, offset=0):
     return m_file
 
 
+def save_image(source, filename, chunk_size=1 << 20):
+    """
+    Save the contents of a memory mapped file to a new file.
+
+    Chunks consisting of zeros only are not written, which keeps
+    the copy of a sparse file sparse.
+
+    :param source: The mapped file to be saved.
+    :type source: mmap.mmap
+    :param filename: The file to which the image is saved.
+    :type filename: str
+    :param chunk_size: The size of a single copied chunk.
+    :type chunk_size: int
+    :return: None
+    """
+    zeros = bytes(chunk_size)
+    size = len(source)
+    with open(filename, "wb") as image:
+        for offset in range(0, size, chunk_size):
+            chunk = source[offset:offset + chunk_size]
+            if chunk == zeros[:len(chunk)]:
+                image.seek(len(chunk), os.SEEK_CUR)
+            else:
+                image.write(chunk)
+        image.truncate(size)
+
+
+def reflink(source, dest):
+    """
+    Makes a copy-on-write clone of a file, if the filesystem supports it.
+
+    :param source: The file to be cloned.
+    :type source: str
+    :param dest: The name of the clone.
+    :type dest: str
+    :return: True if the clone was made, False otherwise.
+    :rtype: bool
+    """
+    with open(source, "rb") as src, open(dest, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            return False
+
+
+def load_image(filename, dest, chunk_size=1 << 20):
+    """
+    Load the contents of a saved image into a memory mapped file.
+
+    :param filename: The file holding the image.
+    :type filename: str
+    :param dest: The mapped file to be overwritten.
+    :type dest: mmap.mmap
+    :param chunk_size: The size of a single copied chunk.
+    :type chunk_size: int
+    :return: None
+    """
+    with open(filename, "rb") as image:
+        for offset in range(0, len(dest), chunk_size):
+            chunk = image.read(chunk_size)
+            dest[offset:offset + len(chunk)] = chunk
+    dest.flush()
+
+
 def range_cmp(lhs, rhs):
     """
     A range compare function.
@@ -100,3 +175,84 @@ def range_cmp(lhs, rhs):
         return 1
     else:
         return 0
+
+
+def memory_dir():
+    """
+    Returns the directory of the files kept in memory, a tmpfs one if
+    available.
+
+    :return: The name of the directory.
+    :rtype: str
+    """
+    return SHM_DIR if os.path.isdir(SHM_DIR) else tempfile.gettempdir()
+
+
+def memory_file(name):
+    """
+    Creates an anonymous file in memory, a memfd or, where it is not
+    supported, an unlinked file on tmpfs.
+
+    :param name: The name of the file, for debugging purposes.
+    :type name: str
+    :return: The descriptor of the file and the path under which other
+        processes, e.g. the consistency checker, can open it.
+    :rtype: tuple
+    """
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create(name)
+    else:
+        fd, path = tempfile.mkstemp(prefix=name, dir=memory_dir())
+        os.unlink(path)
+    return fd, "/proc/{}/fd/{}".format(os.getpid(), fd)
+
+
+def _data_regions(fd, size):
+    """
+    Yields the offsets and sizes of the regions of the file which are not
+    holes, the whole file if the filesystem cannot tell.
+    """
+    offset = 0
+    while offset < size:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # only a hole up to the end of the file
+                return
+            if e.errno != errno.EINVAL or offset > 0:
+                raise
+            yield 0, size
+            return
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), size)
+        yield data, hole - data
+        offset = hole
+
+
+def copy_sparse(source, fd, chunk_size=1 << 20):
+    """
+    Copies the contents of the file to another one, the holes of the file
+    are not copied.
+
+    :param source: The name of the copied file.
+    :type source: str
+    :param fd: The descriptor of the empty destination file.
+    :type fd: int
+    :param chunk_size: The size of a single copied chunk.
+    :type chunk_size: int
+    :return: None
+    """
+    src = os.open(source, os.O_RDONLY)
+    try:
+        size = os.fstat(src).st_size
+        os.ftruncate(fd, size)
+        for offset, length in _data_regions(src, size):
+            end = offset + length
+            while offset < end:
+                chunk = os.pread(src, min(chunk_size, end - offset), offset)
+                if not chunk:
+                    break
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+    finally:
+        os.close(src)